@@ -3,6 +3,11 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El dashboard, los reportes y los endpoints JSON son vistas asíncronas
+(movilnet/asincrono.py); bajo ASGI no ocupan un hilo mientras esperan a la BD:
+
+    uvicorn core.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'movilnet.bitacora.BitacoraMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -79,8 +80,50 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            'timeout': 10,  # busy_timeout: segundos que se espera un bloqueo antes de "database is locked"
+        },
+    },
+    # Réplica de solo lectura para reportes (ver movilnet/replica.py): copia de db.sqlite3 que se
+    # refresca sola, o la réplica del servidor si la base principal no es SQLite
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'OPTIONS': {
+            'timeout': 10,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['movilnet.replica.RouterReplica']
+REPLICA_ALIAS = 'replica'
+REPLICA_INTERVALO_SEGUNDOS = 300  # cada cuánto se copia la base principal (0 = solo con actualizar_replica)
+REPLICA_ATRASO_MAXIMO_SEGUNDOS = 900  # con una copia más vieja los reportes leen de la base principal
+
+# Respaldos en caliente (ver movilnet/respaldo.py y los comandos respaldar_bd / restaurar_bd)
+RESPALDO_DIR = BASE_DIR / 'respaldos'
+RESPALDO_PAGINAS_POR_PASO = 1024  # páginas copiadas entre pausas (4 MiB con páginas de 4 KiB)
+RESPALDO_PAUSA_SEGUNDOS = 0.01  # pausa entre pasos para que avancen los escritores
+RESPALDO_MAX_REINICIOS = 5  # reinicios por escrituras concurrentes antes de terminar en un solo paso
+
+# Perfil de producción de SQLite (ver movilnet/pragmas.py): PRAGMA aplicados a cada conexión nueva.
+# SQLITE_PRAGMAS = {} deja los valores por defecto (journal DELETE, caché de 2 MiB, sin mmap).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negativo: KiB (64 MiB)
+    'temp_store': 'MEMORY',
 }
+SQLITE_INTERVALO_ANALYZE = 6 * 3600  # segundos entre ANALYZE de cada proceso (0 = solo con optimizar_bd)
+SQLITE_LIMITE_ANALYZE = 1000  # filas que examina ANALYZE por índice (analysis_limit)
+
+# Consultas en paralelo de las vistas asíncronas (ver movilnet/asincrono.py)
+CONSULTAS_PARALELAS_HILOS = 8
+CONSULTAS_PARALELAS_EDAD_CONEXION = 60  # segundos que un hilo del pool reutiliza su conexión
 
 
 # Password validation
@@ -123,3 +166,33 @@ STATIC_URL = 'static/'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
+
+# Bitácora de auditoría (escritura diferida en lotes, ver movilnet/bitacora.py)
+BITACORA_ASINCRONA = True
+BITACORA_TAMANO_COLA = 10000
+BITACORA_TAMANO_LOTE = 500
+BITACORA_INTERVALO_FLUSH = 2.0  # segundos
+BITACORA_ARCHIVO_DIR = BASE_DIR / 'archivo_bitacora'  # meses archivados (JSONL.gz)
+
+# Costeo del inventario (ver movilnet/costeo.py): 'promedio' o 'fifo'
+COSTEO_METODO = 'promedio'
+
+# Tasas de cambio (ver movilnet/moneda.py): segundos que cada proceso reutiliza la tabla en memoria
+TASA_CAMBIO_CACHE_SEGUNDOS = 300
+
+# Envíos de formularios de creación (ver movilnet/idempotencia.py): segundos que se recuerda cada clave
+IDEMPOTENCIA_VIGENCIA_SEGUNDOS = 3600
+
+# Reservas de stock de notas en preparación (ver movilnet/reservas.py)
+RESERVAS_VIGENCIA_SEGUNDOS = 900
+RESERVAS_INTERVALO_BARRIDO = 60  # segundos entre barridos de reservas vencidas
+
+# Escrituras de stock en SQLite (ver movilnet/escritura.py): reintentos ante "database is locked"
+ESCRITURA_PLAZO_SEGUNDOS = 15.0
+ESCRITURA_ESPERA_INICIAL = 0.05  # segundos; se duplica en cada reintento (con jitter)
+ESCRITURA_ESPERA_MAXIMA = 2.0
+
+# Escritor único de stock (ver movilnet/coordinador.py): encola los comandos de stock y los confirma en grupo
+ESCRITURA_COORDINADA = False
+ESCRITURA_TAMANO_GRUPO = 32
+ESCRITURA_ESPERA_GRUPO = 0.002  # segundos que se esperan más comandos antes de confirmar
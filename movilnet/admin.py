@@ -1,10 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.template.response import TemplateResponse
 from .models import (
     Marca, Proveedor, Cliente, Producto,
     PerfilEmpleado, Bitacora, TipoInventario, MovimientoInventario,
     OrdenCompra, DetalleOrdenCompra,
-    NotaEntrega, DetalleNotaEntrega
+    NotaEntrega, DetalleNotaEntrega,
+    ConteoInventario, PronosticoDemanda, AjusteUmbral, RiesgoQuiebre, CapaCosto,
+    HistorialPrecio, TasaCambio, SecuenciaDocumento, EnvioProcesado, ReservaStock,
 )
+from .forms import AjusteUmbralesForm
 
 @admin.register(Marca)
 class MarcaAdmin(admin.ModelAdmin):
@@ -32,16 +36,54 @@ class ClienteAdmin(admin.ModelAdmin):
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'marca', 'precio', 'stock_actual', 'estado', 'necesita_reposicion', 'fecha_registro')
-    list_filter = ('estado', 'marca', 'fecha_registro')
+    list_display = ('nombre', 'marca', 'precio', 'stock_actual', 'clase_abc_ventas', 'clase_abc_inventario',
+                    'estado', 'necesita_reposicion', 'fecha_registro')
+    list_filter = ('estado', 'clase_abc_ventas', 'clase_abc_inventario', 'marca', 'fecha_registro')
     search_fields = ('nombre', 'marca__nombre_marca')
     ordering = ('nombre',)
+    readonly_fields = ('costo_promedio', 'valor_fifo')
+    actions = ['ajustar_umbrales']
     
     def necesita_reposicion(self, obj):
         return obj.necesita_reposicion
     necesita_reposicion.boolean = True
     necesita_reposicion.short_description = 'Necesita Reposición'
 
+    @admin.action(description='Ajustar stock mínimo/máximo según la demanda')
+    def ajustar_umbrales(self, request, queryset):
+        """Vista previa del ajuste y, al confirmar, aplicación en bloque"""
+        from .umbrales import calcular_umbrales, vista_previa, aplicar_umbrales
+
+        form = AjusteUmbralesForm(request.POST if 'calcular' in request.POST or 'aplicar' in request.POST else None)
+        calculo = None
+        if form.is_valid():
+            calculo = calcular_umbrales(
+                queryset, nivel_servicio=float(form.cleaned_data['nivel_servicio']),
+                dias_entrega=form.cleaned_data['dias_entrega'], dias_revision=form.cleaned_data['dias_revision'],
+                incluir_sin_demanda=form.cleaned_data['incluir_sin_demanda'],
+            )
+            if 'aplicar' in request.POST:
+                try:
+                    empleado = request.user.perfil
+                except PerfilEmpleado.DoesNotExist:
+                    empleado = None
+                aplicados = aplicar_umbrales(calculo, empleado=empleado)
+                self.message_user(request, f'{aplicados} productos actualizados. Los valores anteriores quedaron en Ajustes de Umbral.', messages.SUCCESS)
+                return None
+
+        return TemplateResponse(request, 'admin/movilnet/producto/ajustar_umbrales.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Ajustar stock mínimo y máximo',
+            'opts': self.model._meta,
+            'form': form,
+            'seleccionados': request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'total': queryset.count(),
+            'cambios': int(calculo['cambia'].sum()) if calculo else None,
+            'filas': vista_previa(calculo) if calculo else [],
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+        })
+
 
 @admin.register(PerfilEmpleado)
 class PerfilEmpleadoAdmin(admin.ModelAdmin):
@@ -56,6 +98,9 @@ class BitacoraAdmin(admin.ModelAdmin):
     list_filter = ('tabla_afectada', 'accion_realizada', 'fecha_hora')
     search_fields = ('tabla_afectada', 'descripcion')
     readonly_fields = ('fecha_hora',)
+    list_select_related = ('empleado__user',)
+    # Con millones de filas el COUNT(*) total es lo más lento del listado
+    show_full_result_count = False
 
 
 @admin.register(TipoInventario)
@@ -95,3 +140,90 @@ class NotaEntregaAdmin(admin.ModelAdmin):
     list_filter = ('fecha_registro',)
     search_fields = ('numero_entrega', 'cliente__nombre')
     inlines = [DetalleNotaEntregaInline]
+
+
+@admin.register(ConteoInventario)
+class ConteoInventarioAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'descripcion', 'marca', 'estado', 'empleado', 'fecha_apertura', 'fecha_cierre')
+    list_filter = ('estado', 'fecha_apertura')
+    search_fields = ('descripcion',)
+    # Sin inline de detalles: un conteo completo puede tener decenas de miles de líneas
+    readonly_fields = ('fecha_apertura', 'fecha_cierre', 'aprobado_por')
+
+
+@admin.register(PronosticoDemanda)
+class PronosticoDemandaAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'metodo', 'demanda_diaria', 'demanda_horizonte', 'desviacion_diaria', 'fecha_calculo')
+    list_filter = ('metodo',)
+    search_fields = ('producto__nombre',)
+    list_select_related = ('producto__marca',)
+    raw_id_fields = ('producto',)
+
+
+@admin.register(RiesgoQuiebre)
+class RiesgoQuiebreAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'probabilidad', 'dias_quiebre', 'faltante_esperado', 'horizonte_dias', 'fecha_calculo')
+    search_fields = ('producto__nombre',)
+    list_select_related = ('producto__marca',)
+    ordering = ('-probabilidad',)
+    raw_id_fields = ('producto',)
+
+
+@admin.register(CapaCosto)
+class CapaCostoAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'fecha', 'cantidad_inicial', 'cantidad_restante', 'costo_unitario')
+    search_fields = ('producto__nombre',)
+    list_select_related = ('producto',)
+    date_hierarchy = 'fecha'
+    raw_id_fields = ('producto', 'detalle_compra')
+
+
+@admin.register(HistorialPrecio)
+class HistorialPrecioAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'precio_anterior', 'precio', 'vigente_desde', 'empleado', 'motivo')
+    search_fields = ('producto__nombre', 'motivo')
+    list_select_related = ('producto', 'empleado__user')
+    date_hierarchy = 'vigente_desde'
+    raw_id_fields = ('producto', 'empleado')
+
+
+@admin.register(TasaCambio)
+class TasaCambioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'tasa', 'fuente', 'empleado', 'fecha_registro')
+    date_hierarchy = 'fecha'
+    ordering = ('-fecha',)
+    raw_id_fields = ('empleado',)
+
+
+@admin.register(SecuenciaDocumento)
+class SecuenciaDocumentoAdmin(admin.ModelAdmin):
+    list_display = ('serie', 'anio', 'ultimo')
+    list_filter = ('serie',)
+    ordering = ('serie', '-anio')
+
+
+@admin.register(EnvioProcesado)
+class EnvioProcesadoAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'usuario', 'modelo', 'descripcion', 'clave')
+    list_filter = ('modelo',)
+    search_fields = ('clave', 'descripcion')
+    date_hierarchy = 'fecha'
+    list_select_related = ('usuario',)
+
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'cantidad', 'usuario', 'vence', 'fecha')
+    search_fields = ('producto__nombre',)
+    list_select_related = ('producto', 'usuario')
+    raw_id_fields = ('producto',)
+
+
+@admin.register(AjusteUmbral)
+class AjusteUmbralAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'stock_minimo_anterior', 'stock_minimo_nuevo',
+                    'stock_maximo_anterior', 'stock_maximo_nuevo', 'nivel_servicio', 'empleado', 'fecha')
+    list_filter = ('fecha',)
+    search_fields = ('producto__nombre',)
+    list_select_related = ('producto__marca', 'empleado__user')
+    raw_id_fields = ('producto',)
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class MovilnetConfig(AppConfig):
     name = 'movilnet'
+
+    def ready(self):
+        from .bitacora import conectar_senales
+        from .moneda import conectar_senales as conectar_senales_moneda
+        from .pragmas import conectar_senales as conectar_senales_pragmas
+        from .precios import conectar_senales as conectar_senales_precios
+        conectar_senales()
+        conectar_senales_precios()
+        conectar_senales_moneda()
+        conectar_senales_pragmas()
@@ -0,0 +1,91 @@
+"""
+Consultas independientes en paralelo para las vistas asíncronas.
+
+El ORM asíncrono de Django (``acount``, ``aaggregate``...) ejecuta cada
+consulta con ``sync_to_async(thread_sensitive=True)``: todas pasan por el
+mismo hilo, una detrás de otra, y la página tarda la suma de sus consultas.
+``en_paralelo`` ejecuta cada consulta en un hilo de un pool propio del
+proceso con su propia conexión, así la página tarda lo que la más lenta.
+Con SQLite en WAL (pragmas.py) los lectores no se bloquean entre sí ni con
+el escritor, y el módulo sqlite3 suelta el GIL mientras SQLite trabaja.
+
+Los hilos del pool (``settings.CONSULTAS_PARALELAS_HILOS``) viven mientras
+el proceso, bajo WSGI y bajo ASGI, y cada uno conserva su conexión entre
+consultas y peticiones: los PRAGMA de ``connection_created`` se aplican una
+vez por conexión y no en cada consulta. Antes de cada consulta se cierra la
+conexión del hilo si tiene más de ``settings.CONSULTAS_PARALELAS_EDAD_CONEXION``
+segundos o quedó inutilizable tras un error. La edad acota también cuánto
+sigue un hilo leyendo una copia de la réplica ya reemplazada.
+
+Cada consulta ve su propia instantánea de la base: sirve para los totales y
+listados de un reporte o del dashboard, no para datos que deban cuadrar
+dentro de una misma transacción. Las consultas heredan el contexto de la
+petición (p. ej. la réplica de ``replica.lee_de_replica``).
+
+Las plantillas pueden hacer consultas perezosas, así que se renderizan en el
+hilo de la petición con ``renderizar``.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.shortcuts import render
+
+_hilo = threading.local()
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def _renovar_conexiones():
+    """En un hilo del pool: cierra las conexiones vencidas o inutilizables y deja abiertas las demás"""
+    ahora = time.monotonic()
+    vencen = _hilo.__dict__.setdefault('vencen', {})
+    for conexion in connections.all(initialized_only=True):
+        if conexion.connection is None:
+            continue
+        abierta, vence = vencen.get(conexion.alias, (None, 0))
+        if abierta is not conexion.connection:
+            vencen[conexion.alias] = (conexion.connection, ahora + _config('CONSULTAS_PARALELAS_EDAD_CONEXION', 60))
+        elif ahora >= vence or (conexion.errors_occurred and not conexion.is_usable()):
+            conexion.close()
+
+
+def _en_hilo_del_pool(funcion):
+    def ejecutar():
+        _renovar_conexiones()
+        return funcion()
+    return ejecutar
+
+
+_ejecutor = None
+_ejecutor_candado = threading.Lock()
+
+
+def obtener_ejecutor():
+    global _ejecutor
+    if _ejecutor is None:
+        with _ejecutor_candado:
+            if _ejecutor is None:
+                _ejecutor = ThreadPoolExecutor(
+                    max_workers=_config('CONSULTAS_PARALELAS_HILOS', 8), thread_name_prefix='consultas',
+                )
+    return _ejecutor
+
+
+async def en_paralelo(**consultas):
+    """Ejecuta a la vez funciones sin argumentos que consultan la BD y devuelve ``{nombre: resultado}``"""
+    ejecutor = obtener_ejecutor()
+    resultados = await asyncio.gather(*(
+        sync_to_async(_en_hilo_del_pool(funcion), thread_sensitive=False, executor=ejecutor)()
+        for funcion in consultas.values()
+    ))
+    return dict(zip(consultas, resultados))
+
+
+renderizar = sync_to_async(render)
@@ -0,0 +1,83 @@
+"""
+Utilidades de acceso a la base de datos compartidas por los procesos masivos.
+"""
+from django.db import connections, router
+
+
+def actualizar_en_bloque(modelo, objetos, campos, using=None):
+    """
+    Equivalente a ``bulk_update`` para lotes grandes.
+
+    ``bulk_update`` arma una expresión CASE por campo y fila, cuyo costo en
+    Python crece mucho con miles de filas. Aquí se envía una sola sentencia
+    UPDATE parametrizada con ``executemany``. No dispara señales (igual que
+    ``bulk_update``). Devuelve el número de objetos enviados.
+    """
+    if not objetos:
+        return 0
+    using = using or router.db_for_write(modelo)
+    connection = connections[using]
+    opts = modelo._meta
+    columnas = [opts.get_field(c) for c in campos]
+    qn = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s WHERE %s = %%s' % (
+        qn(opts.db_table),
+        ', '.join('%s = %%s' % qn(c.column) for c in columnas),
+        qn(opts.pk.column),
+    )
+    parametros = [
+        [c.get_db_prep_save(getattr(obj, c.attname), connection) for c in columnas] + [obj.pk]
+        for obj in objetos
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, parametros)
+    return len(parametros)
+
+
+def insertar_en_bloque(modelo, filas, campos, using=None, conflicto=(), actualizar=()):
+    """
+    Inserta filas (tuplas de valores en el orden de ``campos``) sin instanciar modelos.
+
+    ``bulk_create`` construye una instancia por fila y, en SQLite, parte el
+    lote en sentencias de pocas filas por el límite de parámetros. Para cargas
+    de decenas de miles de filas se usa un INSERT parametrizado con
+    ``executemany``. No dispara señales ni aplica ``auto_now_add``: los
+    valores por defecto deben venir en las filas. Devuelve el número de filas.
+
+    Con ``conflicto`` (campos de una restricción única) y ``actualizar`` la
+    inserción es un upsert: las filas que ya existen actualizan esos campos.
+    """
+    if not filas:
+        return 0
+    using = using or router.db_for_write(modelo)
+    connection = connections[using]
+    opts = modelo._meta
+    columnas = [opts.get_field(c) for c in campos]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(opts.db_table),
+        ', '.join(qn(c.column) for c in columnas),
+        ', '.join(['%s'] * len(columnas)),
+    )
+    if conflicto:
+        sql += ' ON CONFLICT (%s) DO UPDATE SET %s' % (
+            ', '.join(qn(opts.get_field(c).column) for c in conflicto),
+            ', '.join('{0} = excluded.{0}'.format(qn(opts.get_field(c).column)) for c in actualizar),
+        )
+    # Los valores que requieren conversión (fechas, decimales) se preparan una vez por valor distinto
+    preparados = [{} for _ in columnas]
+
+    def preparar(i, valor):
+        cache = preparados[i]
+        try:
+            return cache[valor]
+        except KeyError:
+            cache[valor] = resultado = columnas[i].get_db_prep_save(valor, connection)
+            return resultado
+        except TypeError:
+            return columnas[i].get_db_prep_save(valor, connection)
+
+    parametros = [[preparar(i, v) for i, v in enumerate(fila)] for fila in filas]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, parametros)
+    return len(parametros)
@@ -0,0 +1,432 @@
+"""
+Bitácora de auditoría con escritura diferida.
+
+Cada operación CRUD genera un evento que se encola en memoria; un hilo en
+segundo plano los agrupa y los inserta con ``bulk_create``. Así la auditoría
+no añade una escritura a la transacción de la vista que la origina.
+
+Uso directo:
+    registrar_en_bitacora(empleado, 'Producto', 'ACTUALIZAR', producto.pk, 'Ajuste de precio')
+
+Las altas, cambios y bajas de los modelos en ``MODELOS_AUDITADOS`` se
+registran solas mediante señales (ver ``conectar_senales``).
+
+Si un lote no se puede insertar (p. ej. la BD sigue bloqueada después de
+los reintentos de ``escritura.ejecutar_con_reintentos``), se guarda en
+``BITACORA_ARCHIVO_DIR/pendientes/`` y el hilo escritor lo vuelve a
+insertar cuando la BD lo permite: ningún evento se descarta.
+
+Los meses antiguos se mueven a archivos ``bitacora-AAAA-MM.jsonl.gz``
+(comando ``archivar_bitacora``) que el explorador de bitácora sigue pudiendo
+consultar con ``buscar_en_archivo``.
+"""
+import atexit
+import contextvars
+import gzip
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, date, time as dtime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from .escritura import ejecutar_con_reintentos
+
+logger = logging.getLogger(__name__)
+
+ACCION_CREAR = 'CREAR'
+ACCION_ACTUALIZAR = 'ACTUALIZAR'
+ACCION_ELIMINAR = 'ELIMINAR'
+ACCION_IMPORTAR = 'IMPORTAR'
+
+# Modelos cuyo CRUD se audita automáticamente (los detalles se auditan vía su documento)
+MODELOS_AUDITADOS = (
+    'Marca', 'Proveedor', 'Cliente', 'Producto', 'PerfilEmpleado',
+    'TipoInventario', 'MovimientoInventario', 'OrdenCompra', 'NotaEntrega',
+    'ConteoInventario',
+)
+
+# Campos de los que se toma una descripción corta sin consultar la BD
+_CAMPOS_DESCRIPCION = ('numero_orden', 'numero_entrega', 'nombre_marca', 'nombre', 'tipo_movimiento', 'descripcion')
+
+_peticion_actual = contextvars.ContextVar('bitacora_peticion_actual', default=None)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+class EscritorBitacora:
+    """Cola acotada de eventos de bitácora servida por un único hilo escritor"""
+
+    def __init__(self, tamano_cola=10000, tamano_lote=500, intervalo=2.0, espera_maxima=0.05):
+        self.cola = queue.Queue(maxsize=tamano_cola)
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.espera_maxima = espera_maxima
+        self._hilo = None
+        self._detener = threading.Event()
+        self._candado = threading.Lock()
+        # Al arrancar se revisan los lotes que otro proceso (o este) no pudo insertar
+        self._hay_pendientes = True
+
+    def iniciar(self):
+        with self._candado:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='bitacora-escritor', daemon=True)
+            self._hilo.start()
+
+    def encolar(self, evento):
+        """Encola un evento. Si la cola está llena, el llamador escribe un lote (contrapresión)."""
+        self.iniciar()
+        try:
+            self.cola.put(evento, timeout=self.espera_maxima)
+        except queue.Full:
+            # El escritor no da abasto: el hilo de la petición vacía un lote él mismo
+            # en lugar de descartar eventos o crecer sin límite.
+            self._escribir(self._tomar_lote(primero=evento))
+
+    def vaciar(self):
+        """Escribe de inmediato todos los eventos pendientes en el hilo actual"""
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                return
+            self._escribir(lote)
+
+    def detener(self, timeout=10.0):
+        """Detiene el hilo escritor y vacía la cola (se llama al cerrar el proceso)"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        self.vaciar()
+
+    def _tomar_lote(self, primero=None):
+        lote = [primero] if primero is not None else []
+        while len(lote) < self.tamano_lote:
+            try:
+                lote.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                primero = self.cola.get(timeout=self.intervalo)
+            except queue.Empty:
+                primero = None
+            if primero is not None:
+                self._escribir(self._tomar_lote(primero=primero))
+            if self._hay_pendientes:
+                self.reinsertar_pendientes()
+            close_old_connections()
+
+    def _insertar(self, lote):
+        from .models import Bitacora
+        Bitacora.objects.bulk_create(
+            [Bitacora(**evento) for evento in lote],
+            batch_size=self.tamano_lote,
+        )
+
+    def _escribir(self, lote):
+        if not lote:
+            return
+        try:
+            ejecutar_con_reintentos(self._insertar, lote, operacion='bitacora')
+        except Exception:
+            logger.exception('No se pudieron escribir %d eventos de bitácora; se guardan para reintentar', len(lote))
+            self._guardar_pendiente(lote)
+
+    def _guardar_pendiente(self, lote):
+        carpeta = directorio_pendientes()
+        ruta = carpeta / f'pendiente-{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl'
+        try:
+            carpeta.mkdir(parents=True, exist_ok=True)
+            temporal = ruta.with_name(ruta.name + '.tmp')
+            with open(temporal, 'w', encoding='utf-8') as salida:
+                for evento in lote:
+                    salida.write(json.dumps(dict(evento, fecha_hora=evento['fecha_hora'].isoformat()), ensure_ascii=False) + '\n')
+            os.replace(temporal, ruta)
+        except OSError:
+            # Último recurso: los eventos quedan completos en el log
+            logger.exception('No se pudo guardar el lote pendiente de bitácora: %s', json.dumps(lote, default=str))
+            return
+        self._hay_pendientes = True
+
+    def reinsertar_pendientes(self):
+        """Inserta los lotes guardados en ``pendientes/`` y borra cada archivo al confirmarse. Devuelve cuántos eventos"""
+        self._hay_pendientes = False
+        total = 0
+        for ruta in sorted(directorio_pendientes().glob('pendiente-*.jsonl')):
+            # Se reclama renombrándolo para que dos procesos no inserten el mismo lote
+            reclamado = ruta.with_name(f'{ruta.name}.{os.getpid()}')
+            try:
+                os.rename(ruta, reclamado)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(reclamado, encoding='utf-8') as entrada:
+                    lote = [json.loads(linea) for linea in entrada if linea.strip()]
+                for evento in lote:
+                    evento['fecha_hora'] = datetime.fromisoformat(evento['fecha_hora'])
+                ejecutar_con_reintentos(self._insertar, lote, operacion='bitacora')
+            except Exception:
+                logger.exception('No se pudo reinsertar el lote pendiente de bitácora %s', ruta.name)
+                os.rename(reclamado, ruta)
+                self._hay_pendientes = True
+                return total
+            reclamado.unlink()
+            total += len(lote)
+        return total
+
+
+_escritor = None
+_escritor_candado = threading.Lock()
+
+
+def obtener_escritor():
+    global _escritor
+    if _escritor is None:
+        with _escritor_candado:
+            if _escritor is None:
+                _escritor = EscritorBitacora(
+                    tamano_cola=_config('BITACORA_TAMANO_COLA', 10000),
+                    tamano_lote=_config('BITACORA_TAMANO_LOTE', 500),
+                    intervalo=_config('BITACORA_INTERVALO_FLUSH', 2.0),
+                )
+                atexit.register(_escritor.detener)
+    return _escritor
+
+
+def _empleado_id(empleado):
+    if empleado is None:
+        return None
+    if isinstance(empleado, int):
+        return empleado
+    # Se acepta PerfilEmpleado o User
+    if hasattr(empleado, 'rol'):
+        return empleado.pk
+    if not getattr(empleado, 'is_authenticated', False):
+        return None
+    try:
+        return empleado.perfil.pk
+    except Exception:
+        return None
+
+
+def _usuario_actual():
+    # Se guarda la petición y no request.user: el usuario es perezoso y asgiref compara las
+    # variables de contexto al volver de una vista asíncrona, lo que lo cargaría fuera de un hilo
+    return getattr(_peticion_actual.get(), 'user', None)
+
+
+def empleado_actual_id():
+    """Id del empleado de la petición en curso (None fuera de una petición o sin perfil)"""
+    return _empleado_id(_usuario_actual())
+
+
+def registrar_en_bitacora(empleado, tabla, accion, id_registro, descripcion=None):
+    """
+    Registra una acción en la bitácora.
+
+    El evento se encola al confirmarse la transacción en curso (si se revierte,
+    no se audita). Con ``BITACORA_ASINCRONA = False`` se escribe en línea.
+    """
+    evento = {
+        'empleado_id': _empleado_id(empleado if empleado is not None else _usuario_actual()),
+        'tabla_afectada': tabla,
+        'accion_realizada': accion,
+        'cod_registro_afectado': id_registro or 0,
+        'fecha_hora': timezone.now(),
+        'descripcion': descripcion,
+    }
+    if _config('BITACORA_ASINCRONA', True):
+        transaction.on_commit(lambda: obtener_escritor().encolar(evento))
+    else:
+        transaction.on_commit(lambda: obtener_escritor()._escribir([evento]))
+
+
+def _descripcion(instance):
+    for campo in _CAMPOS_DESCRIPCION:
+        valor = getattr(instance, campo, None)
+        if valor:
+            return str(valor)[:200]
+    return None
+
+
+def _al_guardar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    registrar_en_bitacora(
+        None, sender._meta.object_name,
+        ACCION_CREAR if created else ACCION_ACTUALIZAR,
+        instance.pk, _descripcion(instance),
+    )
+
+
+def _al_eliminar(sender, instance, **kwargs):
+    registrar_en_bitacora(
+        None, sender._meta.object_name, ACCION_ELIMINAR,
+        instance.pk, _descripcion(instance),
+    )
+
+
+def conectar_senales():
+    from django.apps import apps
+    for nombre in MODELOS_AUDITADOS:
+        modelo = apps.get_model('movilnet', nombre)
+        post_save.connect(_al_guardar, sender=modelo, dispatch_uid=f'bitacora_save_{nombre}')
+        post_delete.connect(_al_eliminar, sender=modelo, dispatch_uid=f'bitacora_delete_{nombre}')
+
+
+class BitacoraMiddleware:
+    """Guarda el usuario de la petición para que las señales sepan quién actuó (WSGI y ASGI)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _peticion_actual.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _peticion_actual.reset(token)
+
+    async def __acall__(self, request):
+        token = _peticion_actual.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _peticion_actual.reset(token)
+
+
+# ==================== ARCHIVO HISTÓRICO ====================
+
+CAMPOS_ARCHIVO = (
+    'id', 'empleado_id', 'empleado__user__username', 'tabla_afectada',
+    'accion_realizada', 'cod_registro_afectado', 'fecha_hora', 'descripcion',
+)
+
+
+def directorio_archivo():
+    return Path(_config('BITACORA_ARCHIVO_DIR', Path(settings.BASE_DIR) / 'archivo_bitacora'))
+
+
+def directorio_pendientes():
+    """Lotes que no se pudieron insertar y esperan reintento (ver ``EscritorBitacora``)"""
+    return directorio_archivo() / 'pendientes'
+
+
+def _limites_mes(anio, mes):
+    inicio = timezone.make_aware(datetime(anio, mes, 1))
+    fin = timezone.make_aware(datetime(anio + (mes == 12), mes % 12 + 1, 1))
+    return inicio, fin
+
+
+def _archivos_del_mes(mes):
+    """Partes de archivo de un mes 'AAAA-MM' (puede haber varias si se archivó en varias pasadas)"""
+    return sorted(directorio_archivo().glob(f'bitacora-{mes}*.jsonl.gz'))
+
+
+def meses_archivados():
+    meses = {p.name[len('bitacora-'):len('bitacora-AAAA-MM')] for p in directorio_archivo().glob('bitacora-*.jsonl.gz')}
+    return sorted(meses, reverse=True)
+
+
+def archivar_mes(anio, mes, lote=5000):
+    """
+    Vuelca los registros de un mes a un JSONL comprimido y los borra de la tabla.
+
+    Solo se borran los registros efectivamente escritos en el archivo (hasta el
+    mayor id volcado), en lotes para no retener el bloqueo de escritura.
+    """
+    from .models import Bitacora
+
+    inicio, fin = _limites_mes(anio, mes)
+    registros = Bitacora.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+    if not registros.exists():
+        return 0
+
+    directorio = directorio_archivo()
+    directorio.mkdir(parents=True, exist_ok=True)
+    clave = f'{anio:04d}-{mes:02d}'
+    parte = len(_archivos_del_mes(clave))
+    destino = directorio / (f'bitacora-{clave}.jsonl.gz' if parte == 0 else f'bitacora-{clave}.{parte + 1}.jsonl.gz')
+    temporal = destino.with_name(destino.name + '.tmp')
+
+    total = 0
+    max_id = 0
+    with gzip.open(temporal, 'wt', encoding='utf-8') as salida:
+        for fila in registros.order_by('fecha_hora', 'id').values(*CAMPOS_ARCHIVO).iterator(chunk_size=lote):
+            fila['fecha_hora'] = fila['fecha_hora'].isoformat()
+            salida.write(json.dumps(fila, ensure_ascii=False) + '\n')
+            max_id = max(max_id, fila['id'])
+            total += 1
+    os.replace(temporal, destino)
+
+    archivados = registros.filter(id__lte=max_id)
+    while True:
+        ids = list(archivados.values_list('id', flat=True)[:lote])
+        if not ids:
+            break
+        Bitacora.objects.filter(id__in=ids).delete()
+    return total
+
+
+def _leer_archivo(ruta):
+    with gzip.open(ruta, 'rt', encoding='utf-8') as entrada:
+        for linea in entrada:
+            fila = json.loads(linea)
+            fila['fecha_hora'] = datetime.fromisoformat(fila['fecha_hora'])
+            yield fila
+
+
+def buscar_en_archivo(mes, empleado_id=None, tabla=None, accion=None,
+                      desde=None, hasta=None, despues=None, limite=50):
+    """
+    Busca en los archivos de un mes en orden cronológico.
+
+    ``despues`` es el cursor (fecha_hora, id) del último registro de la página
+    anterior. Devuelve hasta ``limite + 1`` filas para saber si hay más.
+    """
+    partes = [_leer_archivo(ruta) for ruta in _archivos_del_mes(mes)]
+    desde = timezone.make_aware(datetime.combine(desde, dtime.min)) if isinstance(desde, date) else None
+    hasta = timezone.make_aware(datetime.combine(hasta, dtime.max)) if isinstance(hasta, date) else None
+
+    resultado = []
+    for fila in heapq.merge(*partes, key=lambda f: (f['fecha_hora'], f['id'])):
+        if despues and (fila['fecha_hora'], fila['id']) <= despues:
+            continue
+        if hasta and fila['fecha_hora'] > hasta:
+            break
+        if desde and fila['fecha_hora'] < desde:
+            continue
+        if empleado_id and fila['empleado_id'] != empleado_id:
+            continue
+        if tabla and fila['tabla_afectada'] != tabla:
+            continue
+        if accion and fila['accion_realizada'] != accion:
+            continue
+        resultado.append(fila)
+        if len(resultado) > limite:
+            break
+    return resultado
@@ -0,0 +1,103 @@
+"""
+Clasificación ABC (Pareto) de los productos activos.
+
+Se clasifica con dos criterios independientes:
+
+- ventas: valor despachado en notas de entrega (``DetalleNotaEntrega.subtotal``)
+  en los últimos ``dias`` días;
+- inventario: valor inmovilizado en stock (``stock_actual × precio``).
+
+Ambos valores salen de una sola consulta agregada. Con los productos ordenados
+de mayor a menor valor, un producto es A si la participación acumulada de los
+anteriores es menor que ``corte_a`` (80 % por defecto), B si es menor que
+``corte_b`` (95 %) y C en otro caso; los productos sin valor son siempre C.
+La clase se guarda en ``Producto.clase_abc_ventas`` y
+``Producto.clase_abc_inventario`` (indexados) para filtrar y ordenar por ella.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q, Sum, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .bd import actualizar_en_bloque
+from .models import Producto
+
+DIAS_VENTAS = 365
+CORTE_A = 0.80
+CORTE_B = 0.95
+
+
+def clases_abc(valores, corte_a=CORTE_A, corte_b=CORTE_B):
+    """Arreglo de clases ('A', 'B', 'C') para cada valor según su participación acumulada"""
+    valores = np.asarray(valores, dtype=np.float64)
+    orden = np.argsort(-valores, kind='stable')
+    ordenados = valores[orden]
+    acumulado = np.cumsum(ordenados)
+    total = acumulado[-1] if len(acumulado) else 0
+    clases = np.full(len(valores), 'C', dtype='<U1')
+    if total <= 0:
+        return clases
+    previo = (acumulado - ordenados) / total
+    clases[orden] = np.where(ordenados <= 0, 'C', np.where(previo < corte_a, 'A', np.where(previo < corte_b, 'B', 'C')))
+    return clases
+
+
+def valores_por_producto(dias=DIAS_VENTAS):
+    """
+    (ids, clases actuales, valor vendido, valor en stock) de los productos
+    activos, con una sola consulta agregada.
+    """
+    desde = timezone.now() - timedelta(days=dias)
+    filas = list(
+        Producto.objects.filter(estado=True).order_by()
+        .values_list('pk', 'clase_abc_ventas', 'clase_abc_inventario')
+        .annotate(
+            ventas=Coalesce(
+                Sum('detalles_nota_entrega__subtotal',
+                    filter=Q(detalles_nota_entrega__nota_entrega__fecha_registro__gte=desde)),
+                0, output_field=DecimalField(),
+            ),
+            inventario=ExpressionWrapper(F('stock_actual') * F('precio'), output_field=DecimalField()),
+        )
+    )
+    ids = np.array([f[0] for f in filas], dtype=np.int64)
+    actuales = [(f[1], f[2]) for f in filas]
+    ventas = np.array([f[3] for f in filas], dtype=np.float64)
+    inventario = np.array([f[4] for f in filas], dtype=np.float64)
+    return ids, actuales, ventas, inventario
+
+
+def clasificar_abc(dias=DIAS_VENTAS, corte_a=CORTE_A, corte_b=CORTE_B):
+    """
+    Recalcula la clase ABC de todos los productos activos y guarda solo las
+    que cambian. Los inactivos quedan sin clase. Devuelve un resumen con el
+    número de productos por clase de cada criterio y los actualizados.
+    """
+    if not 0 < corte_a < corte_b <= 1:
+        raise ValueError('Los cortes deben cumplir 0 < A < B <= 1.')
+    ids, actuales, ventas, inventario = valores_por_producto(dias)
+    por_ventas = clases_abc(ventas, corte_a, corte_b)
+    por_inventario = clases_abc(inventario, corte_a, corte_b)
+
+    cambios = [
+        Producto(pk=pk, clase_abc_ventas=v, clase_abc_inventario=i)
+        for pk, v, i, actual in zip(ids.tolist(), por_ventas.tolist(), por_inventario.tolist(), actuales)
+        if (v, i) != actual
+    ]
+    with transaction.atomic():
+        actualizar_en_bloque(Producto, cambios, ['clase_abc_ventas', 'clase_abc_inventario'])
+        Producto.objects.filter(estado=False).exclude(clase_abc_ventas='', clase_abc_inventario='').update(
+            clase_abc_ventas='', clase_abc_inventario='',
+        )
+
+    resumen = {'actualizados': len(cambios)}
+    for criterio, clases, valores in (('ventas', por_ventas, ventas), ('inventario', por_inventario, inventario)):
+        total = valores.sum()
+        resumen[criterio] = {
+            clase: (int((clases == clase).sum()), float(valores[clases == clase].sum() / total) if total else 0.0)
+            for clase in 'ABC'
+        }
+    return resumen
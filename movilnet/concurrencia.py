@@ -0,0 +1,104 @@
+"""
+Control de concurrencia optimista para las ediciones de productos y documentos.
+
+``Producto``, ``OrdenCompra`` y ``NotaEntrega`` tienen una columna ``version``.
+El formulario de edición lleva oculta la versión que leyó el usuario y, por
+cada campo, el valor que se le mostró (``show_hidden_initial``). Al guardar:
+
+1. ``reclamar_version`` sube la versión con un UPDATE condicionado a la
+   versión leída. Si otra edición ganó la carrera no actualiza ninguna fila
+   y se lanza ``ConflictoEdicion``.
+2. Los campos que el usuario cambió se comparan con su valor actual en la BD:
+   si alguno cambió por otra vía (una venta que descontó ``stock_actual``,
+   una importación) también es conflicto.
+3. Solo se escriben los campos cambiados (``save(update_fields=...)``), así
+   una edición del nombre no pisa el stock que descontó una venta.
+
+No se mantiene ningún bloqueo mientras el usuario tiene el formulario
+abierto; el UPDATE de la versión es la primera escritura de la transacción
+del guardado.
+"""
+from django import forms
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from django.forms.models import model_to_dict
+from django.shortcuts import redirect
+
+CAMPO_VERSION = 'version_leida'
+
+
+class ConflictoEdicion(Exception):
+    """El registro cambió desde que se abrió el formulario"""
+
+
+class VersionFormMixin:
+    """ModelForm que envía la versión y los valores leídos junto con los datos editados"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for campo in self.fields.values():
+            campo.show_hidden_initial = True
+        self.fields[CAMPO_VERSION] = forms.IntegerField(
+            widget=forms.HiddenInput, required=False, initial=self.instance.version,
+        )
+
+    def campos_cambiados(self):
+        return [nombre for nombre in self.changed_data if nombre != CAMPO_VERSION]
+
+    def valor_leido(self, nombre):
+        """Valor (tal como se envió) que tenía el campo cuando se abrió el formulario"""
+        campo = self.fields[nombre]
+        return campo.hidden_widget().value_from_datadict(self.data, self.files, self[nombre].html_initial_name)
+
+
+def reclamar_version(form):
+    """
+    Sube la versión del registro del formulario si nadie lo modificó desde que
+    se leyó. Debe llamarse dentro de la transacción del guardado y antes de
+    cualquier otra escritura. Devuelve los campos cambiados por el usuario.
+    """
+    instancia = form.instance
+    modelo = type(instancia)
+    leida = form.cleaned_data.get(CAMPO_VERSION)
+    cambiados = form.campos_cambiados()
+    registro = modelo.objects.filter(pk=instancia.pk)
+    if leida is not None:
+        registro = registro.filter(version=leida)
+    if not registro.update(version=F('version') + 1):
+        raise ConflictoEdicion()
+
+    if cambiados:
+        actual = model_to_dict(modelo.objects.get(pk=instancia.pk), fields=cambiados)
+        if any(form.fields[n].has_changed(actual.get(n), form.valor_leido(n)) for n in cambiados):
+            raise ConflictoEdicion()
+    if leida is not None:
+        instancia.version = leida + 1
+    else:
+        instancia.version = modelo.objects.filter(pk=instancia.pk).values_list('version', flat=True).get()
+    return cambiados
+
+
+def guardar_cambios(form):
+    """Reclama la versión y escribe solo los campos cambiados. Devuelve la instancia"""
+    with transaction.atomic():
+        cambiados = reclamar_version(form)
+        if cambiados:
+            form.instance.save(update_fields=cambiados)
+    return form.instance
+
+
+class VersionUpdateMixin:
+    """Para vistas de edición: un ``ConflictoEdicion`` vuelve al formulario con los datos actuales"""
+
+    mensaje_conflicto = (
+        'Otro usuario modificó este registro mientras lo editabas. '
+        'Se cargaron los datos actuales: revisa y vuelve a guardar.'
+    )
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except ConflictoEdicion:
+            messages.error(request, self.mensaje_conflicto)
+            return redirect(request.path)
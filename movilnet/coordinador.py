@@ -0,0 +1,179 @@
+"""
+Escritor único de stock para instalaciones con SQLite (modo opcional).
+
+SQLite admite un solo escritor: con muchas peticiones que mueven stock a la
+vez, cada una abre su transacción, compite por el bloqueo y espera o
+reintenta (ver escritura.py). Con ``settings.ESCRITURA_COORDINADA = True``
+los comandos que mueven stock (movimientos, notas, compras) no se ejecutan
+en el hilo de la petición: se encolan y los atiende un único hilo escritor
+por proceso, que
+
+1. toma el primer comando de la cola y junta los que llegan mientras tanto
+   (hasta ``ESCRITURA_TAMANO_GRUPO``, esperando como mucho
+   ``ESCRITURA_ESPERA_GRUPO`` segundos);
+2. los ejecuta en una sola transacción IMMEDIATE, cada uno en su propio
+   savepoint: si un comando falla (stock insuficiente, conflicto de
+   versión) solo se deshace ese comando;
+3. confirma una vez (un solo fsync para todo el grupo) y entrega a cada
+   petición su resultado o su excepción.
+
+La petición espera su resultado como si hubiera ejecutado el comando ella
+misma. Si el grupo no se puede confirmar (otro proceso tiene el bloqueo más
+allá del ``timeout``), todos sus comandos reciben el error y los reintentos
+de ``escritura.ReintentosMixin`` vuelven a enviar la petición completa.
+
+Los comandos deben ser funciones sin efectos fuera de la BD; corren con una
+copia del contexto de la petición (usuario de la bitácora). Con el modo
+desactivado, o si ya se está dentro de una transacción, ``ejecutar`` llama a
+la función directamente.
+
+``manage.py benchmark_escritura`` compara ambos modos.
+"""
+import atexit
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .escritura import modo_inmediato
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def activo():
+    return _config('ESCRITURA_COORDINADA', False)
+
+
+class Comando:
+    __slots__ = ('funcion', 'args', 'kwargs', 'contexto', 'futuro')
+
+    def __init__(self, funcion, args, kwargs):
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs
+        self.contexto = contextvars.copy_context()
+        self.futuro = Future()
+
+    def ejecutar(self):
+        return self.contexto.run(self.funcion, *self.args, **self.kwargs)
+
+
+class CoordinadorEscritura:
+    """Cola de comandos de escritura servida por un único hilo con confirmación en grupo"""
+
+    def __init__(self, tamano_grupo=32, espera_grupo=0.002):
+        self.cola = queue.Queue()
+        self.tamano_grupo = tamano_grupo
+        self.espera_grupo = espera_grupo
+        self.grupos = 0
+        self.comandos = 0
+        self._hilo = None
+        self._detener = threading.Event()
+        self._candado = threading.Lock()
+
+    def iniciar(self):
+        with self._candado:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='stock-escritor', daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout=10.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def en_hilo_escritor(self):
+        return threading.current_thread() is self._hilo
+
+    def enviar(self, funcion, *args, **kwargs):
+        """Encola un comando y devuelve su ``Future``"""
+        self.iniciar()
+        comando = Comando(funcion, args, kwargs)
+        self.cola.put(comando)
+        return comando.futuro
+
+    def _tomar_grupo(self, primero):
+        grupo = [primero]
+        limite = time.monotonic() + self.espera_grupo
+        while len(grupo) < self.tamano_grupo:
+            restante = limite - time.monotonic()
+            try:
+                grupo.append(self.cola.get(timeout=restante) if restante > 0 else self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return grupo
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                primero = self.cola.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._ejecutar_grupo(self._tomar_grupo(primero))
+            close_old_connections()
+        connection.close()
+
+    def _ejecutar_grupo(self, grupo):
+        resultados = []
+        try:
+            with modo_inmediato(), transaction.atomic():
+                for comando in grupo:
+                    try:
+                        with transaction.atomic():
+                            resultados.append((True, comando.ejecutar()))
+                    except Exception as e:
+                        resultados.append((False, e))
+        except Exception as e:
+            # No se pudo confirmar el grupo: ningún comando quedó escrito
+            logger.warning('No se pudo confirmar un grupo de %d comandos: %s', len(grupo), e)
+            for comando in grupo:
+                comando.futuro.set_exception(e)
+            return
+        self.grupos += 1
+        self.comandos += len(grupo)
+        for comando, (ok, valor) in zip(grupo, resultados):
+            if ok:
+                comando.futuro.set_result(valor)
+            else:
+                comando.futuro.set_exception(valor)
+
+
+_coordinador = None
+_coordinador_candado = threading.Lock()
+
+
+def obtener_coordinador():
+    global _coordinador
+    if _coordinador is None:
+        with _coordinador_candado:
+            if _coordinador is None:
+                _coordinador = CoordinadorEscritura(
+                    tamano_grupo=_config('ESCRITURA_TAMANO_GRUPO', 32),
+                    espera_grupo=_config('ESCRITURA_ESPERA_GRUPO', 0.002),
+                )
+                atexit.register(_coordinador.detener)
+    return _coordinador
+
+
+def ejecutar(funcion, *args, **kwargs):
+    """
+    Ejecuta un comando de stock: en el hilo escritor si el modo coordinado
+    está activo (y espera su resultado), o directamente si no.
+    """
+    if not activo() or connection.in_atomic_block:
+        return funcion(*args, **kwargs)
+    coordinador = obtener_coordinador()
+    if coordinador.en_hilo_escritor():
+        return funcion(*args, **kwargs)
+    return coordinador.enviar(funcion, *args, **kwargs).result()
@@ -0,0 +1,289 @@
+"""
+Costeo del inventario: costo promedio ponderado y capas FIFO.
+
+Los dos métodos se mantienen a la vez, de forma incremental, cada vez que
+cambia el stock; ``settings.COSTEO_METODO`` ('promedio' o 'fifo') decide
+cuál se usa para valorizar el inventario y para el costo de lo vendido.
+
+- Promedio: ``Producto.costo_promedio``. Cada entrada con costo lo recalcula
+  como (stock previo × promedio + cantidad × costo) / stock nuevo. Si no
+  había stock (o su costo era desconocido) el promedio pasa a ser el costo
+  de la entrada. Las salidas no lo cambian.
+- FIFO: cada entrada abre una ``CapaCosto`` con su costo unitario y las
+  salidas consumen las capas más antiguas primero. ``Producto.valor_fifo``
+  lleva el valor de las capas abiertas, así que valorizar el inventario no
+  necesita recorrerlas. Si las capas no alcanzan (stock cargado antes del
+  costeo), el faltante se costea al promedio.
+
+Solo las compras recibidas traen costo. Las demás entradas (movimientos
+manuales, sobrantes de conteo) entran al costo promedio vigente, y las
+devoluciones por anulación de notas, al costo con que salieron.
+
+Si una entrada no trae costo y el promedio es desconocido (0), no se le
+abre capa ni cuenta para el promedio: sus unidades quedan sin costo (como
+el stock cargado antes del costeo) en lugar de valer 0. La primera entrada
+con costo fija el promedio y abre, antes de la suya, una capa a ese costo
+para las unidades en existencia que no tenían capa.
+
+Cada función trabaja sobre un lote de productos: lee el estado con una
+consulta por bloque y escribe con sentencias en bloque. Deben llamarse dentro
+de la transacción que cambia el stock y después de aplicarlo.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, DecimalField, ExpressionWrapper
+from django.utils import timezone
+
+from .bd import actualizar_en_bloque, insertar_en_bloque
+from .importacion import en_lotes
+from .models import Producto, DetalleOrdenCompra, DetalleNotaEntrega, CapaCosto
+
+METODO_PROMEDIO = 'promedio'
+METODO_FIFO = 'fifo'
+
+TAMANO_CONSULTA = 900
+
+CENTAVOS = Decimal('0.01')
+DIEZMILESIMAS = Decimal('0.0001')
+
+CAMPOS_CAPA = ('producto', 'detalle_compra', 'fecha', 'cantidad_inicial', 'cantidad_restante', 'costo_unitario')
+
+
+def metodo():
+    """Método de costeo configurado"""
+    valor = getattr(settings, 'COSTEO_METODO', METODO_PROMEDIO)
+    if valor not in (METODO_PROMEDIO, METODO_FIFO):
+        raise ValueError(f'COSTEO_METODO desconocido: {valor!r}.')
+    return valor
+
+
+def valor_costo():
+    """Expresión del valor a costo del stock de un producto según el método configurado"""
+    if metodo() == METODO_FIFO:
+        return F('valor_fifo')
+    return ExpressionWrapper(F('stock_actual') * F('costo_promedio'), output_field=DecimalField())
+
+
+def _estado(ids):
+    """{producto_id: [stock_actual, costo_promedio, valor_fifo]}"""
+    estado = {}
+    for lote in en_lotes(ids, TAMANO_CONSULTA):
+        estado.update({
+            pk: [stock, costo, valor] for pk, stock, costo, valor in
+            Producto.objects.filter(pk__in=lote).values_list('pk', 'stock_actual', 'costo_promedio', 'valor_fifo')
+        })
+    return estado
+
+
+def _guardar(estado, campos):
+    actualizar_en_bloque(Producto, [
+        Producto(pk=pk, costo_promedio=costo.quantize(DIEZMILESIMAS), valor_fifo=valor.quantize(CENTAVOS))
+        for pk, (_, costo, valor) in estado.items()
+    ], campos)
+
+
+def registrar_entradas(lineas, fecha=None):
+    """
+    Costea entradas ya sumadas al stock. ``lineas`` son tuplas (producto_id,
+    cantidad, costo_unitario o None, detalle_compra_id o None); sin costo la
+    entrada vale el promedio vigente, o queda sin costo si el promedio es
+    desconocido. Recalcula el promedio y abre una capa FIFO por línea
+    costeada con fecha ``fecha`` (ahora por defecto).
+    """
+    lineas = [l for l in lineas if l[1] > 0]
+    if not lineas:
+        return
+    fecha = fecha or timezone.now()
+    estado = _estado({l[0] for l in lineas})
+
+    unidades, valores = defaultdict(int), defaultdict(Decimal)
+    capas = []
+    for producto_id, cantidad, costo, detalle_id in lineas:
+        if producto_id not in estado:
+            continue
+        if costo is None:
+            if not estado[producto_id][1]:
+                # Sin costo propio ni promedio: queda sin capa hasta que llegue una entrada con costo
+                continue
+            costo = estado[producto_id][1]
+        costo = Decimal(costo)
+        unidades[producto_id] += cantidad
+        valores[producto_id] += cantidad * costo
+        capas.append((producto_id, detalle_id, fecha, cantidad, cantidad, costo.quantize(DIEZMILESIMAS)))
+
+    sin_costo = [pk for pk, cantidad in unidades.items() if not estado[pk][1] and estado[pk][0] > cantidad]
+    en_capas = _unidades_en_capas(sin_costo)
+    relleno = []
+    for producto_id, cantidad in unidades.items():
+        fila = estado[producto_id]
+        stock, costo, valor = fila
+        previo = stock - cantidad
+        if previo <= 0 or not costo:
+            fila[1] = valores[producto_id] / cantidad
+            # Las unidades que había sin costo toman el de esta entrada, en una capa anterior a la suya
+            faltan = previo - en_capas.get(producto_id, 0) if producto_id in sin_costo else 0
+            if faltan > 0:
+                relleno.append((producto_id, None, fecha, faltan, faltan, fila[1].quantize(DIEZMILESIMAS)))
+                valor += faltan * fila[1]
+        else:
+            fila[1] = (previo * costo + valores[producto_id]) / stock
+        fila[2] = valor + valores[producto_id]
+
+    _guardar(estado, ['costo_promedio', 'valor_fifo'])
+    insertar_en_bloque(CapaCosto, relleno + capas, CAMPOS_CAPA)
+
+
+def _unidades_en_capas(ids):
+    """{producto_id: unidades en capas abiertas}"""
+    unidades = {}
+    for lote in en_lotes(ids, TAMANO_CONSULTA):
+        unidades.update(
+            CapaCosto.objects.filter(producto_id__in=lote, cantidad_restante__gt=0).values('producto_id').annotate(
+                unidades=Sum('cantidad_restante'),
+            ).values_list('producto_id', 'unidades').order_by()
+        )
+    return unidades
+
+
+def _consumir_capas(pendientes, estado):
+    """
+    Descuenta ``pendientes`` ({producto_id: unidades}) de las capas abiertas
+    más antiguas. Devuelve {producto_id: valor consumido} incluyendo el
+    faltante costeado al promedio; actualiza ``valor_fifo`` en ``estado``.
+    """
+    consumido = defaultdict(Decimal)
+    cambios = []
+    for lote in en_lotes(pendientes, TAMANO_CONSULTA):
+        capas = CapaCosto.objects.filter(producto_id__in=lote, cantidad_restante__gt=0).order_by(
+            'producto_id', 'fecha', 'id'
+        ).values_list('pk', 'producto_id', 'cantidad_restante', 'costo_unitario')
+        for pk, producto_id, restante, costo in capas.iterator(chunk_size=5000):
+            falta = pendientes[producto_id]
+            if falta <= 0:
+                continue
+            tomado = min(falta, restante)
+            pendientes[producto_id] = falta - tomado
+            consumido[producto_id] += tomado * costo
+            cambios.append(CapaCosto(pk=pk, cantidad_restante=restante - tomado))
+
+    for producto_id, falta in pendientes.items():
+        fila = estado[producto_id]
+        fila[2] = max(fila[2] - consumido[producto_id], Decimal('0'))
+        consumido[producto_id] += falta * fila[1]
+    actualizar_en_bloque(CapaCosto, cambios, ['cantidad_restante'])
+    return consumido
+
+
+def consumir(salidas):
+    """
+    Costea salidas ya descontadas del stock ({producto_id: unidades}).
+    Consume capas FIFO y devuelve {producto_id: costo unitario de la salida}
+    según el método configurado, para guardarlo como costo de lo vendido.
+    """
+    salidas = {pk: cantidad for pk, cantidad in salidas.items() if cantidad > 0}
+    if not salidas:
+        return {}
+    estado = _estado(salidas)
+    salidas = {pk: cantidad for pk, cantidad in salidas.items() if pk in estado}
+    consumido = _consumir_capas(dict(salidas), estado)
+    _guardar(estado, ['valor_fifo'])
+
+    if metodo() == METODO_FIFO:
+        return {pk: (consumido[pk] / cantidad).quantize(DIEZMILESIMAS) for pk, cantidad in salidas.items()}
+    return {pk: estado[pk][1] for pk in salidas}
+
+
+def revertir_compra(detalles):
+    """
+    Deshace el costeo de líneas de compra cuyo stock ya se restó.
+    ``detalles`` son tuplas (detalle_id, producto_id, cantidad, precio_unitario).
+    El promedio se recalcula quitando las unidades a su precio; en FIFO se
+    cierran las capas de esas líneas y, si parte ya se vendió, lo que falta
+    se descuenta de las capas más antiguas.
+    """
+    detalles = [d for d in detalles if d[2] > 0]
+    if not detalles:
+        return
+    estado = _estado({d[1] for d in detalles})
+    unidades, valores = defaultdict(int), defaultdict(Decimal)
+    for _, producto_id, cantidad, precio in detalles:
+        if producto_id in estado:
+            unidades[producto_id] += cantidad
+            valores[producto_id] += cantidad * Decimal(precio)
+
+    for producto_id, cantidad in unidades.items():
+        fila = estado[producto_id]
+        stock, costo, _ = fila
+        if stock > 0:
+            fila[1] = max((stock + cantidad) * costo - valores[producto_id], Decimal('0')) / stock
+
+    # Capas de las líneas: lo que queda sale de valor_fifo; lo ya consumido se toma de otras capas
+    pendientes = dict(unidades)
+    cerradas = []
+    for lote in en_lotes([d[0] for d in detalles], TAMANO_CONSULTA):
+        for pk, producto_id, restante, costo in CapaCosto.objects.filter(detalle_compra_id__in=lote).values_list(
+                'pk', 'producto_id', 'cantidad_restante', 'costo_unitario'):
+            if producto_id in estado:
+                pendientes[producto_id] -= restante
+                estado[producto_id][2] -= restante * costo
+            cerradas.append(pk)
+    for lote in en_lotes(cerradas, TAMANO_CONSULTA):
+        CapaCosto.objects.filter(pk__in=lote).delete()
+    _consumir_capas({pk: falta for pk, falta in pendientes.items() if falta > 0}, estado)
+    _guardar(estado, ['costo_promedio', 'valor_fifo'])
+
+
+
+def costear_nota(nota):
+    """Consume el costo de las líneas de una nota de entrega ya descontada y guarda su costo unitario"""
+    detalles = list(nota.detalles.values_list('pk', 'producto_id', 'cantidad'))
+    salidas = defaultdict(int)
+    for _, producto_id, cantidad in detalles:
+        salidas[producto_id] += cantidad
+    costos = consumir(salidas)
+    actualizar_en_bloque(DetalleNotaEntrega, [
+        DetalleNotaEntrega(pk=pk, costo_unitario=costos.get(producto_id, Decimal('0')))
+        for pk, producto_id, _ in detalles
+    ], ['costo_unitario'])
+
+
+def devolver_nota(nota):
+    """Reingresa al costo las líneas de una nota cuyo stock ya se devolvió, a la fecha de la nota"""
+    registrar_entradas([
+        (producto_id, cantidad, costo or None, None)
+        for producto_id, cantidad, costo in nota.detalles.values_list('producto_id', 'cantidad', 'costo_unitario')
+    ], nota.fecha_registro)
+
+
+# ==================== SALDOS INICIALES ====================
+
+def inicializar_costos(fecha=None):
+    """
+    Reinicia el costeo desde el historial: el promedio de cada producto es el
+    promedio ponderado de sus compras recibidas y su stock actual queda en
+    una sola capa FIFO a ese costo. Borra las capas existentes. Devuelve
+    cuántos productos quedaron con costo.
+    """
+    fecha = fecha or timezone.now()
+    compras = DetalleOrdenCompra.objects.filter(orden_compra__tipo='compra', cantidad__gt=0).values('producto_id').annotate(
+        unidades=Sum('cantidad'),
+        valor=Sum(ExpressionWrapper(F('cantidad') * F('precio_unitario'), output_field=DecimalField())),
+    ).values_list('producto_id', 'unidades', 'valor').order_by()
+    promedios = {pk: Decimal(valor) / unidades for pk, unidades, valor in compras if unidades}
+
+    productos, capas = [], []
+    for pk, stock in Producto.objects.values_list('pk', 'stock_actual').iterator(chunk_size=5000):
+        costo = promedios.get(pk, Decimal('0')).quantize(DIEZMILESIMAS)
+        valor = (max(stock, 0) * costo).quantize(CENTAVOS)
+        productos.append(Producto(pk=pk, costo_promedio=costo, valor_fifo=valor))
+        if stock > 0 and costo:
+            capas.append((pk, None, fecha, stock, stock, costo))
+
+    with transaction.atomic():
+        CapaCosto.objects.all().delete()
+        actualizar_en_bloque(Producto, productos, ['costo_promedio', 'valor_fifo'])
+        insertar_en_bloque(CapaCosto, capas, CAMPOS_CAPA)
+    return sum(1 for p in productos if p.costo_promedio)
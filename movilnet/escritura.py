@@ -0,0 +1,182 @@
+"""
+Escrituras de stock resistentes a "database is locked" en SQLite.
+
+SQLite admite un solo escritor a la vez. Con transacciones DEFERRED (las de
+Django por defecto) dos peticiones pueden leer y después intentar escribir a
+la vez: la segunda falla de inmediato con ``database is locked`` porque no
+puede esperar al otro escritor sin romper su propia lectura. Por eso:
+
+- ``modo_inmediato`` hace que las transacciones que se abran dentro empiecen
+  con ``BEGIN IMMEDIATE``: el bloqueo de escritura se toma al principio y, si
+  está ocupado, SQLite espera (``timeout`` de la conexión) en lugar de fallar
+  a mitad de la transacción.
+- ``con_reintentos`` ejecuta una función (o una vista completa) en ese modo
+  y, si aun así la BD sigue bloqueada, la repite desde cero con espera
+  exponencial con jitter hasta ``settings.ESCRITURA_PLAZO_SEGUNDOS``. Como
+  cada intento vuelve a ejecutar todo, la función no debe tener efectos
+  fuera de la BD antes de su transacción.
+- ``ReintentosMixin`` lo aplica al POST de las vistas basadas en clases; si
+  se agota el plazo el usuario ve un mensaje en lugar de un error 500.
+
+Cada proceso lleva contadores (``metricas()``) de operaciones, reintentos y
+fallos por nombre de operación; los reintentos también se registran en el log.
+En otros motores solo se ejecuta la función, sin cambios.
+"""
+import functools
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.shortcuts import redirect
+
+logger = logging.getLogger(__name__)
+
+MENSAJES_BLOQUEO = ('database is locked', 'database table is locked', 'database is busy')
+
+_metricas = defaultdict(lambda: {'operaciones': 0, 'reintentos': 0, 'agotadas': 0, 'espera': 0.0})
+_candado = threading.Lock()
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+class BaseDatosOcupada(OperationalError):
+    """La BD siguió bloqueada durante todo el plazo de reintentos"""
+
+
+def es_bloqueo(error):
+    return isinstance(error, OperationalError) and any(m in str(error).lower() for m in MENSAJES_BLOQUEO)
+
+
+# ==================== MÉTRICAS ====================
+
+def _registrar(operacion, reintentos, espera, agotada=False):
+    with _candado:
+        fila = _metricas[operacion]
+        fila['operaciones'] += 1
+        fila['reintentos'] += reintentos
+        fila['espera'] += espera
+        if agotada:
+            fila['agotadas'] += 1
+
+
+def metricas():
+    """{operación: {operaciones, reintentos, agotadas, espera (s)}} acumuladas en este proceso"""
+    with _candado:
+        return {operacion: dict(fila, espera=round(fila['espera'], 3)) for operacion, fila in _metricas.items()}
+
+
+def reiniciar_metricas():
+    with _candado:
+        _metricas.clear()
+
+
+# ==================== TRANSACCIONES INMEDIATAS ====================
+
+class modo_inmediato:
+    """
+    Contexto en el que las transacciones nuevas de la conexión empiezan con
+    ``BEGIN IMMEDIATE`` (solo SQLite; dentro de una transacción no cambia nada).
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.anterior = None
+        self.activo = False
+
+    def __enter__(self):
+        connection = self.connection
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            # El modo se lee de OPTIONS al conectar: hay que conectar antes de cambiarlo
+            connection.ensure_connection()
+            self.anterior = connection.transaction_mode
+            connection.transaction_mode = 'IMMEDIATE'
+            self.activo = True
+        return self
+
+    def __exit__(self, *exc):
+        if self.activo:
+            self.connection.transaction_mode = self.anterior
+        return False
+
+
+def ejecutar_con_reintentos(funcion, *args, operacion=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Ejecuta ``funcion(*args, **kwargs)`` con transacciones inmediatas y la
+    repite si la BD está bloqueada. Lanza ``BaseDatosOcupada`` si se agota el
+    plazo. Llamada dentro de una transacción ya abierta solo ejecuta la
+    función (no se puede repetir una parte de otra transacción).
+    """
+    operacion = operacion or getattr(funcion, '__qualname__', repr(funcion))
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        return funcion(*args, **kwargs)
+
+    plazo = _config('ESCRITURA_PLAZO_SEGUNDOS', 15.0)
+    espera_inicial = _config('ESCRITURA_ESPERA_INICIAL', 0.05)
+    espera_maxima = _config('ESCRITURA_ESPERA_MAXIMA', 2.0)
+    inicio = time.monotonic()
+    reintentos, esperado = 0, 0.0
+    while True:
+        try:
+            with modo_inmediato(using):
+                resultado = funcion(*args, **kwargs)
+        except OperationalError as e:
+            if not es_bloqueo(e):
+                raise
+            # Jitter completo: cada intento espera un tiempo al azar hasta el tope exponencial
+            espera = random.uniform(0, min(espera_maxima, espera_inicial * 2 ** reintentos))
+            if time.monotonic() - inicio + espera > plazo:
+                _registrar(operacion, reintentos, esperado, agotada=True)
+                logger.error('%s: base de datos bloqueada tras %d reintentos', operacion, reintentos)
+                raise BaseDatosOcupada(str(e)) from e
+            reintentos += 1
+            logger.warning('%s: base de datos bloqueada, reintento %d en %.3f s', operacion, reintentos, espera)
+            time.sleep(espera)
+            esperado += espera
+        else:
+            _registrar(operacion, reintentos, esperado)
+            return resultado
+
+
+def con_reintentos(funcion=None, *, operacion=None, using=DEFAULT_DB_ALIAS):
+    """Decorador de ``ejecutar_con_reintentos`` (``@con_reintentos`` o ``@con_reintentos(operacion='...')``)"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            return ejecutar_con_reintentos(funcion, *args, operacion=operacion or funcion.__qualname__, using=using, **kwargs)
+        return envoltura
+    return decorador(funcion) if funcion is not None else decorador
+
+
+MENSAJE_OCUPADA = 'El sistema está ocupado registrando otras operaciones. Intenta guardar de nuevo en unos segundos.'
+
+
+def vista_con_reintentos(vista):
+    """Para vistas de función que mueven stock: reintenta la petición completa y evita el error 500"""
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        try:
+            return ejecutar_con_reintentos(vista, request, *args, operacion=vista.__name__, **kwargs)
+        except BaseDatosOcupada:
+            messages.error(request, MENSAJE_OCUPADA)
+            return redirect(request.get_full_path())
+    return envoltura
+
+
+class ReintentosMixin:
+    """Para vistas basadas en clases que mueven stock: reintenta el POST completo"""
+
+    def post(self, request, *args, **kwargs):
+        operacion = f'{type(self).__name__}.post'
+        try:
+            return ejecutar_con_reintentos(super().post, request, *args, operacion=operacion, **kwargs)
+        except BaseDatosOcupada:
+            messages.error(request, MENSAJE_OCUPADA)
+            return redirect(request.get_full_path())
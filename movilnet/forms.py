@@ -1,12 +1,16 @@
+from decimal import Decimal
+
 from django import forms
 from django.forms import inlineformset_factory
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from .models import (
     Marca, Proveedor, Cliente, Producto, PerfilEmpleado,
-    TipoInventario, MovimientoInventario,
-    OrdenCompra, DetalleOrdenCompra, NotaEntrega, DetalleNotaEntrega
+    TipoInventario, MovimientoInventario, ConteoInventario,
+    OrdenCompra, DetalleOrdenCompra, NotaEntrega, DetalleNotaEntrega, TasaCambio
 )
+from .concurrencia import VersionFormMixin
+from .numeracion import es_de_serie, SERIE_ORDEN, SERIE_NOTA
 
 
 class MarcaForm(forms.ModelForm):
@@ -194,7 +198,7 @@ class ClienteForm(forms.ModelForm):
         return instance
 
 
-class ProductoForm(forms.ModelForm):
+class ProductoForm(VersionFormMixin, forms.ModelForm):
     class Meta:
         model = Producto
         fields = ['marca', 'nombre', 'descripcion_caracteristicas', 'precio', 'estado',
@@ -514,20 +518,57 @@ class MovimientoInventarioForm(forms.ModelForm):
         }
 
 
+class ConteoInventarioForm(forms.ModelForm):
+    class Meta:
+        model = ConteoInventario
+        fields = ['descripcion', 'marca', 'observaciones']
+        widgets = {
+            'descripcion': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej. Conteo cíclico semana 12'}),
+            'marca': forms.Select(attrs={'class': 'form-control'}),
+            'observaciones': forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Observaciones (opcional)'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['marca'].queryset = Marca.objects.filter(estado=True)
+        self.fields['marca'].empty_label = 'Todo el catálogo'
+
+
+class AjusteUmbralesForm(forms.Form):
+    """Parámetros del ajuste automático de stock mínimo / máximo"""
+    nivel_servicio = forms.DecimalField(
+        min_value=Decimal('0.50'), max_value=Decimal('0.999'), decimal_places=3, initial=Decimal('0.95'),
+        label='Nivel de servicio',
+        help_text='Probabilidad objetivo de no quedarse sin stock durante la reposición.'
+    )
+    dias_entrega = forms.IntegerField(min_value=0, max_value=180, initial=7, label='Días de entrega')
+    dias_revision = forms.IntegerField(min_value=1, max_value=365, initial=30, label='Días que cubre el máximo')
+    incluir_sin_demanda = forms.BooleanField(required=False, label='Ajustar también productos sin demanda')
+
+
 # ==================== FORMULARIOS DE ORDEN DE COMPRA / COMPRA ====================
 
-class OrdenCompraForm(forms.ModelForm):
+class OrdenCompraForm(VersionFormMixin, forms.ModelForm):
     class Meta:
         model = OrdenCompra
         fields = ['proveedor', 'tipo', 'numero_orden', 'fecha_orden', 'observaciones']
         widgets = {
             'proveedor': forms.Select(attrs={'class': 'form-control'}),
             'tipo': forms.Select(attrs={'class': 'form-control'}),
-            'numero_orden': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej. OC-001'}),
+            'numero_orden': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Automático (OC-año-000001)'}),
             'fecha_orden': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'observaciones': forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Observaciones (opcional)'}),
         }
 
+    def clean_numero_orden(self):
+        numero = self.cleaned_data.get('numero_orden')
+        # El número ya asignado se puede conservar al editar; uno nuevo con el formato automático chocaría con la serie
+        if es_de_serie(SERIE_ORDEN, numero) and numero != self.instance.numero_orden:
+            raise forms.ValidationError(
+                f'Los números {SERIE_ORDEN}-año-correlativo los asigna el sistema. Deja el campo vacío o usa otro formato.'
+            )
+        return numero
+
 
 class DetalleOrdenCompraForm(forms.ModelForm):
     class Meta:
@@ -548,19 +589,102 @@ DetalleOrdenCompraFormSet = inlineformset_factory(
 )
 
 
+class ReposicionForm(forms.Form):
+    """Parámetros del cálculo de reposición (se envían por GET)"""
+    dias_consumo = forms.IntegerField(
+        min_value=1, max_value=365, initial=30,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'style': 'width: 110px;'}),
+        label='Días de consumo'
+    )
+    dias_entrega = forms.IntegerField(
+        min_value=0, max_value=180, initial=7,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'style': 'width: 110px;'}),
+        label='Días de entrega'
+    )
+    marca = forms.ModelChoiceField(
+        queryset=Marca.objects.filter(estado=True), required=False,
+        empty_label='Todas las marcas',
+        widget=forms.Select(attrs={'class': 'form-control', 'style': 'min-width: 160px;'}),
+        label='Marca'
+    )
+
+
+class CambioPreciosForm(forms.Form):
+    marca = forms.ModelChoiceField(
+        queryset=Marca.objects.filter(estado=True), required=False,
+        empty_label='Todas las marcas',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Marca'
+    )
+    porcentaje = forms.DecimalField(
+        max_digits=6, decimal_places=2, min_value=Decimal('-99.99'), max_value=Decimal('1000'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': 'Ej. 15 o -10'}),
+        label='Variación (%)'
+    )
+    motivo = forms.CharField(
+        max_length=200, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej. Ajuste de lista del proveedor'}),
+        label='Motivo'
+    )
+
+    def clean_porcentaje(self):
+        porcentaje = self.cleaned_data['porcentaje']
+        if porcentaje == 0:
+            raise forms.ValidationError('La variación no puede ser 0.')
+        return porcentaje
+
+
+class TasaCambioForm(forms.ModelForm):
+    class Meta:
+        model = TasaCambio
+        fields = ['fecha', 'tasa', 'fuente']
+        widgets = {
+            'fecha': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'tasa': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.0001', 'min': '0.0001', 'placeholder': 'Bs por dólar'}),
+            'fuente': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej. BCV'}),
+        }
+
+    def clean_tasa(self):
+        tasa = self.cleaned_data['tasa']
+        if tasa <= 0:
+            raise forms.ValidationError('La tasa debe ser mayor que 0.')
+        return tasa
+
+
+class GenerarOrdenesForm(forms.Form):
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.filter(estado=True),
+        widget=forms.Select(attrs={'class': 'form-control', 'style': 'min-width: 200px;'}),
+        label='Proveedor'
+    )
+    por_marca = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Una orden por marca'
+    )
+
+
 # ==================== FORMULARIOS DE NOTA DE ENTREGA ====================
 
-class NotaEntregaForm(forms.ModelForm):
+class NotaEntregaForm(VersionFormMixin, forms.ModelForm):
     class Meta:
         model = NotaEntrega
         fields = ['cliente', 'numero_entrega', 'descuento', 'observaciones']
         widgets = {
             'cliente': forms.Select(attrs={'class': 'form-control'}),
-            'numero_entrega': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej. NE-001'}),
+            'numero_entrega': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Automático (NE-año-000001)'}),
             'descuento': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
             'observaciones': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Observaciones'}),
         }
 
+    def clean_numero_entrega(self):
+        numero = self.cleaned_data.get('numero_entrega')
+        if es_de_serie(SERIE_NOTA, numero) and numero != self.instance.numero_entrega:
+            raise forms.ValidationError(
+                f'Los números {SERIE_NOTA}-año-correlativo los asigna el sistema. Deja el campo vacío o usa otro formato.'
+            )
+        return numero
+
 
 class DetalleNotaEntregaForm(forms.ModelForm):
     class Meta:
@@ -580,3 +704,75 @@ DetalleNotaEntregaFormSet = inlineformset_factory(
     extra=1,
     can_delete=True
 )
+
+
+# ==================== FORMULARIOS DE IMPORTACIÓN ====================
+
+class ImportarCatalogoForm(forms.Form):
+    CATALOGO_CHOICES = [
+        ('productos', 'Productos'),
+        ('clientes', 'Clientes'),
+        ('proveedores', 'Proveedores'),
+    ]
+
+    catalogo = forms.ChoiceField(
+        choices=CATALOGO_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Catálogo'
+    )
+    archivo = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+        label='Archivo (.csv o .xlsx)'
+    )
+    actualizar = forms.BooleanField(
+        required=False, initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Actualizar registros existentes'
+    )
+    crear_marcas = forms.BooleanField(
+        required=False, initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Crear las marcas que no existan (productos)'
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se admiten archivos .csv o .xlsx.')
+        return archivo
+
+
+class ImportarMovimientosForm(forms.Form):
+    MODO_CHOICES = [
+        ('todo', 'Todo o nada (un error cancela el lote)'),
+        ('fila', 'Por fila (se omiten las filas con error)'),
+    ]
+
+    archivo = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+        label='Archivo (.csv o .xlsx)'
+    )
+    modo = forms.ChoiceField(
+        choices=MODO_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Manejo de errores'
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se admiten archivos .csv o .xlsx.')
+        return archivo
+
+
+class ImportarConteoForm(forms.Form):
+    archivo = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+        label='Archivo (.csv o .xlsx)'
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se admiten archivos .csv o .xlsx.')
+        return archivo
@@ -0,0 +1,126 @@
+"""
+Envío único de los formularios que crean documentos (notas de entrega,
+órdenes de compra).
+
+Cada formulario lleva una clave aleatoria oculta. Al procesar el POST:
+
+1. Antes de validar o tocar el stock se busca la clave en ``EnvioProcesado``
+   (índice único). Si ya se procesó, se redirige al documento creado sin
+   volver a ejecutar nada: un doble clic o un reintento del navegador no
+   duplica la nota ni descuenta el stock dos veces.
+2. Dentro de la transacción del documento, antes de escribir nada más, se
+   inserta la clave. Si dos envíos iguales llegan a la vez, el segundo
+   choca con el índice único cuando el primero confirma, su transacción se
+   deshace y también recibe el documento del primero.
+
+Las claves se recuerdan ``settings.IDEMPOTENCIA_VIGENCIA_SEGUNDOS``; las
+vencidas se borran en bloque con ``manage.py purgar_envios``.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from .models import EnvioProcesado
+
+CAMPO = 'clave_idempotencia'
+
+
+class EnvioRepetido(Exception):
+    """La clave del formulario ya fue procesada por otra petición"""
+
+    def __init__(self, envio):
+        super().__init__(envio.clave)
+        self.envio = envio
+
+
+def vigencia():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_VIGENCIA_SEGUNDOS', 3600))
+
+
+def nueva_clave():
+    return uuid.uuid4().hex
+
+
+def _clave(request):
+    clave = request.POST.get(CAMPO, '').strip()
+    return clave[:64] or None
+
+
+def buscar(request):
+    """Envío ya procesado con la clave del POST (del mismo usuario y aún vigente), o None"""
+    clave = _clave(request)
+    if clave is None:
+        return None
+    return EnvioProcesado.objects.filter(
+        clave=clave, usuario=request.user, fecha__gte=timezone.now() - vigencia(),
+    ).first()
+
+
+def reclamar(request, modelo):
+    """
+    Registra la clave del POST dentro de la transacción en curso. Lanza
+    ``EnvioRepetido`` si otra petición ya la procesó. Devuelve None si el
+    formulario no trae clave.
+    """
+    clave = _clave(request)
+    if clave is None:
+        return None
+    # Una clave vencida se puede volver a usar
+    EnvioProcesado.objects.filter(clave=clave, fecha__lt=timezone.now() - vigencia()).delete()
+    try:
+        with transaction.atomic():
+            return EnvioProcesado.objects.create(clave=clave, usuario=request.user, modelo=modelo._meta.model_name)
+    except IntegrityError:
+        envio = EnvioProcesado.objects.filter(clave=clave).first()
+        if envio is None or envio.usuario_id != request.user.pk:
+            raise
+        raise EnvioRepetido(envio)
+
+
+def completar(envio, objeto, url):
+    """Guarda en el envío el documento creado y la URL a la que se redirige al repetirlo"""
+    if envio is None:
+        return
+    envio.objeto_id = objeto.pk
+    envio.descripcion = str(objeto)[:200]
+    envio.url_resultado = url
+    envio.save(update_fields=['objeto_id', 'descripcion', 'url_resultado'])
+
+
+def respuesta_repetida(request, envio):
+    messages.info(request, f'Este formulario ya se había procesado ({envio.descripcion}); no se registró de nuevo.')
+    return redirect(envio.url_resultado or '/')
+
+
+def purgar_vencidas():
+    """Borra en bloque las claves vencidas. Devuelve cuántas se borraron"""
+    borradas, _ = EnvioProcesado.objects.filter(fecha__lt=timezone.now() - vigencia()).delete()
+    return borradas
+
+
+class EnvioUnicoMixin:
+    """
+    Para vistas de creación: agrega la clave al contexto
+    (``clave_idempotencia``) y responde los envíos repetidos sin procesarlos.
+    ``form_valid`` debe llamar a ``reclamar`` al abrir su transacción y a
+    ``completar`` al terminarla.
+    """
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['clave_idempotencia'] = _clave(self.request) or nueva_clave()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        envio = buscar(request)
+        if envio is not None:
+            return respuesta_repetida(request, envio)
+        try:
+            return super().post(request, *args, **kwargs)
+        except EnvioRepetido as e:
+            return respuesta_repetida(request, e.envio)
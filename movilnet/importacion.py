@@ -0,0 +1,414 @@
+"""
+Importación masiva de catálogos (Producto, Cliente, Proveedor) desde CSV o XLSX.
+
+El archivo se lee como flujo y se procesa por lotes: cada lote se valida en
+memoria, se consulta la existencia de sus claves en una sola consulta
+(``rif``, ``cedula`` o marca + nombre) y se escribe con ``bulk_create`` /
+``actualizar_en_bloque`` dentro de una transacción. Las filas inválidas no detienen la
+importación; se devuelven en el reporte de errores.
+"""
+import csv
+import io
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .bd import actualizar_en_bloque
+from .models import Marca, Proveedor, Cliente, Producto, rif_validator, cedula_validator
+
+TAMANO_LOTE = 1000
+
+
+class ErrorFila(Exception):
+    """Error de validación de una fila del archivo"""
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = 0
+        self.actualizados = 0
+        self.sin_cambios = 0
+        self.errores = []  # [(número de fila, mensaje)]
+
+    @property
+    def procesados(self):
+        return self.creados + self.actualizados
+
+    def agregar_error(self, fila, mensaje):
+        self.errores.append((fila, mensaje))
+
+
+# ==================== LECTURA DE ARCHIVOS ====================
+
+def _normalizar_encabezado(valor):
+    return re.sub(r'\s+', '_', str(valor or '').strip().lower())
+
+
+def leer_filas(archivo, nombre_archivo=''):
+    """
+    Genera (número de fila, dict) a partir de un CSV o XLSX.
+
+    ``archivo`` puede ser una ruta o un archivo binario abierto (p. ej. un
+    ``UploadedFile``). La fila 1 es el encabezado.
+    """
+    nombre = (nombre_archivo or getattr(archivo, 'name', '') or str(archivo)).lower()
+    if nombre.endswith('.xlsx'):
+        yield from _leer_xlsx(archivo)
+    else:
+        yield from _leer_csv(archivo)
+
+
+def _leer_csv(archivo):
+    if isinstance(archivo, str) or hasattr(archivo, '__fspath__'):
+        with open(archivo, 'rb') as binario:
+            yield from _leer_csv(binario)
+        return
+    texto = io.TextIOWrapper(getattr(archivo, 'file', archivo), encoding='utf-8-sig', newline='')
+    try:
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(texto, dialecto)
+        encabezados = [_normalizar_encabezado(c) for c in next(lector, [])]
+        for numero, valores in enumerate(lector, start=2):
+            if not any(v.strip() for v in valores):
+                continue
+            yield numero, dict(zip(encabezados, (v.strip() for v in valores)))
+    finally:
+        # El archivo subyacente lo cierra quien lo abrió
+        texto.detach()
+
+
+def _leer_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErrorFila('Para importar archivos .xlsx se requiere el paquete openpyxl.')
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = [_normalizar_encabezado(c) for c in next(filas, ())]
+        for numero, valores in enumerate(filas, start=2):
+            if not any(v not in (None, '') for v in valores):
+                continue
+            yield numero, {
+                clave: ('' if v is None else str(v).strip())
+                for clave, v in zip(encabezados, valores)
+            }
+    finally:
+        libro.close()
+
+
+def en_lotes(iterable, tamano):
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ==================== CONVERSIÓN DE VALORES ====================
+
+def campo_requerido(datos, campo):
+    valor = (datos.get(campo) or '').strip()
+    if not valor:
+        raise ErrorFila(f'El campo "{campo}" es obligatorio.')
+    return valor
+
+
+def convertir_decimal(valor, campo):
+    texto = str(valor).strip().replace(' ', '')
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = Decimal(texto).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ErrorFila(f'"{campo}" no es un número válido: {valor}')
+    if numero < 0:
+        raise ErrorFila(f'"{campo}" no puede ser negativo.')
+    return numero
+
+
+def convertir_entero(valor, campo, defecto=None):
+    if valor in (None, ''):
+        if defecto is None:
+            raise ErrorFila(f'El campo "{campo}" es obligatorio.')
+        return defecto
+    try:
+        numero = int(Decimal(str(valor).strip()))
+    except InvalidOperation:
+        raise ErrorFila(f'"{campo}" no es un entero válido: {valor}')
+    if numero < 0:
+        raise ErrorFila(f'"{campo}" no puede ser negativo.')
+    return numero
+
+
+def convertir_booleano(valor, defecto=True):
+    if valor in (None, ''):
+        return defecto
+    return str(valor).strip().lower() in ('1', 'si', 'sí', 's', 'true', 'x', 'activo')
+
+
+def validar_valor(validador, valor):
+    try:
+        validador(valor)
+    except ValidationError as e:
+        raise ErrorFila(e.messages[0])
+    return valor
+
+
+# ==================== IMPORTADORES ====================
+
+class ImportadorBase:
+    """
+    Plantilla de importación por lotes.
+
+    Las subclases definen cómo convertir una fila (``convertir``), su clave
+    única (``clave``), cómo buscar las existentes de un lote (``existentes``)
+    y qué campos se actualizan (``campos_actualizables``).
+    """
+    modelo = None
+    columnas = ()
+    campos_actualizables = ()
+
+    def __init__(self, actualizar=True, tamano_lote=TAMANO_LOTE):
+        self.actualizar = actualizar
+        self.tamano_lote = tamano_lote
+        self.resultado = ResultadoImportacion()
+        self._claves_vistas = set()
+
+    def importar(self, filas):
+        for lote in en_lotes(filas, self.tamano_lote):
+            self._procesar_lote(lote)
+        return self.resultado
+
+    def preparar_lote(self, validas):
+        """Gancho para resolver referencias del lote completo antes de buscar existentes"""
+
+    def despues_de_guardar(self, nuevos, cambios):
+        """Gancho dentro de la transacción del lote, con los objetos creados y actualizados"""
+
+    def _procesar_lote(self, lote):
+        validas = []
+        for numero, datos in lote:
+            try:
+                objeto = self.convertir(datos)
+            except ErrorFila as e:
+                self.resultado.agregar_error(numero, str(e))
+                continue
+            validas.append((numero, objeto))
+        if not validas:
+            return
+
+        try:
+            self.preparar_lote(validas)
+        except ErrorFila as e:
+            for numero, _ in validas:
+                self.resultado.agregar_error(numero, str(e))
+            return
+
+        nuevos, cambios = [], []
+        existentes = self.existentes([self.clave(obj) for _, obj in validas])
+        for numero, objeto in validas:
+            clave = self.clave(objeto)
+            if clave in self._claves_vistas:
+                self.resultado.agregar_error(numero, 'Registro repetido dentro del archivo.')
+                continue
+            self._claves_vistas.add(clave)
+            actual = existentes.get(clave)
+            if actual is None:
+                nuevos.append(objeto)
+            elif self.actualizar:
+                distintos = [c for c in self.campos_actualizables if getattr(actual, c) != getattr(objeto, c)]
+                for campo in distintos:
+                    setattr(actual, campo, getattr(objeto, campo))
+                # Las filas idénticas a lo guardado no generan escritura
+                if distintos:
+                    cambios.append(actual)
+                else:
+                    self.resultado.sin_cambios += 1
+            else:
+                self.resultado.agregar_error(numero, 'Ya existe en el sistema (actualización desactivada).')
+
+        with transaction.atomic():
+            if nuevos:
+                self.modelo.objects.bulk_create(nuevos, batch_size=self.tamano_lote)
+            if cambios:
+                actualizar_en_bloque(self.modelo, cambios, self.campos_actualizables)
+            self.despues_de_guardar(nuevos, cambios)
+        self.resultado.creados += len(nuevos)
+        self.resultado.actualizados += len(cambios)
+
+
+class ImportadorClientes(ImportadorBase):
+    modelo = Cliente
+    columnas = ('cedula', 'nombre', 'telefono', 'direccion')
+    campos_actualizables = ('nombre', 'telefono', 'direccion')
+
+    def convertir(self, datos):
+        cedula = validar_valor(cedula_validator, campo_requerido(datos, 'cedula').upper())
+        return Cliente(
+            cedula=cedula,
+            nombre=campo_requerido(datos, 'nombre')[:200],
+            telefono=campo_requerido(datos, 'telefono')[:20],
+            direccion=datos.get('direccion') or None,
+        )
+
+    def clave(self, objeto):
+        return objeto.cedula
+
+    def existentes(self, claves):
+        return Cliente.objects.in_bulk(claves, field_name='cedula')
+
+
+class ImportadorProveedores(ImportadorBase):
+    modelo = Proveedor
+    columnas = ('rif', 'nombre', 'telefono', 'email', 'direccion', 'estado')
+    campos_actualizables = ('nombre', 'telefono', 'email', 'direccion', 'estado')
+
+    def convertir(self, datos):
+        rif = validar_valor(rif_validator, campo_requerido(datos, 'rif').upper())
+        email = (datos.get('email') or '').strip() or None
+        if email:
+            validar_valor(validate_email, email)
+        return Proveedor(
+            rif=rif,
+            nombre=campo_requerido(datos, 'nombre')[:200],
+            telefono=campo_requerido(datos, 'telefono')[:20],
+            email=email,
+            direccion=campo_requerido(datos, 'direccion'),
+            estado=convertir_booleano(datos.get('estado')),
+        )
+
+    def clave(self, objeto):
+        return objeto.rif
+
+    def existentes(self, claves):
+        return Proveedor.objects.in_bulk(claves, field_name='rif')
+
+
+class ImportadorProductos(ImportadorBase):
+    """
+    Productos identificados por marca + nombre (sin distinguir mayúsculas).
+
+    Las marcas se resuelven desde un mapa en memoria cargado una sola vez; las
+    que no existen se crean en bloque por lote si ``crear_marcas`` está activo.
+    Los nombres se comparan con ``casefold`` en Python: ``lower()`` de SQLite
+    solo convierte ASCII y no igualaría "CAÑÓN" con "cañón". Los nombres de
+    cada marca se cargan una vez, la primera vez que aparece en el archivo.
+    """
+    modelo = Producto
+    columnas = ('marca', 'nombre', 'precio', 'descripcion', 'stock_minimo', 'stock_maximo', 'estado')
+    campos_actualizables = ('precio', 'descripcion_caracteristicas', 'stock_minimo', 'stock_maximo', 'estado')
+
+    def __init__(self, crear_marcas=True, **kwargs):
+        super().__init__(**kwargs)
+        self.crear_marcas = crear_marcas
+        self.marcas = {
+            nombre.lower(): pk for pk, nombre in Marca.objects.values_list('pk', 'nombre_marca')
+        }
+        self._nombres = {}  # marca_id -> {nombre normalizado: pk}
+
+    def convertir(self, datos):
+        minimo = convertir_entero(datos.get('stock_minimo'), 'stock_minimo', defecto=5)
+        maximo = convertir_entero(datos.get('stock_maximo'), 'stock_maximo', defecto=100)
+        if minimo > maximo:
+            raise ErrorFila('El stock mínimo no puede ser mayor que el stock máximo.')
+        producto = Producto(
+            nombre=campo_requerido(datos, 'nombre')[:200],
+            descripcion_caracteristicas=datos.get('descripcion') or None,
+            precio=convertir_decimal(campo_requerido(datos, 'precio'), 'precio'),
+            stock_minimo=minimo,
+            stock_maximo=maximo,
+            estado=convertir_booleano(datos.get('estado')),
+        )
+        # La marca se resuelve por lote en preparar_lote()
+        producto._nombre_marca = campo_requerido(datos, 'marca')[:100]
+        return producto
+
+    def preparar_lote(self, validas):
+        faltantes = {}
+        for _, producto in validas:
+            clave = producto._nombre_marca.lower()
+            if clave not in self.marcas:
+                faltantes.setdefault(clave, producto._nombre_marca)
+        if faltantes:
+            if not self.crear_marcas:
+                # Solo las filas con marca desconocida son inválidas
+                for numero, producto in list(validas):
+                    if producto._nombre_marca.lower() in faltantes:
+                        self.resultado.agregar_error(numero, f'La marca "{producto._nombre_marca}" no existe.')
+                        validas.remove((numero, producto))
+            else:
+                Marca.objects.bulk_create(
+                    [Marca(nombre_marca=nombre) for nombre in faltantes.values()],
+                    ignore_conflicts=True,
+                )
+                self.marcas.update({
+                    nombre.lower(): pk for pk, nombre in
+                    Marca.objects.filter(nombre_marca__in=faltantes.values()).values_list('pk', 'nombre_marca')
+                })
+        for _, producto in validas:
+            producto.marca_id = self.marcas[producto._nombre_marca.lower()]
+
+    def despues_de_guardar(self, nuevos, cambios):
+        # Los guardados en bloque no disparan la señal del historial de precios
+        from .precios import registrar_cambios
+        registrar_cambios(
+            [(p.pk, None, p.precio) for p in nuevos]
+            + [(p.pk, p._precio_original, p.precio) for p in cambios],
+            motivo='Importación de catálogo',
+        )
+
+    def clave(self, objeto):
+        return (objeto.marca_id, objeto.nombre.casefold())
+
+    def existentes(self, claves):
+        nuevas = {m for m, _ in claves} - self._nombres.keys()
+        if nuevas:
+            for marca_id in nuevas:
+                self._nombres[marca_id] = {}
+            filas = Producto.objects.filter(marca_id__in=nuevas).order_by('pk').values_list('marca_id', 'nombre', 'pk')
+            for marca_id, nombre, pk in filas.iterator(chunk_size=self.tamano_lote):
+                self._nombres[marca_id].setdefault(nombre.casefold(), pk)
+        pks = {clave: self._nombres[clave[0]].get(clave[1]) for clave in claves}
+        productos = Producto.objects.in_bulk([pk for pk in pks.values() if pk is not None])
+        return {clave: productos[pk] for clave, pk in pks.items() if pk in productos}
+
+
+IMPORTADORES = {
+    'productos': ImportadorProductos,
+    'clientes': ImportadorClientes,
+    'proveedores': ImportadorProveedores,
+}
+
+
+def importar_catalogo(tipo, archivo, nombre_archivo='', **opciones):
+    """Importa un archivo del catálogo indicado ('productos', 'clientes' o 'proveedores')"""
+    clase = IMPORTADORES[tipo]
+    if clase is not ImportadorProductos:
+        opciones.pop('crear_marcas', None)
+    importador = clase(**opciones)
+    try:
+        return importador.importar(leer_filas(archivo, nombre_archivo))
+    except ErrorFila as e:
+        importador.resultado.agregar_error(0, str(e))
+    except UnicodeDecodeError:
+        importador.resultado.agregar_error(0, 'El archivo CSV debe estar codificado en UTF-8.')
+    return importador.resultado
+
+
+def escribir_reporte_errores(errores, salida):
+    """Escribe el reporte de errores por fila como CSV en ``salida`` (archivo de texto)"""
+    escritor = csv.writer(salida)
+    escritor.writerow(['fila', 'error'])
+    escritor.writerows(errores)
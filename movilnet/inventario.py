@@ -0,0 +1,409 @@
+"""
+Operaciones de stock por conjuntos.
+
+Las vistas de documentos ajustan el stock producto por producto; los procesos
+masivos (importación de movimientos, conteos físicos) usan estas funciones,
+que aplican todos los cambios con una sola sentencia preparada y crean los
+movimientos con un INSERT en bloque dentro de la misma transacción.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Sum, Q, F, OuterRef, Subquery, IntegerField, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import costeo, reservas
+from .bd import actualizar_en_bloque, insertar_en_bloque
+from .importacion import ResultadoImportacion, ErrorFila, convertir_entero, en_lotes
+from .models import (
+    Producto, TipoInventario, MovimientoInventario, ConteoInventario, DetalleConteo,
+    DetalleOrdenCompra, DetalleNotaEntrega,
+)
+
+TAMANO_CONSULTA = 900  # parámetros por consulta IN (límite conservador de SQLite)
+
+CAMPOS_MOVIMIENTO = ('producto', 'tipo_inventario', 'cantidad', 'empleado', 'fecha_movimiento', 'observaciones')
+
+
+class StockInsuficiente(Exception):
+    """Un lote dejaría algún producto con stock negativo"""
+
+
+def aplicar_deltas_stock(deltas, using=None, excluir_sesion=None):
+    """
+    Suma a ``stock_actual`` el delta de cada producto ({producto_id: delta}).
+
+    El UPDATE es relativo (stock_actual = stock_actual + delta), así que no pisa
+    cambios concurrentes. Debe llamarse dentro de una transacción: si algún
+    producto queda en negativo se lanza ``StockInsuficiente`` y el llamador
+    revierte. Con ``excluir_sesion`` (clave de sesión) las salidas tampoco
+    pueden tomar unidades reservadas por otras sesiones (ver reservas.py).
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    using = using or router.db_for_write(Producto)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    tabla = qn(Producto._meta.db_table)
+    columna = qn(Producto._meta.get_field('stock_actual').column)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {tabla} SET {columna} = {columna} + %s WHERE {qn(Producto._meta.pk.column)} = %s',
+            [(delta, pk) for pk, delta in deltas.items()],
+        )
+    negativos = []
+    for ids in en_lotes(deltas, TAMANO_CONSULTA):
+        productos = Producto.objects.using(using).filter(pk__in=ids)
+        if excluir_sesion is None:
+            productos = productos.filter(stock_actual__lt=0)
+        else:
+            salidas = [pk for pk in ids if deltas[pk] < 0]
+            productos = reservas.anotar_disponible(productos, excluir_sesion).filter(
+                Q(stock_actual__lt=0) | Q(pk__in=salidas, disponible__lt=0),
+            )
+        negativos += productos.values_list('nombre', flat=True)
+    if negativos:
+        raise StockInsuficiente(', '.join(negativos[:10]))
+
+
+def marcar_ultimo_movimiento(entradas=(), salidas=(), fecha=None, using=None):
+    """
+    Anota ``fecha`` (ahora por defecto) en ``Producto.ultima_entrada`` de los
+    productos de ``entradas`` y en ``ultima_salida`` de los de ``salidas``.
+    Debe llamarse en la misma transacción que el cambio de stock.
+    """
+    fecha = fecha or timezone.now()
+    using = using or router.db_for_write(Producto)
+    for campo, ids in (('ultima_entrada', entradas), ('ultima_salida', salidas)):
+        for lote in en_lotes(set(ids), TAMANO_CONSULTA):
+            Producto.objects.using(using).filter(pk__in=lote).update(**{campo: fecha})
+
+
+def _costear_deltas(deltas, fecha):
+    """Costea los deltas netos de stock ya aplicados: entradas al costo promedio, salidas por capas"""
+    costeo.registrar_entradas([(pk, delta, None, None) for pk, delta in deltas.items() if delta > 0], fecha)
+    costeo.consumir({pk: -delta for pk, delta in deltas.items() if delta < 0})
+
+
+def stock_por_producto(ids, bloquear=False):
+    """{producto_id: (nombre, stock_actual)} para los ids indicados, en consultas por bloques"""
+    resultado = {}
+    for lote in en_lotes(ids, TAMANO_CONSULTA):
+        consulta = Producto.objects.filter(pk__in=lote)
+        if bloquear:
+            consulta = consulta.select_for_update()
+        resultado.update({pk: (nombre, stock) for pk, nombre, stock in consulta.values_list('pk', 'nombre', 'stock_actual')})
+    return resultado
+
+
+def registrar_movimientos_masivos(movimientos, empleado=None, todo_o_nada=True, solo_validar=False):
+    """
+    Registra una lista de movimientos y ajusta el stock en una sola transacción.
+
+    ``movimientos`` es una secuencia de (fila, producto_id, tipo, cantidad,
+    observaciones) con ``tipo`` ya resuelto a ``TipoInventario``. Las filas se
+    simulan en orden sobre el stock leído de la BD: con ``todo_o_nada`` un solo
+    error cancela el lote completo; si no, se omiten las filas con error.
+    Con ``solo_validar`` se devuelve el reporte sin escribir nada.
+    """
+    resultado = ResultadoImportacion()
+    with transaction.atomic():
+        stock = stock_por_producto({m[1] for m in movimientos}, bloquear=True)
+        saldo = {pk: s for pk, (_, s) in stock.items()}
+        deltas = defaultdict(int)
+        aceptados = []
+        entradas, salidas = set(), set()
+        empleado_id = empleado.pk if empleado is not None else None
+        ahora = timezone.now()
+        for fila, producto_id, tipo, cantidad, observaciones in movimientos:
+            if producto_id not in saldo:
+                resultado.agregar_error(fila, f'El producto {producto_id} no existe.')
+                continue
+            delta = cantidad if tipo.es_entrada else -cantidad
+            if saldo[producto_id] + delta < 0:
+                resultado.agregar_error(
+                    fila, f'Stock insuficiente para "{stock[producto_id][0]}". '
+                          f'Disponible: {saldo[producto_id]}, solicitado: {cantidad}.'
+                )
+                continue
+            saldo[producto_id] += delta
+            deltas[producto_id] += delta
+            (entradas if tipo.es_entrada else salidas).add(producto_id)
+            aceptados.append((producto_id, tipo.pk, cantidad, empleado_id, ahora, observaciones or None))
+
+        if solo_validar or (resultado.errores and todo_o_nada):
+            # Nada se escribió todavía; se devuelve el reporte sin tocar la BD
+            return resultado
+
+        aplicar_deltas_stock(deltas)
+        marcar_ultimo_movimiento(entradas, salidas, ahora)
+        _costear_deltas(deltas, ahora)
+        insertar_en_bloque(MovimientoInventario, aceptados, CAMPOS_MOVIMIENTO)
+        resultado.creados = len(aceptados)
+    return resultado
+
+
+def _mapa_tipos():
+    """Tipos de movimiento por id y por nombre (si el nombre no es ambiguo)"""
+    tipos = list(TipoInventario.objects.all())
+    mapa = {str(t.pk): t for t in tipos}
+    por_nombre = defaultdict(list)
+    for t in tipos:
+        por_nombre[t.tipo_movimiento.strip().lower()].append(t)
+    mapa.update({nombre: lista[0] for nombre, lista in por_nombre.items() if len(lista) == 1})
+    return mapa
+
+
+def importar_movimientos(filas, empleado=None, todo_o_nada=True):
+    """
+    Importa movimientos desde filas con columnas ``producto`` (id), ``tipo``
+    (id o nombre del tipo de movimiento), ``cantidad`` y ``observaciones``.
+    """
+    tipos = _mapa_tipos()
+    errores = []
+    movimientos = []
+    for fila, datos in filas:
+        try:
+            producto_id = convertir_entero(datos.get('producto') or datos.get('producto_id'), 'producto')
+            cantidad = convertir_entero(datos.get('cantidad'), 'cantidad')
+            if cantidad < 1:
+                raise ErrorFila('La cantidad debe ser al menos 1.')
+            clave_tipo = (datos.get('tipo') or datos.get('tipo_movimiento') or '').strip().lower()
+            tipo = tipos.get(clave_tipo)
+            if tipo is None:
+                raise ErrorFila(f'Tipo de movimiento desconocido o ambiguo: "{clave_tipo}".')
+        except ErrorFila as e:
+            errores.append((fila, str(e)))
+            continue
+        movimientos.append((fila, producto_id, tipo, cantidad, datos.get('observaciones', '')))
+
+    # Con errores de formato en modo todo-o-nada igual se valida el stock, para reportarlo todo junto
+    resultado = registrar_movimientos_masivos(
+        movimientos, empleado=empleado, todo_o_nada=todo_o_nada,
+        solo_validar=bool(errores) and todo_o_nada,
+    )
+    resultado.errores = sorted(errores + resultado.errores)
+    return resultado
+
+
+# ==================== CONTEOS FÍSICOS ====================
+
+TIPO_AJUSTE_CONTEO = 'Ajuste por conteo'
+
+
+class ConteoCerrado(Exception):
+    """El conteo ya fue aprobado o cancelado"""
+
+
+def registrar_conteos(conteo, cantidades):
+    """Guarda (o corrige) las cantidades contadas {producto_id: cantidad} con un upsert en bloque"""
+    if not conteo.abierto:
+        raise ConteoCerrado(f'El conteo #{conteo.pk} ya está {conteo.get_estado_display().lower()}.')
+    return insertar_en_bloque(
+        DetalleConteo,
+        [(conteo.pk, producto_id, cantidad) for producto_id, cantidad in cantidades.items()],
+        ('conteo', 'producto', 'cantidad_contada'),
+        conflicto=('conteo', 'producto'), actualizar=('cantidad_contada',),
+    )
+
+
+def importar_conteo(conteo, filas):
+    """
+    Carga cantidades contadas desde filas con columnas ``producto`` (id) y
+    ``cantidad``. Solo se aceptan productos dentro del alcance del conteo; si
+    un producto aparece varias veces se suman las cantidades (varias zonas).
+    """
+    resultado = ResultadoImportacion()
+    cantidades = defaultdict(int)
+    primera_fila = {}
+    for fila, datos in filas:
+        try:
+            producto_id = convertir_entero(datos.get('producto') or datos.get('producto_id'), 'producto')
+            cantidades[producto_id] += convertir_entero(datos.get('cantidad'), 'cantidad')
+            primera_fila.setdefault(producto_id, fila)
+        except ErrorFila as e:
+            resultado.agregar_error(fila, str(e))
+
+    validos = set()
+    alcance = conteo.productos_en_alcance()
+    for ids in en_lotes(cantidades, TAMANO_CONSULTA):
+        validos.update(alcance.filter(pk__in=ids).values_list('pk', flat=True))
+    for producto_id in cantidades.keys() - validos:
+        resultado.agregar_error(primera_fila[producto_id], f'El producto {producto_id} no existe o está fuera del alcance del conteo.')
+    resultado.errores.sort()
+
+    with transaction.atomic():
+        resultado.creados = registrar_conteos(conteo, {pk: c for pk, c in cantidades.items() if pk in validos})
+    return resultado
+
+
+def _stock_referencia():
+    # Antes de aprobar se compara contra el stock vivo; después, contra la foto guardada
+    return Coalesce('stock_sistema', 'producto__stock_actual')
+
+
+def detalles_con_diferencia(conteo):
+    """Detalles del conteo anotados con ``stock_referencia`` y ``diferencia`` calculados en la BD"""
+    return conteo.detalles.annotate(
+        stock_referencia=_stock_referencia(),
+    ).annotate(
+        diferencia=ExpressionWrapper(F('cantidad_contada') - F('stock_referencia'), output_field=IntegerField()),
+    )
+
+
+def resumen_conteo(conteo):
+    """
+    Varianza de todo el conteo en una sola consulta agregada: productos
+    contados, con diferencia, unidades sobrantes y faltantes y su valor.
+    """
+    detalles = detalles_con_diferencia(conteo)
+    resumen = detalles.aggregate(
+        contados=Count('id'),
+        con_diferencia=Count('id', filter=~Q(diferencia=0)),
+        sobrantes=Coalesce(Sum('diferencia', filter=Q(diferencia__gt=0)), 0),
+        faltantes=Coalesce(Sum('diferencia', filter=Q(diferencia__lt=0)), 0),
+        valor_diferencia=Coalesce(
+            Sum(ExpressionWrapper(F('diferencia') * F('producto__precio'), output_field=DecimalField())),
+            0, output_field=DecimalField(),
+        ),
+    )
+    resumen['faltantes'] = -resumen['faltantes']
+    resumen['valor_diferencia'] = Decimal(resumen['valor_diferencia']).quantize(Decimal('0.01'))
+    resumen['en_alcance'] = conteo.productos_en_alcance().count()
+    resumen['pendientes'] = max(resumen['en_alcance'] - resumen['contados'], 0)
+    return resumen
+
+
+def productos_del_conteo(conteo):
+    """
+    Productos del conteo anotados con ``cantidad_contada`` (None si aún no se
+    contó), ``stock_referencia`` y ``diferencia``. Mientras está abierto
+    incluye todo el alcance; cerrado, solo lo contado con la foto de stock.
+    """
+    if conteo.abierto:
+        contado = DetalleConteo.objects.filter(conteo=conteo, producto=OuterRef('pk')).values('cantidad_contada')[:1]
+        productos = conteo.productos_en_alcance().annotate(
+            cantidad_contada=Subquery(contado, output_field=IntegerField()),
+            stock_referencia=F('stock_actual'),
+        )
+    else:
+        productos = Producto.objects.filter(detalles_conteo__conteo=conteo).annotate(
+            cantidad_contada=F('detalles_conteo__cantidad_contada'),
+            stock_referencia=F('detalles_conteo__stock_sistema'),
+        )
+    return productos.annotate(
+        diferencia=ExpressionWrapper(F('cantidad_contada') - F('stock_referencia'), output_field=IntegerField()),
+    )
+
+
+def _tipos_ajuste():
+    entrada, _ = TipoInventario.objects.get_or_create(
+        tipo_movimiento=TIPO_AJUSTE_CONTEO, direccion='ENTRADA',
+        defaults={'categoria_movimiento': 'Sobrante de conteo físico'},
+    )
+    salida, _ = TipoInventario.objects.get_or_create(
+        tipo_movimiento=TIPO_AJUSTE_CONTEO, direccion='SALIDA',
+        defaults={'categoria_movimiento': 'Faltante de conteo físico'},
+    )
+    return entrada, salida
+
+
+def aprobar_conteo(conteo, empleado=None):
+    """
+    Aprueba el conteo: fija el stock de cada producto contado en la cantidad
+    contada y registra los movimientos de ajuste, todo en una transacción.
+
+    La foto del stock del sistema se toma con un único UPDATE ... SELECT, los
+    ajustes se aplican con ``aplicar_deltas_stock`` y los movimientos se
+    insertan en bloque. Devuelve el número de movimientos registrados.
+    """
+    with transaction.atomic():
+        conteo = ConteoInventario.objects.select_for_update().get(pk=conteo.pk)
+        if not conteo.abierto:
+            raise ConteoCerrado(f'El conteo #{conteo.pk} ya está {conteo.get_estado_display().lower()}.')
+
+        conteo.detalles.update(stock_sistema=Subquery(
+            Producto.objects.filter(pk=OuterRef('producto_id')).values('stock_actual')[:1]
+        ))
+        diferencias = conteo.detalles.exclude(cantidad_contada=F('stock_sistema')).values_list(
+            'producto_id', 'cantidad_contada', 'stock_sistema'
+        )
+
+        entrada, salida = _tipos_ajuste()
+        empleado_id = empleado.pk if empleado is not None else None
+        ahora = timezone.now()
+        observacion = f'Conteo #{conteo.pk}: {conteo.descripcion}'[:200]
+        deltas = {}
+        movimientos = []
+        for producto_id, contado, sistema in diferencias.iterator(chunk_size=5000):
+            delta = contado - sistema
+            deltas[producto_id] = delta
+            tipo = entrada if delta > 0 else salida
+            movimientos.append((producto_id, tipo.pk, abs(delta), empleado_id, ahora, observacion))
+
+        aplicar_deltas_stock(deltas)
+        marcar_ultimo_movimiento(
+            [pk for pk, delta in deltas.items() if delta > 0],
+            [pk for pk, delta in deltas.items() if delta < 0],
+            ahora,
+        )
+        _costear_deltas(deltas, ahora)
+        insertar_en_bloque(MovimientoInventario, movimientos, CAMPOS_MOVIMIENTO)
+
+        conteo.estado = 'aprobado'
+        conteo.aprobado_por = empleado
+        conteo.fecha_cierre = ahora
+        conteo.save(update_fields=['estado', 'aprobado_por', 'fecha_cierre'])
+    return len(movimientos)
+
+
+# ==================== ANTIGÜEDAD DEL STOCK ====================
+
+def recalcular_ultimo_movimiento(productos=None):
+    """
+    Recalcula ``ultima_entrada`` y ``ultima_salida`` a partir del historial:
+    movimientos, compras recibidas y notas de entrega. Sin ``productos``
+    recorre todo el catálogo (para poblar los campos con datos existentes);
+    con una lista de ids se usa al anular una compra o una nota, que no son
+    movimientos nuevos sino que sacan uno del historial. Devuelve cuántos
+    productos cambiaron.
+    """
+    if productos is None:
+        return _recalcular_ultimo_movimiento(None)
+    return sum(_recalcular_ultimo_movimiento(lote) for lote in en_lotes(set(productos), TAMANO_CONSULTA))
+
+
+def _recalcular_ultimo_movimiento(ids):
+    entradas, salidas = {}, {}
+
+    def filtrar(consulta, campo='producto_id'):
+        return consulta if ids is None else consulta.filter(**{f'{campo}__in': ids})
+
+    def acumular(destino, pares):
+        for pk, fecha in pares:
+            if fecha is not None and (destino.get(pk) is None or fecha > destino[pk]):
+                destino[pk] = fecha
+
+    movimientos = filtrar(MovimientoInventario.objects).values('producto_id', 'tipo_inventario__direccion').annotate(
+        ultima=Max('fecha_movimiento'),
+    ).values_list('producto_id', 'tipo_inventario__direccion', 'ultima').order_by()
+    for pk, direccion, fecha in movimientos:
+        acumular(entradas if direccion == 'ENTRADA' else salidas, [(pk, fecha)])
+    acumular(entradas, filtrar(DetalleOrdenCompra.objects.filter(orden_compra__tipo='compra')).values('producto_id').annotate(
+        ultima=Max('orden_compra__fecha_registro'),
+    ).values_list('producto_id', 'ultima').order_by())
+    acumular(salidas, filtrar(DetalleNotaEntrega.objects).values('producto_id').annotate(
+        ultima=Max('nota_entrega__fecha_registro'),
+    ).values_list('producto_id', 'ultima').order_by())
+
+    cambios = [
+        Producto(pk=pk, ultima_entrada=entradas.get(pk), ultima_salida=salidas.get(pk))
+        for pk, entrada, salida in filtrar(Producto.objects, 'pk').values_list('pk', 'ultima_entrada', 'ultima_salida').iterator(chunk_size=5000)
+        if (entrada, salida) != (entradas.get(pk), salidas.get(pk))
+    ]
+    with transaction.atomic():
+        actualizar_en_bloque(Producto, cambios, ['ultima_entrada', 'ultima_salida'])
+    return len(cambios)
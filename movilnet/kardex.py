@@ -0,0 +1,214 @@
+"""
+Kardex (tarjeta de existencias) de un producto.
+
+Los eventos de stock vienen de tres tablas: movimientos de inventario,
+compras recibidas (con su costo unitario) y notas de entrega. Se unen con
+UNION ALL y las columnas acumuladas se calculan en la base de datos con
+funciones de ventana sobre el orden (fecha, origen, id):
+
+- saldo: existencia después de cada evento. Se parte de un saldo inicial
+  implícito (``stock_actual`` menos la suma de todos los eventos) para que el
+  último saldo coincida con el stock del producto aunque haya stock cargado
+  sin movimiento (alta del producto, devoluciones por anulación);
+- costo promedio: promedio ponderado perpetuo del stock en existencia, con
+  la misma regla que ``costeo``: cada compra lo lleva a
+  (saldo previo × promedio + cantidad × costo) / saldo, o al costo de la
+  compra si no había saldo o el promedio era desconocido; las salidas y las
+  entradas sin costo no lo cambian. Depende del saldo en cada evento, así
+  que no sale de una ventana: se calcula en Python al recorrer las filas en
+  orden, junto con el saldo valorizado a ese costo.
+
+La paginación es por cursor: el último (fecha, origen, id) mostrado y el
+costo promedio en ese punto. Cada página son dos consultas: una agregación
+sin ordenar que da el saldo anterior al cursor, y las ``limite`` filas
+siguientes (ORDER BY ... LIMIT, que no ordena el historial completo) sobre
+las que corre la ventana. Así un producto con cien mil eventos abre su
+primera página sin materializar la historia ni en Python ni en la ventana.
+El CSV recorre el historial completo con una sola ventana, leyendo con
+``fetchmany``.
+"""
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    TipoInventario, MovimientoInventario, OrdenCompra, DetalleOrdenCompra,
+    NotaEntrega, DetalleNotaEntrega,
+)
+
+TAMANO_PAGINA = 50
+
+DIEZMILESIMAS = Decimal('0.0001')
+
+ORIGEN_MOVIMIENTO, ORIGEN_COMPRA, ORIGEN_NOTA = 1, 2, 3
+ORIGENES = {
+    ORIGEN_MOVIMIENTO: 'Movimiento',
+    ORIGEN_COMPRA: 'Compra',
+    ORIGEN_NOTA: 'Nota de entrega',
+}
+
+COLUMNAS_CSV = [
+    'fecha', 'origen', 'documento', 'entrada', 'salida', 'costo_unitario',
+    'saldo', 'costo_promedio', 'valor_saldo',
+]
+
+
+def _sql_eventos(connection):
+    """UNION ALL de los eventos de stock de un producto (parámetro: producto_id tres veces)"""
+    qn = connection.ops.quote_name
+    mov, tipo = MovimientoInventario._meta, TipoInventario._meta
+    orden, detalle_oc = OrdenCompra._meta, DetalleOrdenCompra._meta
+    nota, detalle_ne = NotaEntrega._meta, DetalleNotaEntrega._meta
+
+    def col(opts, campo):
+        return f'{qn(opts.db_table)}.{qn(opts.get_field(campo).column)}'
+
+    return f"""
+        SELECT {col(mov, 'fecha_movimiento')} AS fecha, {ORIGEN_MOVIMIENTO} AS origen, {col(mov, 'id')} AS id,
+               {col(tipo, 'tipo_movimiento')} AS documento,
+               CASE WHEN {col(tipo, 'direccion')} = 'ENTRADA' THEN {col(mov, 'cantidad')}
+                    ELSE -{col(mov, 'cantidad')} END AS cantidad,
+               NULL AS costo
+        FROM {qn(mov.db_table)} INNER JOIN {qn(tipo.db_table)} ON {col(tipo, 'id')} = {col(mov, 'tipo_inventario')}
+        WHERE {col(mov, 'producto')} = %s
+        UNION ALL
+        SELECT {col(orden, 'fecha_registro')}, {ORIGEN_COMPRA}, {col(detalle_oc, 'id')},
+               {col(orden, 'numero_orden')}, {col(detalle_oc, 'cantidad')}, {col(detalle_oc, 'precio_unitario')}
+        FROM {qn(detalle_oc.db_table)} INNER JOIN {qn(orden.db_table)} ON {col(orden, 'id')} = {col(detalle_oc, 'orden_compra')}
+        WHERE {col(detalle_oc, 'producto')} = %s AND {col(orden, 'tipo')} = 'compra'
+        UNION ALL
+        SELECT {col(nota, 'fecha_registro')}, {ORIGEN_NOTA}, {col(detalle_ne, 'id')},
+               {col(nota, 'numero_entrega')}, -{col(detalle_ne, 'cantidad')}, NULL
+        FROM {qn(detalle_ne.db_table)} INNER JOIN {qn(nota.db_table)} ON {col(nota, 'id')} = {col(detalle_ne, 'nota_entrega')}
+        WHERE {col(detalle_ne, 'producto')} = %s
+    """
+
+
+# Cantidad acumulada por ventana (el saldo sin el inicial implícito)
+_VENTANA = 'SUM(cantidad) OVER w AS acumulado'
+_ORDEN = 'ORDER BY fecha, origen, id'
+_DEFINICION_VENTANA = f'WINDOW w AS ({_ORDEN} ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)'
+
+
+def _cursor(cursor):
+    """((fecha, origen, id), costo promedio o None) de un cursor de paginación"""
+    try:
+        fecha, origen, pk, promedio = cursor.rsplit('|', 3)
+        return (fecha, int(origen), int(pk)), Decimal(promedio) if promedio else None
+    except (ValueError, InvalidOperation):
+        raise ValueError('Cursor de paginación inválido.')
+
+
+_POSTERIOR = '(fecha > %s OR (fecha = %s AND (origen > %s OR (origen = %s AND id > %s))))'
+
+
+def _acumulados_previos(connection, producto, posicion):
+    """(total de todos los eventos, cantidad acumulada hasta ``posicion`` inclusive) en una sola agregación"""
+    if posicion is None:
+        previo, parametros = '1 = 0', []
+    else:
+        fecha, origen, pk = posicion
+        previo, parametros = f'NOT {_POSTERIOR}', [fecha, fecha, origen, origen, pk]
+    sql = f"""
+        WITH eventos AS ({_sql_eventos(connection)})
+        SELECT COALESCE(SUM(cantidad), 0),
+               COALESCE(SUM(CASE WHEN {previo} THEN cantidad END), 0)
+        FROM eventos
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [producto.pk] * 3 + parametros)
+        return cursor.fetchone()
+
+
+def _fecha(valor):
+    """Fecha de la fila tal como la devuelve el motor (en SQLite llega como texto o sin zona horaria)"""
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if settings.USE_TZ and timezone.is_naive(valor):
+        valor = timezone.make_aware(valor, dt_timezone.utc)
+    return valor
+
+
+def _a_decimal(valor, decimales='0.01'):
+    return None if valor is None else Decimal(str(valor)).quantize(Decimal(decimales))
+
+
+def _filas(producto, filas, base, promedio=None):
+    """
+    Convierte las filas SQL, en orden, en los diccionarios que usan la vista
+    y el CSV. ``promedio`` es el costo promedio antes de la primera fila.
+    """
+    total, cantidad_previa = base
+    for fecha, origen, pk, documento, cantidad, costo, acumulado in filas:
+        saldo = producto.stock_actual - total + cantidad_previa + acumulado
+        costo = _a_decimal(costo)
+        if costo is not None and cantidad > 0:
+            previo = saldo - cantidad
+            if previo <= 0 or not promedio:
+                promedio = costo
+            else:
+                promedio = ((previo * promedio + cantidad * costo) / saldo).quantize(DIEZMILESIMAS)
+        yield {
+            'fecha': _fecha(fecha),
+            'origen': ORIGENES[origen],
+            'documento': documento,
+            'entrada': cantidad if cantidad > 0 else None,
+            'salida': -cantidad if cantidad < 0 else None,
+            'costo_unitario': costo,
+            'saldo': saldo,
+            'costo_promedio': _a_decimal(promedio, '0.0001'),
+            'valor_saldo': _a_decimal(saldo * promedio) if promedio is not None else None,
+            'cursor': f'{fecha}|{origen}|{pk}|{promedio if promedio is not None else ""}',
+        }
+
+
+def pagina_kardex(producto, despues=None, limite=TAMANO_PAGINA):
+    """
+    Hasta ``limite`` eventos del kardex posteriores al cursor ``despues``.
+    Devuelve (filas, cursor de la página siguiente o None).
+    """
+    connection = connections[router.db_for_read(MovimientoInventario)]
+    posicion, promedio = _cursor(despues) if despues else (None, None)
+    base = _acumulados_previos(connection, producto, posicion)
+
+    condicion, parametros = '', []
+    if posicion is not None:
+        fecha, origen, pk = posicion
+        condicion, parametros = f'WHERE {_POSTERIOR}', [fecha, fecha, origen, origen, pk]
+    sql = f"""
+        WITH eventos AS ({_sql_eventos(connection)}),
+        pagina AS (SELECT * FROM eventos {condicion} {_ORDEN} LIMIT %s)
+        SELECT fecha, origen, id, documento, cantidad, costo, {_VENTANA}
+        FROM pagina {_DEFINICION_VENTANA} {_ORDEN}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [producto.pk] * 3 + parametros + [limite + 1])
+        filas = list(_filas(producto, cursor.fetchall(), base, promedio))
+    siguiente = filas[limite - 1]['cursor'] if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+
+def iterar_kardex(producto, lote=2000):
+    """Recorre el kardex completo en orden con una sola ventana, leyendo de a ``lote`` filas"""
+    connection = connections[router.db_for_read(MovimientoInventario)]
+    base = _acumulados_previos(connection, producto, None)
+    sql = f"""
+        WITH eventos AS ({_sql_eventos(connection)})
+        SELECT fecha, origen, id, documento, cantidad, costo, {_VENTANA}
+        FROM eventos {_DEFINICION_VENTANA} {_ORDEN}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [producto.pk] * 3)
+
+        def leer():
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    return
+                yield from filas
+
+        yield from _filas(producto, leer(), base)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet import replica
+
+
+class Command(BaseCommand):
+    help = 'Copia la base principal a la réplica de solo lectura de los reportes (REPLICA_ALIAS)'
+
+    def handle(self, *args, **options):
+        if not replica.es_copia_sqlite():
+            raise CommandError('La réplica no es una copia SQLite mantenida por la aplicación.')
+        segundos = replica.actualizar()
+        tamano = replica.ruta().stat().st_size / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(f'Réplica actualizada en {segundos:.2f} s ({tamano:.1f} MiB)'))
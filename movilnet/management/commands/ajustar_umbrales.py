@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.models import Producto, Marca
+from movilnet.umbrales import (
+    calcular_umbrales, vista_previa, aplicar_umbrales,
+    NIVEL_SERVICIO, DIAS_ENTREGA, DIAS_REVISION, DIAS_HISTORIAL,
+)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula stock mínimo y máximo de los productos según su demanda y un nivel de servicio objetivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nivel-servicio', type=float, default=NIVEL_SERVICIO,
+                            help=f'Probabilidad objetivo de no quedarse sin stock (por defecto {NIVEL_SERVICIO})')
+        parser.add_argument('--dias-entrega', type=int, default=DIAS_ENTREGA, help=f'Tiempo de reposición (por defecto {DIAS_ENTREGA})')
+        parser.add_argument('--dias-revision', type=int, default=DIAS_REVISION, help=f'Días que debe cubrir el máximo (por defecto {DIAS_REVISION})')
+        parser.add_argument('--dias-historial', type=int, default=DIAS_HISTORIAL,
+                            help=f'Historial usado si el producto no tiene pronóstico (por defecto {DIAS_HISTORIAL})')
+        parser.add_argument('--marca', help='Limitar el ajuste a una marca (nombre)')
+        parser.add_argument('--incluir-sin-demanda', action='store_true', help='Ajustar también productos sin demanda registrada')
+        parser.add_argument('--simular', action='store_true', help='Solo mostrar la vista previa, sin aplicar cambios')
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.filter(estado=True)
+        if options['marca']:
+            try:
+                productos = productos.filter(marca=Marca.objects.get(nombre_marca__iexact=options['marca']))
+            except Marca.DoesNotExist:
+                raise CommandError(f'No existe la marca "{options["marca"]}".')
+
+        try:
+            calculo = calcular_umbrales(
+                productos, nivel_servicio=options['nivel_servicio'],
+                dias_entrega=options['dias_entrega'], dias_revision=options['dias_revision'],
+                dias_historial=options['dias_historial'], incluir_sin_demanda=options['incluir_sin_demanda'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        cambios = int(calculo['cambia'].sum())
+        self.stdout.write(f'{len(calculo["ids"])} productos evaluados, {cambios} con umbrales nuevos')
+        for fila in vista_previa(calculo, limite=20):
+            self.stdout.write(
+                f'  {fila["producto"].nombre}: mín {fila["minimo_actual"]} → {fila["minimo"]}, '
+                f'máx {fila["maximo_actual"]} → {fila["maximo"]} (demanda {fila["demanda"]:.2f}/día)'
+            )
+        if options['simular'] or not cambios:
+            return
+
+        aplicados = aplicar_umbrales(calculo)
+        self.stdout.write(self.style.SUCCESS(f'{aplicados} productos actualizados; valores anteriores guardados en el historial'))
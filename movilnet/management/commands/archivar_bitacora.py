@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movilnet.bitacora import archivar_mes
+from movilnet.models import Bitacora
+
+
+class Command(BaseCommand):
+    help = 'Mueve los meses antiguos de la bitácora a archivos JSONL comprimidos (gzip)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=6,
+                            help='Meses completos que se conservan en la base de datos (por defecto 6)')
+        parser.add_argument('--lote', type=int, default=5000, help='Registros por lote al leer y borrar')
+        parser.add_argument('--simular', action='store_true', help='Solo muestra qué meses se archivarían')
+
+    def handle(self, *args, **options):
+        hoy = date.today()
+        # Índice (año * 12 + mes) del mes más antiguo que se conserva
+        corte = hoy.year * 12 + (hoy.month - 1) - options['meses']
+
+        # El registro más antiguo sale del índice por fecha, sin recorrer la tabla
+        primero = Bitacora.objects.order_by('fecha_hora').values_list('fecha_hora', flat=True).first()
+        if primero is None:
+            self.stdout.write('La bitácora está vacía.')
+            return
+        primero = timezone.localtime(primero)
+        indice = primero.year * 12 + (primero.month - 1)
+        if indice >= corte:
+            self.stdout.write('No hay meses anteriores al período de retención.')
+            return
+
+        for i in range(indice, corte):
+            anio, mes = i // 12, i % 12 + 1
+            if options['simular']:
+                self.stdout.write(f'Se archivaría {anio:04d}-{mes:02d}')
+                continue
+            total = archivar_mes(anio, mes, lote=options['lote'])
+            if total:
+                self.stdout.write(self.style.SUCCESS(f'{anio:04d}-{mes:02d}: {total} registros archivados'))
@@ -0,0 +1,135 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from movilnet import costeo
+from movilnet.bitacora import obtener_escritor
+from movilnet.coordinador import CoordinadorEscritura
+from movilnet.escritura import ejecutar_con_reintentos, es_bloqueo
+from movilnet.models import Producto, TipoInventario, MovimientoInventario
+
+MODOS = ('diferido', 'reintentos', 'coordinado')
+
+
+def entrada_de_stock(producto_id, tipo_id):
+    """Lo que hace un movimiento de entrada: leer, sumar stock, registrar el movimiento y costearlo"""
+    with transaction.atomic():
+        Producto.objects.filter(pk=producto_id).values_list('stock_actual', flat=True).get()
+        Producto.objects.filter(pk=producto_id).update(stock_actual=F('stock_actual') + 1, ultima_entrada=timezone.now())
+        MovimientoInventario.objects.create(
+            producto_id=producto_id, tipo_inventario_id=tipo_id, cantidad=1, observaciones='benchmark',
+        )
+        costeo.registrar_entradas([(producto_id, 1, None, None)])
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento de las escrituras de stock concurrentes en SQLite sobre una copia de la BD: '
+        'transacciones normales, con reintentos (IMMEDIATE) y con el escritor único con confirmación en grupo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Peticiones simultáneas (por defecto 8)')
+        parser.add_argument('--operaciones', type=int, default=50, help='Movimientos por hilo (por defecto 50)')
+        parser.add_argument('--modos', default=','.join(MODOS), help=f'Modos a medir, separados por comas ({", ".join(MODOS)})')
+        parser.add_argument('--grupo', type=int, default=32, help='Comandos por transacción en el modo coordinado')
+        parser.add_argument('--timeout', type=float, default=5.0, help='Espera de SQLite por el bloqueo, en segundos')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('El benchmark es para instalaciones con SQLite.')
+        modos = [m.strip() for m in options['modos'].split(',') if m.strip()]
+        for modo in modos:
+            if modo not in MODOS:
+                raise CommandError(f'Modo desconocido: {modo}.')
+
+        tipo_id = TipoInventario.objects.filter(direccion='ENTRADA').values_list('pk', flat=True).first()
+        productos = list(Producto.objects.filter(estado=True).values_list('pk', flat=True)[:200])
+        if tipo_id is None or not productos:
+            raise CommandError('Se necesita al menos un tipo de inventario de entrada y un producto activo.')
+
+        ajustes = connection.settings_dict
+        original, opciones = ajustes['NAME'], dict(ajustes.get('OPTIONS', {}))
+        with tempfile.TemporaryDirectory() as carpeta:
+            copia = Path(carpeta) / 'benchmark.sqlite3'
+            self.stdout.write('Copiando la base de datos...')
+            with sqlite3.connect(original) as origen, sqlite3.connect(copia) as destino:
+                origen.backup(destino)
+            connections.close_all()
+            ajustes['NAME'] = str(copia)
+            ajustes['OPTIONS'] = dict(opciones, timeout=options['timeout'])
+            try:
+                self.stdout.write(f'{options["hilos"]} hilos x {options["operaciones"]} movimientos\n')
+                self.stdout.write(f'{"modo":<12}{"ok":>7}{"errores":>9}{"op/s":>9}{"p50 ms":>9}{"p95 ms":>9}  otros')
+                for modo in modos:
+                    self._medir(modo, productos, tipo_id, options)
+            finally:
+                # Los eventos de bitácora del benchmark se escriben en la copia, no en la BD real
+                obtener_escritor().detener()
+                connections.close_all()
+                ajustes['NAME'], ajustes['OPTIONS'] = original, opciones
+
+    def _medir(self, modo, productos, tipo_id, options):
+        coordinador = None
+        if modo == 'coordinado':
+            coordinador = CoordinadorEscritura(tamano_grupo=options['grupo'])
+            coordinador.iniciar()
+        latencias, errores = [], []
+        candado = threading.Lock()
+        reintentos_antes = _reintentos()
+
+        def trabajador(semilla):
+            azar = random.Random(semilla)
+            for _ in range(options['operaciones']):
+                producto_id = azar.choice(productos)
+                inicio = time.perf_counter()
+                try:
+                    if modo == 'diferido':
+                        entrada_de_stock(producto_id, tipo_id)
+                    elif modo == 'reintentos':
+                        ejecutar_con_reintentos(entrada_de_stock, producto_id, tipo_id, operacion='benchmark')
+                    else:
+                        coordinador.enviar(entrada_de_stock, producto_id, tipo_id).result()
+                except OperationalError as e:
+                    with candado:
+                        errores.append('bloqueo' if es_bloqueo(e) else str(e))
+                    continue
+                with candado:
+                    latencias.append(time.perf_counter() - inicio)
+            close_old_connections()
+            connection.close()
+
+        hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(options['hilos'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+
+        otros = ''
+        if coordinador is not None:
+            coordinador.detener()
+            otros = f'{coordinador.comandos / max(coordinador.grupos, 1):.1f} comandos por transacción'
+        elif modo == 'reintentos':
+            otros = f'{_reintentos() - reintentos_antes} reintentos'
+        latencias.sort()
+        p50 = statistics.median(latencias) * 1000 if latencias else 0
+        p95 = latencias[int(len(latencias) * 0.95) - 1] * 1000 if latencias else 0
+        self.stdout.write(
+            f'{modo:<12}{len(latencias):>7}{len(errores):>9}{len(latencias) / total:>9.1f}{p50:>9.1f}{p95:>9.1f}  {otros}'
+        )
+
+
+def _reintentos():
+    from movilnet.escritura import metricas
+    return metricas().get('benchmark', {}).get('reintentos', 0)
@@ -0,0 +1,149 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, F, Sum
+from django.test.utils import override_settings
+
+from movilnet.bitacora import obtener_escritor
+from movilnet.escritura import ejecutar_con_reintentos
+from movilnet.models import Producto, TipoInventario, MovimientoInventario
+
+from .benchmark_escritura import entrada_de_stock
+
+PERFILES = ('antes', 'despues')
+
+
+def leer_reporte():
+    """Lo que lee un reporte de inventario: todas las filas de productos y un agregado de movimientos"""
+    with transaction.atomic():
+        filas = list(Producto.objects.filter(estado=True).values_list('pk', 'stock_actual', 'precio'))
+        Producto.objects.filter(estado=True).aggregate(valor=Sum(F('stock_actual') * F('precio')))
+        list(MovimientoInventario.objects.values('tipo_inventario').annotate(total=Count('id')))
+    return len(filas)
+
+
+def _percentil(valores, p):
+    return valores[max(int(len(valores) * p) - 1, 0)] * 1000 if valores else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara lecturas de reportes y escrituras de stock simultáneas en SQLite con la configuración '
+        'por defecto (antes) y con el perfil de producción SQLITE_PRAGMAS (después), sobre copias de la BD'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=4, help='Hilos que leen reportes (por defecto 4)')
+        parser.add_argument('--escritores', type=int, default=4, help='Hilos que registran entradas (por defecto 4)')
+        parser.add_argument('--segundos', type=float, default=10.0, help='Duración de cada medición')
+        parser.add_argument('--perfiles', default=','.join(PERFILES), help='Perfiles a medir (antes, despues)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('El benchmark es para instalaciones con SQLite.')
+        perfiles = [p.strip() for p in options['perfiles'].split(',') if p.strip()]
+        for perfil in perfiles:
+            if perfil not in PERFILES:
+                raise CommandError(f'Perfil desconocido: {perfil}.')
+
+        tipo_id = TipoInventario.objects.filter(direccion='ENTRADA').values_list('pk', flat=True).first()
+        productos = list(Producto.objects.filter(estado=True).values_list('pk', flat=True)[:200])
+        if tipo_id is None or not productos:
+            raise CommandError('Se necesita al menos un tipo de inventario de entrada y un producto activo.')
+
+        ajustes = connection.settings_dict
+        original, opciones = ajustes['NAME'], dict(ajustes.get('OPTIONS', {}))
+        with tempfile.TemporaryDirectory() as carpeta:
+            self.stdout.write(
+                f'{options["lectores"]} lectores y {options["escritores"]} escritores durante {options["segundos"]} s\n'
+            )
+            self.stdout.write(
+                f'{"perfil":<9}{"lect/s":>8}{"p95 ms":>9}{"escr/s":>8}{"p95 ms":>9}{"errores":>9}  pragmas'
+            )
+            try:
+                for perfil in perfiles:
+                    copia = Path(carpeta) / f'{perfil}.sqlite3'
+                    connections.close_all()
+                    with sqlite3.connect(original) as origen, sqlite3.connect(copia) as destino:
+                        origen.backup(destino)
+                        if perfil == 'antes':
+                            destino.execute('PRAGMA journal_mode = DELETE')
+                    ajustes['NAME'] = str(copia)
+                    if perfil == 'antes':
+                        ajustes['OPTIONS'] = {}
+                        pragmas = {}
+                    else:
+                        ajustes['OPTIONS'] = dict(opciones)
+                        pragmas = settings.SQLITE_PRAGMAS
+                    with override_settings(SQLITE_PRAGMAS=pragmas, SQLITE_INTERVALO_ANALYZE=0):
+                        self._medir(perfil, productos, tipo_id, options)
+                        # Los eventos de bitácora del benchmark se escriben en la copia, no en la BD real
+                        obtener_escritor().detener()
+                        connections.close_all()
+            finally:
+                connections.close_all()
+                ajustes['NAME'], ajustes['OPTIONS'] = original, opciones
+
+    def _medir(self, perfil, productos, tipo_id, options):
+        lecturas, escrituras, errores = [], [], []
+        candado = threading.Lock()
+        fin = time.monotonic() + options['segundos']
+
+        def lector():
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                try:
+                    leer_reporte()
+                except OperationalError:
+                    with candado:
+                        errores.append('lectura')
+                    continue
+                with candado:
+                    lecturas.append(time.perf_counter() - inicio)
+            connection.close()
+
+        def escritor(semilla):
+            azar = random.Random(semilla)
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                try:
+                    ejecutar_con_reintentos(entrada_de_stock, azar.choice(productos), tipo_id, operacion='benchmark')
+                except OperationalError:
+                    with candado:
+                        errores.append('escritura')
+                    continue
+                with candado:
+                    escrituras.append(time.perf_counter() - inicio)
+            connection.close()
+
+        hilos = [threading.Thread(target=lector) for _ in range(options['lectores'])]
+        hilos += [threading.Thread(target=escritor, args=(i,)) for i in range(options['escritores'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+        lecturas.sort()
+        escrituras.sort()
+        self.stdout.write(
+            f'{perfil:<9}{len(lecturas) / total:>8.1f}{_percentil(lecturas, 0.95):>9.1f}'
+            f'{len(escrituras) / total:>8.1f}{_percentil(escrituras, 0.95):>9.1f}{len(errores):>9}'
+            f'  journal_mode={journal} synchronous={synchronous}'
+        )
+        if lecturas:
+            self.stdout.write(f'{"":<9}mediana lectura {statistics.median(lecturas) * 1000:.1f} ms')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.clasificacion import clasificar_abc, DIAS_VENTAS, CORTE_A, CORTE_B
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la clasificación ABC de los productos activos por valor vendido y por valor en stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_VENTAS, help=f'Días de ventas a considerar (por defecto {DIAS_VENTAS})')
+        parser.add_argument('--corte-a', type=float, default=CORTE_A, help=f'Participación acumulada de la clase A (por defecto {CORTE_A})')
+        parser.add_argument('--corte-b', type=float, default=CORTE_B, help=f'Participación acumulada hasta la clase B (por defecto {CORTE_B})')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            resumen = clasificar_abc(dias=options['dias'], corte_a=options['corte_a'], corte_b=options['corte_b'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for criterio in ('ventas', 'inventario'):
+            detalle = ', '.join(
+                f'{clase}: {cantidad} ({participacion:.0%})'
+                for clase, (cantidad, participacion) in resumen[criterio].items()
+            )
+            self.stdout.write(f'  Por {criterio}: {detalle}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['actualizados']} productos cambiaron de clase ({time.monotonic() - inicio:.1f}s)"
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.models import Proveedor, Marca
+from movilnet.reposicion import calcular_reposicion, sugerencias, generar_ordenes
+
+
+class Command(BaseCommand):
+    help = 'Calcula la reposición de todo el catálogo y genera órdenes de compra con las cantidades sugeridas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proveedor', help='RIF del proveedor al que se emiten las órdenes')
+        parser.add_argument('--dias-consumo', type=int, default=30, help='Días de historial de consumo (por defecto 30)')
+        parser.add_argument('--dias-entrega', type=int, default=7, help='Tiempo de entrega del proveedor en días (por defecto 7)')
+        parser.add_argument('--marca', help='Limitar el cálculo a una marca (nombre)')
+        parser.add_argument('--por-marca', action='store_true', help='Generar una orden por marca')
+        parser.add_argument('--simular', action='store_true', help='Solo mostrar el resumen, sin crear órdenes')
+
+    def handle(self, *args, **options):
+        marca = None
+        if options['marca']:
+            try:
+                marca = Marca.objects.get(nombre_marca__iexact=options['marca'])
+            except Marca.DoesNotExist:
+                raise CommandError(f'No existe la marca "{options["marca"]}".')
+
+        calculo = calcular_reposicion(
+            dias_consumo=options['dias_consumo'], dias_entrega=options['dias_entrega'],
+            marca=marca.pk if marca else None,
+        )
+        indices = sugerencias(calculo)
+        self.stdout.write(
+            f'{len(calculo["ids"])} productos evaluados, {len(indices)} por reponer '
+            f'({int(calculo["sugerido"].sum())} unidades)'
+        )
+        if options['simular'] or not len(indices):
+            return
+
+        if not options['proveedor']:
+            raise CommandError('Indica el proveedor con --proveedor para generar las órdenes.')
+        try:
+            proveedor = Proveedor.objects.get(rif=options['proveedor'])
+        except Proveedor.DoesNotExist:
+            raise CommandError(f'No existe un proveedor con RIF {options["proveedor"]}.')
+
+        ordenes = generar_ordenes(calculo, proveedor, por_marca=options['por_marca'])
+        for orden in ordenes:
+            self.stdout.write(f'  {orden.numero_orden}: {orden.detalles.count()} líneas, total {orden.total}')
+        self.stdout.write(self.style.SUCCESS(f'{len(ordenes)} órdenes de compra generadas'))
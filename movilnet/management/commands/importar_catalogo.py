@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.bitacora import registrar_en_bitacora, ACCION_IMPORTAR
+from movilnet.importacion import IMPORTADORES, TAMANO_LOTE, importar_catalogo, escribir_reporte_errores
+
+
+class Command(BaseCommand):
+    help = 'Importa productos, clientes o proveedores desde un archivo CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('catalogo', choices=sorted(IMPORTADORES))
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx (la primera fila es el encabezado)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por lote')
+        parser.add_argument('--no-actualizar', action='store_true',
+                            help='No modificar registros existentes (se reportan como error)')
+        parser.add_argument('--no-crear-marcas', action='store_true',
+                            help='Productos: rechazar filas cuya marca no exista')
+        parser.add_argument('--errores', help='Ruta del CSV donde escribir el reporte de errores por fila')
+
+    def handle(self, *args, **options):
+        try:
+            resultado = importar_catalogo(
+                options['catalogo'], options['archivo'],
+                actualizar=not options['no_actualizar'],
+                crear_marcas=not options['no_crear_marcas'],
+                tamano_lote=options['lote'],
+            )
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        registrar_en_bitacora(
+            None, IMPORTADORES[options['catalogo']].modelo._meta.object_name, ACCION_IMPORTAR, 0,
+            f'{resultado.creados} creados, {resultado.actualizados} actualizados, '
+            f'{len(resultado.errores)} errores ({options["archivo"]})',
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.creados} creados, {resultado.actualizados} actualizados, '
+            f'{resultado.sin_cambios} sin cambios, {len(resultado.errores)} con errores'
+        ))
+        if resultado.errores:
+            if options['errores']:
+                with open(options['errores'], 'w', newline='', encoding='utf-8') as salida:
+                    escribir_reporte_errores(resultado.errores, salida)
+                self.stdout.write(f'Reporte de errores: {options["errores"]}')
+            else:
+                for fila, mensaje in resultado.errores[:20]:
+                    self.stdout.write(self.style.WARNING(f'Fila {fila}: {mensaje}'))
+                if len(resultado.errores) > 20:
+                    self.stdout.write('... use --errores para obtener el reporte completo')
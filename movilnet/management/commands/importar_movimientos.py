@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.bitacora import registrar_en_bitacora, ACCION_IMPORTAR
+from movilnet.importacion import leer_filas, escribir_reporte_errores, ErrorFila
+from movilnet.inventario import importar_movimientos
+from movilnet.models import PerfilEmpleado
+
+
+class Command(BaseCommand):
+    help = 'Registra movimientos de inventario en lote desde un CSV o XLSX (producto, tipo, cantidad, observaciones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx')
+        parser.add_argument('--modo', choices=['todo', 'fila'], default='todo',
+                            help='todo: cualquier error cancela el lote; fila: se omiten las filas con error')
+        parser.add_argument('--usuario', help='Cédula del empleado al que se atribuyen los movimientos')
+        parser.add_argument('--errores', help='Ruta del CSV donde escribir el reporte de errores por fila')
+
+    def handle(self, *args, **options):
+        empleado = None
+        if options['usuario']:
+            try:
+                empleado = PerfilEmpleado.objects.get(user__username=options['usuario'])
+            except PerfilEmpleado.DoesNotExist:
+                raise CommandError(f'No existe un empleado con cédula {options["usuario"]}.')
+
+        try:
+            resultado = importar_movimientos(
+                leer_filas(options['archivo']), empleado=empleado,
+                todo_o_nada=options['modo'] == 'todo',
+            )
+        except (OSError, ErrorFila, UnicodeDecodeError) as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        if resultado.creados:
+            registrar_en_bitacora(
+                empleado, 'MovimientoInventario', ACCION_IMPORTAR, 0,
+                f'{resultado.creados} movimientos importados ({options["archivo"]})',
+            )
+
+        if resultado.errores and options['modo'] == 'todo':
+            self.stdout.write(self.style.ERROR(
+                f'Lote rechazado: {len(resultado.errores)} filas con error. No se registró ningún movimiento.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{resultado.creados} movimientos registrados, {len(resultado.errores)} filas omitidas'
+            ))
+        if resultado.errores:
+            if options['errores']:
+                with open(options['errores'], 'w', newline='', encoding='utf-8') as salida:
+                    escribir_reporte_errores(resultado.errores, salida)
+                self.stdout.write(f'Reporte de errores: {options["errores"]}')
+            else:
+                for fila, mensaje in resultado.errores[:20]:
+                    self.stdout.write(self.style.WARNING(f'Fila {fila}: {mensaje}'))
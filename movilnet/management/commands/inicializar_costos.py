@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.costeo import inicializar_costos
+
+
+class Command(BaseCommand):
+    help = ('Reinicia el costeo del inventario: costo promedio desde el historial de compras '
+            'y una capa FIFO inicial con el stock actual de cada producto')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confirmar', action='store_true', help='Requerido: borra las capas FIFO existentes')
+
+    def handle(self, *args, **options):
+        if not options['confirmar']:
+            raise CommandError('Este comando borra las capas de costo existentes; repítalo con --confirmar.')
+        inicio = time.monotonic()
+        con_costo = inicializar_costos()
+        self.stdout.write(self.style.SUCCESS(
+            f'{con_costo} productos quedaron con costo ({time.monotonic() - inicio:.1f}s)'
+        ))
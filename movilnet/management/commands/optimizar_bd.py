@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from movilnet.pragmas import analizar, checkpoint, estado
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresca las estadísticas del planificador de SQLite (ANALYZE) y trunca el WAL. '
+        'Pensado para cron, p. ej. cada noche.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='ANALYZE de todas las filas (más lento)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias de la base de datos')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'sqlite':
+            raise CommandError('El comando es para bases de datos SQLite.')
+        analizar(using, completo=options['completo'])
+        self.stdout.write(self.style.SUCCESS('Estadísticas del planificador actualizadas'))
+        pragmas = estado(using)
+        if pragmas['journal_mode'] == 'wal':
+            ocupado, paginas, copiadas = checkpoint(using)
+            if ocupado:
+                self.stdout.write(self.style.WARNING(f'WAL en uso: {copiadas} de {paginas} páginas copiadas'))
+            else:
+                self.stdout.write(self.style.SUCCESS('WAL copiado a la base de datos y truncado'))
+        self.stdout.write(', '.join(f'{nombre}={valor}' for nombre, valor in pragmas.items()))
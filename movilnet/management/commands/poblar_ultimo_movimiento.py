@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movilnet.inventario import recalcular_ultimo_movimiento
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la fecha de última entrada y última salida de cada producto a partir del historial'
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        cambiados = recalcular_ultimo_movimiento()
+        self.stdout.write(self.style.SUCCESS(
+            f'{cambiados} productos actualizados en {time.monotonic() - inicio:.1f}s'
+        ))
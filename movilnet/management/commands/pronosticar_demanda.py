@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.pronostico import actualizar_pronosticos, DIAS_HISTORIAL, HORIZONTE, ALFA, TAMANO_BLOQUE
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el pronóstico de demanda de todos los productos activos a partir del historial de salidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_HISTORIAL, help=f'Días de historial (por defecto {DIAS_HISTORIAL})')
+        parser.add_argument('--horizonte', type=int, default=HORIZONTE, help=f'Días a pronosticar (por defecto {HORIZONTE})')
+        parser.add_argument('--alfa', type=float, default=ALFA, help=f'Constante del suavizado exponencial (por defecto {ALFA})')
+        parser.add_argument('--sin-estacionalidad', action='store_true', help='No evaluar el modelo con estacionalidad semanal')
+        parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE, help='Productos por bloque de cálculo')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            resumen = actualizar_pronosticos(
+                dias=options['dias'], horizonte=options['horizonte'], alfa=options['alfa'],
+                estacional=not options['sin_estacionalidad'], tamano_bloque=options['bloque'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for metodo, cantidad in resumen.items():
+            self.stdout.write(f'  {metodo}: {cantidad}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(resumen.values())} pronósticos actualizados en {time.monotonic() - inicio:.1f}s'
+        ))
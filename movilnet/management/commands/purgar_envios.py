@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movilnet.idempotencia import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de envío de formularios ya vencidas (IDEMPOTENCIA_VIGENCIA_SEGUNDOS)'
+
+    def handle(self, *args, **options):
+        borradas = purgar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'{borradas} claves vencidas borradas'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movilnet.reservas import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra las reservas de stock vencidas (RESERVAS_VIGENCIA_SEGUNDOS)'
+
+    def handle(self, *args, **options):
+        borradas = purgar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'{borradas} reservas vencidas borradas'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from movilnet.respaldo import RespaldoInvalido, podar, respaldar
+
+
+class Command(BaseCommand):
+    help = (
+        'Respalda la base SQLite en caliente con la API de backup (por pasos, sin detener a los escritores), '
+        'verifica la copia y la comprime en RESPALDO_DIR. Pensado para cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Carpeta de destino (por defecto RESPALDO_DIR)')
+        parser.add_argument('--nivel', type=int, default=6, choices=range(1, 10), help='Nivel de gzip (1-9)')
+        parser.add_argument('--sin-verificar', action='store_true', help='No ejecutar integrity_check sobre la copia')
+        parser.add_argument('--conservar', type=int, help='Borrar los respaldos más antiguos y dejar solo N')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias de la base de datos')
+
+    def handle(self, *args, **options):
+        if connections[options['database']].vendor != 'sqlite':
+            raise CommandError('El comando es para bases de datos SQLite.')
+        try:
+            resultado = respaldar(
+                using=options['database'], carpeta=options['dir'], nivel=options['nivel'],
+                verificar_integridad=not options['sin_verificar'],
+            )
+        except RespaldoInvalido as e:
+            raise CommandError(f'La copia no pasó la verificación de integridad: {e}')
+        mib = 1024 * 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Respaldo {resultado["archivo"]}: {resultado["tamano"] / mib:.1f} MiB -> '
+            f'{resultado["comprimido"] / mib:.1f} MiB en {resultado["segundos"]:.2f} s'
+            f' ({resultado["reinicios"]} reinicios por escrituras concurrentes)'
+        ))
+        if options['conservar']:
+            for archivo in podar(options['conservar'], options['dir']):
+                self.stdout.write(f'Borrado {archivo.name}')
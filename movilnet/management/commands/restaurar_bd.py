@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.respaldo import RespaldoInvalido, respaldos, restaurar
+
+
+class Command(BaseCommand):
+    help = (
+        'Restaura un respaldo de respaldar_bd en una base nueva (staging, pruebas de carga) '
+        'o, con --database y --reemplazar, sobre la base configurada con la aplicación detenida'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', nargs='?', help='Respaldo a restaurar (por defecto el más reciente de RESPALDO_DIR)')
+        destino = parser.add_mutually_exclusive_group(required=True)
+        destino.add_argument('--destino', help='Ruta del archivo SQLite a crear')
+        destino.add_argument('--database', help='Alias de DATABASES cuyo archivo se reemplaza')
+        parser.add_argument('--reemplazar', action='store_true', help='Sobrescribir el destino si ya existe')
+
+    def handle(self, *args, **options):
+        if options['archivo']:
+            archivo = Path(options['archivo'])
+            if not archivo.is_file():
+                raise CommandError(f'No existe el respaldo {archivo}.')
+        else:
+            disponibles = respaldos()
+            if not disponibles:
+                raise CommandError('No hay respaldos en RESPALDO_DIR.')
+            archivo = disponibles[0]
+
+        if options['database']:
+            ajustes = settings.DATABASES.get(options['database'])
+            if ajustes is None or ajustes['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'"{options["database"]}" no es una base de datos SQLite configurada.')
+            destino = Path(ajustes['NAME'])
+        else:
+            destino = Path(options['destino'])
+
+        try:
+            segundos = restaurar(archivo, destino, reemplazar=options['reemplazar'])
+        except FileExistsError:
+            raise CommandError(f'{destino} ya existe; usa --reemplazar para sobrescribirlo.')
+        except RespaldoInvalido as e:
+            raise CommandError(f'El respaldo está dañado: {e}')
+        self.stdout.write(self.style.SUCCESS(f'{archivo.name} restaurado en {destino} en {segundos:.2f} s'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movilnet.riesgo import (
+    simular_riesgo, HORIZONTE, SIMULACIONES, DIAS_HISTORIAL, DIAS_ENTREGA, DIAS_TRANSITO,
+)
+
+
+class Command(BaseCommand):
+    help = 'Simula (Monte Carlo) la probabilidad de quiebre de stock de todos los productos activos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizonte', type=int, default=HORIZONTE, help=f'Días a simular (por defecto {HORIZONTE})')
+        parser.add_argument('--simulaciones', type=int, default=SIMULACIONES, help=f'Trayectorias por producto (por defecto {SIMULACIONES})')
+        parser.add_argument('--dias-historial', type=int, default=DIAS_HISTORIAL, help=f'Días de consumo de los que se muestrea la demanda (por defecto {DIAS_HISTORIAL})')
+        parser.add_argument('--dias-entrega', type=int, default=DIAS_ENTREGA, help=f'Días que tarda en llegar una orden de compra (por defecto {DIAS_ENTREGA})')
+        parser.add_argument('--dias-transito', type=int, default=DIAS_TRANSITO, help=f'Antigüedad máxima de las órdenes pendientes (por defecto {DIAS_TRANSITO})')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos de cálculo (por defecto, uno por núcleo; 1 = sin paralelismo)')
+        parser.add_argument('--semilla', type=int, default=None, help='Semilla aleatoria, para resultados reproducibles')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            resumen = simular_riesgo(
+                horizonte=options['horizonte'], simulaciones=options['simulaciones'],
+                dias_historial=options['dias_historial'], dias_entrega=options['dias_entrega'],
+                dias_transito=options['dias_transito'], semilla=options['semilla'], procesos=options['procesos'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"  {resumen['simulados']} de {resumen['evaluados']} productos simulados; "
+            f"{resumen['con_riesgo']} con riesgo de quiebre, {resumen['riesgo_alto']} por encima del 50%"
+        )
+        self.stdout.write(self.style.SUCCESS(f'Riesgo de quiebre actualizado en {time.monotonic() - inicio:.1f}s'))
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 06:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0006_remove_cotizacion_reestructurar_ordencompra'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bitacora',
+            name='fecha_hora',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha y Hora'),
+        ),
+    ]
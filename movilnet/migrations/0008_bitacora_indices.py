@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0007_bitacora_fecha_hora_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['-fecha_hora', '-id'], name='bitacora_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['empleado', '-fecha_hora'], name='bitacora_empleado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['tabla_afectada', '-fecha_hora'], name='bitacora_tabla_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['accion_realizada', '-fecha_hora'], name='bitacora_accion_idx'),
+        ),
+    ]
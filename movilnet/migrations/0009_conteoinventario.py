@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-19 07:00
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0008_bitacora_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descripcion', models.CharField(max_length=200, verbose_name='Descripción')),
+                ('estado', models.CharField(choices=[('abierto', 'Abierto'), ('aprobado', 'Aprobado'), ('cancelado', 'Cancelado')], default='abierto', max_length=10, verbose_name='Estado')),
+                ('observaciones', models.TextField(blank=True, null=True, verbose_name='Observaciones')),
+                ('fecha_apertura', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Apertura')),
+                ('fecha_cierre', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Cierre')),
+                ('aprobado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conteos_aprobados', to='movilnet.perfilempleado', verbose_name='Aprobado por')),
+                ('empleado', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conteos', to='movilnet.perfilempleado', verbose_name='Abierto por')),
+                ('marca', models.ForeignKey(blank=True, help_text='Déjalo vacío para contar todo el catálogo activo.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='conteos', to='movilnet.marca', verbose_name='Marca')),
+            ],
+            options={
+                'verbose_name': 'Conteo de Inventario',
+                'verbose_name_plural': 'Conteos de Inventario',
+                'ordering': ['-fecha_apertura'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetalleConteo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad_contada', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Cantidad Contada')),
+                ('stock_sistema', models.IntegerField(blank=True, help_text='Stock registrado al momento de aprobar el conteo.', null=True, verbose_name='Stock del Sistema')),
+                ('conteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='movilnet.conteoinventario', verbose_name='Conteo')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='detalles_conteo', to='movilnet.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Detalle de Conteo',
+                'verbose_name_plural': 'Detalles de Conteo',
+                'constraints': [models.UniqueConstraint(fields=('conteo', 'producto'), name='unique_conteo_producto')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-19 07:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0009_conteoinventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoDemanda',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pronostico', serialize=False, to='movilnet.producto', verbose_name='Producto')),
+                ('metodo', models.CharField(choices=[('media_movil', 'Media móvil'), ('suavizado', 'Suavizado exponencial'), ('estacional', 'Suavizado con estacionalidad semanal'), ('sin_datos', 'Sin historial')], max_length=15, verbose_name='Método')),
+                ('demanda_diaria', models.FloatField(default=0, verbose_name='Demanda Diaria')),
+                ('demanda_horizonte', models.FloatField(default=0, verbose_name='Demanda en el Horizonte')),
+                ('desviacion_diaria', models.FloatField(default=0, verbose_name='Desviación Diaria')),
+                ('horizonte_dias', models.PositiveSmallIntegerField(default=30, verbose_name='Horizonte (días)')),
+                ('dias_historial', models.PositiveSmallIntegerField(default=730, verbose_name='Historial (días)')),
+                ('fecha_calculo', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Cálculo')),
+            ],
+            options={
+                'verbose_name': 'Pronóstico de Demanda',
+                'verbose_name_plural': 'Pronósticos de Demanda',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-19 07:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0010_pronosticodemanda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AjusteUmbral',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_minimo_anterior', models.IntegerField(verbose_name='Mínimo Anterior')),
+                ('stock_maximo_anterior', models.IntegerField(verbose_name='Máximo Anterior')),
+                ('stock_minimo_nuevo', models.IntegerField(verbose_name='Mínimo Nuevo')),
+                ('stock_maximo_nuevo', models.IntegerField(verbose_name='Máximo Nuevo')),
+                ('nivel_servicio', models.DecimalField(decimal_places=4, max_digits=5, verbose_name='Nivel de Servicio')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ajustes_umbral', to='movilnet.perfilempleado', verbose_name='Empleado')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ajustes_umbral', to='movilnet.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Ajuste de Umbral',
+                'verbose_name_plural': 'Ajustes de Umbral',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['producto', '-fecha'], name='ajuste_umbral_producto_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-19 07:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0011_ajusteumbral'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiesgoQuiebre',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='riesgo', serialize=False, to='movilnet.producto', verbose_name='Producto')),
+                ('probabilidad', models.FloatField(default=0, verbose_name='Probabilidad de Quiebre')),
+                ('dias_quiebre', models.FloatField(blank=True, null=True, verbose_name='Días hasta el Quiebre (mediana)')),
+                ('faltante_esperado', models.FloatField(default=0, verbose_name='Faltante Esperado')),
+                ('horizonte_dias', models.PositiveSmallIntegerField(default=30, verbose_name='Horizonte (días)')),
+                ('simulaciones', models.PositiveIntegerField(default=0, verbose_name='Simulaciones')),
+                ('fecha_calculo', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Cálculo')),
+            ],
+            options={
+                'verbose_name': 'Riesgo de Quiebre',
+                'verbose_name_plural': 'Riesgos de Quiebre',
+                'indexes': [models.Index(fields=['-probabilidad'], name='riesgo_probabilidad_idx')],
+            },
+        ),
+    ]
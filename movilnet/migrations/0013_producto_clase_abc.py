@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0012_riesgoquiebre'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='clase_abc_inventario',
+            field=models.CharField(blank=True, choices=[('A', 'A'), ('B', 'B'), ('C', 'C')], db_index=True, default='', max_length=1, verbose_name='Clase ABC (inventario)'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='clase_abc_ventas',
+            field=models.CharField(blank=True, choices=[('A', 'A'), ('B', 'B'), ('C', 'C')], db_index=True, default='', max_length=1, verbose_name='Clase ABC (ventas)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0013_producto_clase_abc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='ultima_entrada',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Última Entrada'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='ultima_salida',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Última Salida'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-19 07:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0014_producto_ultimo_movimiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallenotaentrega',
+            name='costo_unitario',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=12, verbose_name='Costo Unitario'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='costo_promedio',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=12, verbose_name='Costo Promedio'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='valor_fifo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Valor FIFO'),
+        ),
+        migrations.CreateModel(
+            name='CapaCosto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Ingreso')),
+                ('cantidad_inicial', models.IntegerField(verbose_name='Cantidad Inicial')),
+                ('cantidad_restante', models.IntegerField(verbose_name='Cantidad Restante')),
+                ('costo_unitario', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='Costo Unitario')),
+                ('detalle_compra', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='capas_costo', to='movilnet.detalleordencompra', verbose_name='Detalle de Compra')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capas_costo', to='movilnet.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Capa de Costo',
+                'verbose_name_plural': 'Capas de Costo',
+                'ordering': ['producto', 'fecha', 'id'],
+                'indexes': [models.Index(condition=models.Q(('cantidad_restante__gt', 0)), fields=['producto', 'fecha', 'id'], name='capa_costo_abierta_idx')],
+            },
+        ),
+    ]
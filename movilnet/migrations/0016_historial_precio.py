@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 07:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0015_costeo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio_anterior', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio Anterior ($)')),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Precio ($)')),
+                ('vigente_desde', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Vigente Desde')),
+                ('motivo', models.CharField(blank=True, default='', max_length=200, verbose_name='Motivo')),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cambios_precio', to='movilnet.perfilempleado', verbose_name='Empleado')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='movilnet.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Historial de Precio',
+                'verbose_name_plural': 'Historial de Precios',
+                'ordering': ['producto', '-vigente_desde', '-id'],
+                'indexes': [models.Index(fields=['producto', 'vigente_desde'], name='historial_precio_fecha_idx')],
+            },
+        ),
+    ]
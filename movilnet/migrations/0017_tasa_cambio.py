@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-19 07:38
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0016_historial_precio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TasaCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha')),
+                ('tasa', models.DecimalField(decimal_places=4, max_digits=14, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Tasa (Bs/$)')),
+                ('fuente', models.CharField(blank=True, default='BCV', max_length=50, verbose_name='Fuente')),
+                ('fecha_registro', models.DateTimeField(auto_now=True, verbose_name='Fecha de Registro')),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasas_cambio', to='movilnet.perfilempleado', verbose_name='Registrado por')),
+            ],
+            options={
+                'verbose_name': 'Tasa de Cambio',
+                'verbose_name_plural': 'Tasas de Cambio',
+                'ordering': ['-fecha'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-19 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0017_tasa_cambio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notaentrega',
+            name='numero_entrega',
+            field=models.CharField(blank=True, help_text='Vacío para asignar el siguiente número (NE-año-correlativo)', max_length=50, unique=True, verbose_name='Número de Entrega'),
+        ),
+        migrations.AlterField(
+            model_name='ordencompra',
+            name='numero_orden',
+            field=models.CharField(blank=True, help_text='Vacío para asignar el siguiente número (OC-año-correlativo)', max_length=50, unique=True, verbose_name='Número'),
+        ),
+        migrations.CreateModel(
+            name='SecuenciaDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serie', models.CharField(max_length=10, verbose_name='Serie')),
+                ('anio', models.PositiveIntegerField(verbose_name='Año')),
+                ('ultimo', models.PositiveIntegerField(default=0, verbose_name='Último Número')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Documentos',
+                'verbose_name_plural': 'Secuencias de Documentos',
+                'constraints': [models.UniqueConstraint(fields=('serie', 'anio'), name='secuencia_serie_anio_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-19 07:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0018_secuencia_documento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioProcesado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True, verbose_name='Clave')),
+                ('modelo', models.CharField(max_length=50, verbose_name='Documento')),
+                ('objeto_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID del Documento')),
+                ('descripcion', models.CharField(blank=True, default='', max_length=200, verbose_name='Descripción')),
+                ('url_resultado', models.CharField(blank=True, default='', max_length=200, verbose_name='URL del Resultado')),
+                ('fecha', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='envios_procesados', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Envío Procesado',
+                'verbose_name_plural': 'Envíos Procesados',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-19 07:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movilnet', '0019_envio_procesado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sesion', models.CharField(max_length=40, verbose_name='Sesión')),
+                ('cantidad', models.PositiveIntegerField(verbose_name='Cantidad')),
+                ('vence', models.DateTimeField(verbose_name='Vence')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='movilnet.producto', verbose_name='Producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas_stock', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+                'indexes': [models.Index(fields=['vence'], name='reserva_vence_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'sesion'), name='reserva_producto_sesion_unica')],
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator, MinValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Validadores personalizados
 cedula_validator = RegexValidator(
@@ -79,6 +80,12 @@ class Cliente(models.Model):
 
 class Producto(models.Model):
     """Modelo para gestionar los productos"""
+    CLASE_ABC_CHOICES = [
+        ('A', 'A'),
+        ('B', 'B'),
+        ('C', 'C'),
+    ]
+
     marca = models.ForeignKey(
         Marca, 
         on_delete=models.PROTECT, 
@@ -114,6 +121,23 @@ class Producto(models.Model):
         verbose_name="Stock Máximo"
     )
     fecha_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Registro")
+    # Clasificación ABC (la recalcula el comando clasificar_abc)
+    clase_abc_ventas = models.CharField(
+        max_length=1, choices=CLASE_ABC_CHOICES, blank=True, default='', db_index=True,
+        verbose_name="Clase ABC (ventas)"
+    )
+    clase_abc_inventario = models.CharField(
+        max_length=1, choices=CLASE_ABC_CHOICES, blank=True, default='', db_index=True,
+        verbose_name="Clase ABC (inventario)"
+    )
+    # Fecha de la última entrada / salida de stock, actualizada en la misma transacción que el stock
+    ultima_entrada = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Última Entrada")
+    ultima_salida = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Última Salida")
+    # Costeo (movilnet/costeo.py): costo promedio ponderado y valor de las capas FIFO abiertas
+    costo_promedio = models.DecimalField(max_digits=12, decimal_places=4, default=0, verbose_name="Costo Promedio")
+    valor_fifo = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Valor FIFO")
+    # Se incrementa en cada edición desde el formulario (control de concurrencia, ver concurrencia.py)
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Versión")
     
     class Meta:
         verbose_name = "Producto"
@@ -122,6 +146,13 @@ class Producto(models.Model):
     
     def __str__(self):
         return f"{self.nombre} - {self.marca.nombre_marca}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Precio tal como está en la BD: el historial de precios solo se escribe si cambia
+        instancia._precio_original = instancia.__dict__.get('precio')
+        return instancia
     
     def clean(self):
         """Validación personalizada para stocks"""
@@ -205,13 +236,21 @@ class Bitacora(models.Model):
     tabla_afectada = models.CharField(max_length=100, verbose_name="Tabla Afectada")
     accion_realizada = models.CharField(max_length=50, verbose_name="Acción Realizada")
     cod_registro_afectado = models.IntegerField(verbose_name="Código Registro Afectado")
-    fecha_hora = models.DateTimeField(auto_now_add=True, verbose_name="Fecha y Hora")
+    # La hora se toma al ocurrir la acción, no al escribirse el lote (ver bitacora.py)
+    fecha_hora = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Fecha y Hora")
     descripcion = models.TextField(verbose_name="Descripción", blank=True, null=True)
 
     class Meta:
         verbose_name = "Bitácora"
         verbose_name_plural = "Bitácoras"
         ordering = ['-fecha_hora']
+        # Índices para la paginación por cursor (fecha_hora, id) y los filtros del explorador
+        indexes = [
+            models.Index(fields=['-fecha_hora', '-id'], name='bitacora_fecha_idx'),
+            models.Index(fields=['empleado', '-fecha_hora'], name='bitacora_empleado_idx'),
+            models.Index(fields=['tabla_afectada', '-fecha_hora'], name='bitacora_tabla_idx'),
+            models.Index(fields=['accion_realizada', '-fecha_hora'], name='bitacora_accion_idx'),
+        ]
 
     def __str__(self):
         return f"{self.accion_realizada} en {self.tabla_afectada} - {self.fecha_hora}"
@@ -279,11 +318,15 @@ class OrdenCompra(models.Model):
 
     proveedor = models.ForeignKey(Proveedor, on_delete=models.PROTECT, verbose_name="Proveedor", related_name="ordenes_compra")
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='orden', verbose_name="Tipo")
-    numero_orden = models.CharField(max_length=50, unique=True, verbose_name="Número")
+    numero_orden = models.CharField(
+        max_length=50, unique=True, blank=True, verbose_name="Número",
+        help_text="Vacío para asignar el siguiente número (OC-año-correlativo)"
+    )
     fecha_orden = models.DateField(verbose_name="Fecha")
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Total")
     observaciones = models.TextField(verbose_name="Observaciones", blank=True, null=True)
     fecha_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Registro")
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Versión")
 
     class Meta:
         verbose_name = "Orden de Compra"
@@ -317,12 +360,16 @@ class DetalleOrdenCompra(models.Model):
 class NotaEntrega(models.Model):
     """Modelo para gestionar notas de entrega a clientes"""
     cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, verbose_name="Cliente", related_name="notas_entrega")
-    numero_entrega = models.CharField(max_length=50, unique=True, verbose_name="Número de Entrega")
+    numero_entrega = models.CharField(
+        max_length=50, unique=True, blank=True, verbose_name="Número de Entrega",
+        help_text="Vacío para asignar el siguiente número (NE-año-correlativo)"
+    )
     subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Subtotal")
     descuento = models.DecimalField(max_digits=12, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Descuento")
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Total")
     observaciones = models.TextField(verbose_name="Observaciones", blank=True, null=True)
     fecha_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Registro")
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Versión")
 
     class Meta:
         verbose_name = "Nota de Entrega"
@@ -330,7 +377,7 @@ class NotaEntrega(models.Model):
         ordering = ['-fecha_registro']
 
     def __str__(self):
-        return f"NE-{self.numero_entrega} - {self.cliente.nombre}"
+        return f"{self.numero_entrega} - {self.cliente.nombre}"
 
 
 class DetalleNotaEntrega(models.Model):
@@ -341,6 +388,7 @@ class DetalleNotaEntrega(models.Model):
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], verbose_name="Precio Unitario")
     descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Descuento")
     subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, validators=[MinValueValidator(0)], verbose_name="Subtotal")
+    costo_unitario = models.DecimalField(max_digits=12, decimal_places=4, default=0, verbose_name="Costo Unitario")
 
     class Meta:
         verbose_name = "Detalle de Nota de Entrega"
@@ -348,3 +396,275 @@ class DetalleNotaEntrega(models.Model):
 
     def __str__(self):
         return f"{self.producto.nombre} x{self.cantidad} - {self.subtotal}"
+
+
+class ConteoInventario(models.Model):
+    """Sesión de conteo físico (cíclico o completo) contra el stock del sistema"""
+    ESTADO_CHOICES = [
+        ('abierto', 'Abierto'),
+        ('aprobado', 'Aprobado'),
+        ('cancelado', 'Cancelado'),
+    ]
+
+    descripcion = models.CharField(max_length=200, verbose_name="Descripción")
+    marca = models.ForeignKey(
+        Marca, on_delete=models.PROTECT, null=True, blank=True,
+        verbose_name="Marca", related_name="conteos",
+        help_text="Déjalo vacío para contar todo el catálogo activo."
+    )
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='abierto', verbose_name="Estado")
+    empleado = models.ForeignKey(PerfilEmpleado, on_delete=models.SET_NULL, null=True, verbose_name="Abierto por", related_name="conteos")
+    aprobado_por = models.ForeignKey(PerfilEmpleado, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Aprobado por", related_name="conteos_aprobados")
+    observaciones = models.TextField(verbose_name="Observaciones", blank=True, null=True)
+    fecha_apertura = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Apertura")
+    fecha_cierre = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Cierre")
+
+    class Meta:
+        verbose_name = "Conteo de Inventario"
+        verbose_name_plural = "Conteos de Inventario"
+        ordering = ['-fecha_apertura']
+
+    def __str__(self):
+        return f"Conteo #{self.pk} - {self.descripcion}"
+
+    @property
+    def abierto(self):
+        return self.estado == 'abierto'
+
+    def productos_en_alcance(self):
+        productos = Producto.objects.filter(estado=True)
+        if self.marca_id:
+            productos = productos.filter(marca_id=self.marca_id)
+        return productos
+
+
+class DetalleConteo(models.Model):
+    """Cantidad contada de un producto dentro de un conteo"""
+    conteo = models.ForeignKey(ConteoInventario, on_delete=models.CASCADE, verbose_name="Conteo", related_name="detalles")
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, verbose_name="Producto", related_name="detalles_conteo")
+    cantidad_contada = models.IntegerField(validators=[MinValueValidator(0)], verbose_name="Cantidad Contada")
+    stock_sistema = models.IntegerField(
+        null=True, blank=True, verbose_name="Stock del Sistema",
+        help_text="Stock registrado al momento de aprobar el conteo."
+    )
+
+    class Meta:
+        verbose_name = "Detalle de Conteo"
+        verbose_name_plural = "Detalles de Conteo"
+        constraints = [
+            models.UniqueConstraint(fields=['conteo', 'producto'], name='unique_conteo_producto')
+        ]
+
+    @property
+    def diferencia(self):
+        return self.cantidad_contada - (self.stock_sistema if self.stock_sistema is not None else self.producto.stock_actual)
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.cantidad_contada}"
+
+
+class PronosticoDemanda(models.Model):
+    """Pronóstico de demanda diaria por producto (lo recalcula el comando pronosticar_demanda)"""
+    METODO_CHOICES = [
+        ('media_movil', 'Media móvil'),
+        ('suavizado', 'Suavizado exponencial'),
+        ('estacional', 'Suavizado con estacionalidad semanal'),
+        ('sin_datos', 'Sin historial'),
+    ]
+
+    producto = models.OneToOneField(
+        Producto, on_delete=models.CASCADE, primary_key=True,
+        verbose_name="Producto", related_name="pronostico"
+    )
+    metodo = models.CharField(max_length=15, choices=METODO_CHOICES, verbose_name="Método")
+    demanda_diaria = models.FloatField(default=0, verbose_name="Demanda Diaria")
+    demanda_horizonte = models.FloatField(default=0, verbose_name="Demanda en el Horizonte")
+    desviacion_diaria = models.FloatField(default=0, verbose_name="Desviación Diaria")
+    horizonte_dias = models.PositiveSmallIntegerField(default=30, verbose_name="Horizonte (días)")
+    dias_historial = models.PositiveSmallIntegerField(default=730, verbose_name="Historial (días)")
+    fecha_calculo = models.DateTimeField(default=timezone.now, verbose_name="Fecha de Cálculo")
+
+    class Meta:
+        verbose_name = "Pronóstico de Demanda"
+        verbose_name_plural = "Pronósticos de Demanda"
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.demanda_diaria:.2f}/día"
+
+
+class AjusteUmbral(models.Model):
+    """Historial de cambios de stock mínimo / máximo hechos por el ajuste automático"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, verbose_name="Producto", related_name="ajustes_umbral")
+    stock_minimo_anterior = models.IntegerField(verbose_name="Mínimo Anterior")
+    stock_maximo_anterior = models.IntegerField(verbose_name="Máximo Anterior")
+    stock_minimo_nuevo = models.IntegerField(verbose_name="Mínimo Nuevo")
+    stock_maximo_nuevo = models.IntegerField(verbose_name="Máximo Nuevo")
+    nivel_servicio = models.DecimalField(max_digits=5, decimal_places=4, verbose_name="Nivel de Servicio")
+    empleado = models.ForeignKey(PerfilEmpleado, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Empleado", related_name="ajustes_umbral")
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Ajuste de Umbral"
+        verbose_name_plural = "Ajustes de Umbral"
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', '-fecha'], name='ajuste_umbral_producto_idx'),
+        ]
+
+    def __str__(self):
+        return (f"{self.producto.nombre}: {self.stock_minimo_anterior}/{self.stock_maximo_anterior} → "
+                f"{self.stock_minimo_nuevo}/{self.stock_maximo_nuevo}")
+
+
+class RiesgoQuiebre(models.Model):
+    """Probabilidad simulada de quiebre de stock por producto (la recalcula el comando simular_riesgo)"""
+    producto = models.OneToOneField(
+        Producto, on_delete=models.CASCADE, primary_key=True,
+        verbose_name="Producto", related_name="riesgo"
+    )
+    probabilidad = models.FloatField(default=0, verbose_name="Probabilidad de Quiebre")
+    dias_quiebre = models.FloatField(null=True, blank=True, verbose_name="Días hasta el Quiebre (mediana)")
+    faltante_esperado = models.FloatField(default=0, verbose_name="Faltante Esperado")
+    horizonte_dias = models.PositiveSmallIntegerField(default=30, verbose_name="Horizonte (días)")
+    simulaciones = models.PositiveIntegerField(default=0, verbose_name="Simulaciones")
+    fecha_calculo = models.DateTimeField(default=timezone.now, verbose_name="Fecha de Cálculo")
+
+    class Meta:
+        verbose_name = "Riesgo de Quiebre"
+        verbose_name_plural = "Riesgos de Quiebre"
+        indexes = [
+            models.Index(fields=['-probabilidad'], name='riesgo_probabilidad_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.probabilidad:.0%}"
+
+
+class CapaCosto(models.Model):
+    """Capa de costo FIFO: unidades que entraron a un mismo costo y cuántas quedan"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, verbose_name="Producto", related_name="capas_costo")
+    detalle_compra = models.ForeignKey(
+        DetalleOrdenCompra, on_delete=models.SET_NULL, null=True, blank=True,
+        verbose_name="Detalle de Compra", related_name="capas_costo"
+    )
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha de Ingreso")
+    cantidad_inicial = models.IntegerField(verbose_name="Cantidad Inicial")
+    cantidad_restante = models.IntegerField(verbose_name="Cantidad Restante")
+    costo_unitario = models.DecimalField(max_digits=12, decimal_places=4, verbose_name="Costo Unitario")
+
+    class Meta:
+        verbose_name = "Capa de Costo"
+        verbose_name_plural = "Capas de Costo"
+        ordering = ['producto', 'fecha', 'id']
+        indexes = [
+            models.Index(fields=['producto', 'fecha', 'id'], condition=models.Q(cantidad_restante__gt=0),
+                         name='capa_costo_abierta_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.cantidad_restante}/{self.cantidad_inicial} a {self.costo_unitario}"
+
+
+class HistorialPrecio(models.Model):
+    """Precio de lista de un producto vigente desde una fecha (se escribe en cada cambio de precio)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, verbose_name="Producto", related_name="historial_precios")
+    precio_anterior = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Precio Anterior ($)")
+    precio = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio ($)")
+    vigente_desde = models.DateTimeField(default=timezone.now, verbose_name="Vigente Desde")
+    empleado = models.ForeignKey(
+        PerfilEmpleado, on_delete=models.SET_NULL, null=True, blank=True,
+        verbose_name="Empleado", related_name="cambios_precio"
+    )
+    motivo = models.CharField(max_length=200, blank=True, default='', verbose_name="Motivo")
+
+    class Meta:
+        verbose_name = "Historial de Precio"
+        verbose_name_plural = "Historial de Precios"
+        ordering = ['producto', '-vigente_desde', '-id']
+        indexes = [
+            models.Index(fields=['producto', 'vigente_desde'], name='historial_precio_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.nombre}: ${self.precio} desde {self.vigente_desde:%d/%m/%Y}"
+
+
+class TasaCambio(models.Model):
+    """Tasa de cambio del día: bolívares por dólar (rige hasta que se registre la siguiente)"""
+    fecha = models.DateField(unique=True, verbose_name="Fecha")
+    tasa = models.DecimalField(max_digits=14, decimal_places=4, validators=[MinValueValidator(0)], verbose_name="Tasa (Bs/$)")
+    fuente = models.CharField(max_length=50, blank=True, default='BCV', verbose_name="Fuente")
+    empleado = models.ForeignKey(
+        PerfilEmpleado, on_delete=models.SET_NULL, null=True, blank=True,
+        verbose_name="Registrado por", related_name="tasas_cambio"
+    )
+    fecha_registro = models.DateTimeField(auto_now=True, verbose_name="Fecha de Registro")
+
+    class Meta:
+        verbose_name = "Tasa de Cambio"
+        verbose_name_plural = "Tasas de Cambio"
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.fecha:%d/%m/%Y}: Bs {self.tasa}"
+
+
+class SecuenciaDocumento(models.Model):
+    """Último correlativo entregado de una serie de documentos en un año (ver numeracion.py)"""
+    serie = models.CharField(max_length=10, verbose_name="Serie")
+    anio = models.PositiveIntegerField(verbose_name="Año")
+    ultimo = models.PositiveIntegerField(default=0, verbose_name="Último Número")
+
+    class Meta:
+        verbose_name = "Secuencia de Documentos"
+        verbose_name_plural = "Secuencias de Documentos"
+        constraints = [
+            models.UniqueConstraint(fields=['serie', 'anio'], name='secuencia_serie_anio_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.serie}-{self.anio}: {self.ultimo}"
+
+
+class EnvioProcesado(models.Model):
+    """Clave de un formulario de creación ya procesado, para no repetirlo si se reenvía (ver idempotencia.py)"""
+    clave = models.CharField(max_length=64, unique=True, verbose_name="Clave")
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Usuario", related_name="envios_procesados")
+    modelo = models.CharField(max_length=50, verbose_name="Documento")
+    objeto_id = models.PositiveIntegerField(null=True, blank=True, verbose_name="ID del Documento")
+    descripcion = models.CharField(max_length=200, blank=True, default='', verbose_name="Descripción")
+    url_resultado = models.CharField(max_length=200, blank=True, default='', verbose_name="URL del Resultado")
+    fecha = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Envío Procesado"
+        verbose_name_plural = "Envíos Procesados"
+
+    def __str__(self):
+        return f"{self.modelo} {self.descripcion} ({self.clave[:8]})"
+
+
+class ReservaStock(models.Model):
+    """Unidades apartadas por una sesión mientras prepara una nota de entrega; vencen solas (ver reservas.py)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, verbose_name="Producto", related_name="reservas")
+    sesion = models.CharField(max_length=40, verbose_name="Sesión")
+    usuario = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        verbose_name="Usuario", related_name="reservas_stock"
+    )
+    cantidad = models.PositiveIntegerField(verbose_name="Cantidad")
+    vence = models.DateTimeField(verbose_name="Vence")
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'sesion'], name='reserva_producto_sesion_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['vence'], name='reserva_vence_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.cantidad} hasta {self.vence:%d/%m/%Y %H:%M}"
@@ -0,0 +1,102 @@
+"""
+Conversión de dólares a bolívares con la tasa de cambio diaria.
+
+Los precios y totales se guardan en dólares; ``TasaCambio`` tiene una fila
+por día con los bolívares por dólar. Para una fecha rige la tasa del último
+día registrado hasta esa fecha (fines de semana y feriados usan la del día
+hábil anterior).
+
+- ``tasa_en``: consulta puntual desde Python (detalle de una nota, vista
+  previa). Cada proceso guarda la tabla en memoria (es pequeña: una fila por
+  día) y la recarga cuando cambia una tasa o pasan
+  ``settings.TASA_CAMBIO_CACHE_SEGUNDOS``.
+- ``anotar_bs``: conversión en la BD para listados y reportes. Agrega a un
+  queryset la tasa de la fecha de cada fila (subconsulta correlacionada que
+  usa el índice único de ``TasaCambio.fecha``) y los montos en bolívares,
+  de modo que un reporte de un año sigue siendo una sola consulta y se
+  puede sumar con ``aggregate``.
+"""
+import bisect
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, DateTimeField, DecimalField, ExpressionWrapper
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from .models import TasaCambio
+
+_cache = {'cargada': None, 'fechas': [], 'tasas': []}
+_candado = threading.Lock()
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def limpiar_cache(**kwargs):
+    """Descarta la tabla en memoria (se conecta a los cambios de ``TasaCambio``)"""
+    with _candado:
+        _cache['cargada'] = None
+
+
+def conectar_senales():
+    post_save.connect(limpiar_cache, sender=TasaCambio, dispatch_uid='moneda_tasa_guardada')
+    post_delete.connect(limpiar_cache, sender=TasaCambio, dispatch_uid='moneda_tasa_eliminada')
+
+
+def _tabla():
+    with _candado:
+        vigencia = _config('TASA_CAMBIO_CACHE_SEGUNDOS', 300)
+        if _cache['cargada'] is None or time.monotonic() - _cache['cargada'] > vigencia:
+            filas = list(TasaCambio.objects.order_by('fecha').values_list('fecha', 'tasa'))
+            _cache['fechas'] = [f for f, _ in filas]
+            _cache['tasas'] = [t for _, t in filas]
+            _cache['cargada'] = time.monotonic()
+        return _cache['fechas'], _cache['tasas']
+
+
+def tasa_en(fecha=None):
+    """Tasa (Bs/$) vigente en ``fecha`` (fecha o fecha y hora; hoy por defecto), o None si no hay"""
+    if fecha is None:
+        fecha = timezone.localdate()
+    elif hasattr(fecha, 'hour'):
+        fecha = timezone.localtime(fecha).date() if timezone.is_aware(fecha) else fecha.date()
+    fechas, tasas = _tabla()
+    posicion = bisect.bisect_right(fechas, fecha)
+    return tasas[posicion - 1] if posicion else None
+
+
+def a_bolivares(monto, fecha=None):
+    """Monto en dólares convertido a bolívares con la tasa de ``fecha`` (None si no hay tasa)"""
+    tasa = tasa_en(fecha)
+    if tasa is None or monto is None:
+        return None
+    return (Decimal(monto) * tasa).quantize(Decimal('0.01'))
+
+
+def tasa_vigente(campo_fecha):
+    """Subconsulta con la tasa vigente en la fecha del campo ``campo_fecha`` de la fila externa"""
+    return Subquery(
+        TasaCambio.objects.filter(fecha__lte=OuterRef(campo_fecha)).order_by('-fecha').values('tasa')[:1],
+        output_field=DecimalField(max_digits=14, decimal_places=4),
+    )
+
+
+def anotar_bs(queryset, campos, campo_fecha='fecha_registro'):
+    """
+    Anota ``tasa_bs`` y, por cada campo en dólares de ``campos``, ``<campo>_bs``
+    (None cuando no hay tasa para la fecha). Si ``campo_fecha`` es fecha y
+    hora se toma el día en la zona horaria local.
+    """
+    if isinstance(queryset.model._meta.get_field(campo_fecha), DateTimeField):
+        queryset = queryset.annotate(fecha_tasa=TruncDate(campo_fecha))
+        campo_fecha = 'fecha_tasa'
+    queryset = queryset.annotate(tasa_bs=tasa_vigente(campo_fecha))
+    return queryset.annotate(**{
+        f'{nombre}_bs': ExpressionWrapper(F(nombre) * F('tasa_bs'), output_field=DecimalField(max_digits=20, decimal_places=2))
+        for nombre in campos
+    })
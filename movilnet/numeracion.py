@@ -0,0 +1,90 @@
+"""
+Numeración automática de documentos: OC-2026-000123, NE-2026-000123.
+
+Cada serie lleva un correlativo por año en ``SecuenciaDocumento``. Pedir
+números es un UPDATE relativo (ultimo = ultimo + cantidad) sobre una sola
+fila y la lectura del valor resultante: no hay ``MAX() + 1`` sobre la tabla
+de documentos y dos usuarios nunca reciben el mismo número. Se puede
+reservar un bloque de números de una vez para crear documentos en lote.
+
+Los números se piden dentro de la transacción que guarda el documento: si
+el guardado falla o se reintenta, el UPDATE de la secuencia se deshace con
+él y no quedan saltos. El precio es que el bloqueo de la fila de la
+secuencia dura hasta que esa transacción termina. En motores con bloqueo
+por fila (PostgreSQL, MySQL) eso es más largo que el UPDATE de una sola
+fila: dos documentos de la misma serie se guardan uno detrás del otro. En
+SQLite no cambia nada, porque la transacción ya tiene el bloqueo de
+escritura de toda la base. Fuera de una transacción, ``reservar_numeros``
+usa una propia y corta.
+
+Un número escrito a mano con el formato de una serie (``OC-2026-...``)
+chocaría más adelante con el automático; ``es_de_serie`` permite a los
+formularios rechazarlo.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SecuenciaDocumento, OrdenCompra, NotaEntrega
+
+SERIE_ORDEN = 'OC'
+SERIE_NOTA = 'NE'
+
+# Documento y campo de cada serie, para continuar los números cargados a mano al crear la secuencia
+DOCUMENTOS = {
+    SERIE_ORDEN: (OrdenCompra, 'numero_orden'),
+    SERIE_NOTA: (NotaEntrega, 'numero_entrega'),
+}
+
+DIGITOS = 6
+
+
+def formatear(serie, anio, numero):
+    return f'{serie}-{anio}-{numero:0{DIGITOS}d}'
+
+
+def es_de_serie(serie, numero):
+    """El número usa el prefijo de la serie automática (OC-año-...)"""
+    return bool(re.match(rf'{re.escape(serie)}-\d{{4}}-', numero or '', re.IGNORECASE))
+
+
+def _ultimo_existente(serie, anio):
+    """Mayor correlativo ya usado con el formato de la serie (solo al crear la secuencia del año)"""
+    if serie not in DOCUMENTOS:
+        return 0
+    modelo, campo = DOCUMENTOS[serie]
+    prefijo = f'{serie}-{anio}-'
+    for numero in modelo.objects.filter(**{f'{campo}__startswith': prefijo}).order_by(f'-{campo}').values_list(campo, flat=True):
+        sufijo = numero[len(prefijo):]
+        if sufijo.isdigit():
+            return int(sufijo)
+    return 0
+
+
+def reservar_numeros(serie, cantidad=1, anio=None):
+    """Reserva ``cantidad`` números consecutivos de la serie y los devuelve formateados"""
+    if cantidad < 1:
+        return []
+    anio = anio or timezone.localdate().year
+    secuencia = SecuenciaDocumento.objects.filter(serie=serie, anio=anio)
+    with transaction.atomic():
+        if not secuencia.update(ultimo=F('ultimo') + cantidad):
+            SecuenciaDocumento.objects.bulk_create(
+                [SecuenciaDocumento(serie=serie, anio=anio, ultimo=_ultimo_existente(serie, anio))],
+                ignore_conflicts=True,
+            )
+            secuencia.update(ultimo=F('ultimo') + cantidad)
+        ultimo = secuencia.values_list('ultimo', flat=True).get()
+    return [formatear(serie, anio, n) for n in range(ultimo - cantidad + 1, ultimo + 1)]
+
+
+def siguiente_numero(serie, anio=None):
+    return reservar_numeros(serie, 1, anio)[0]
+
+
+def asignar_numero(documento, campo, serie, anio=None):
+    """Asigna el siguiente número de la serie si el documento no tiene uno (dentro de la transacción que lo guarda)"""
+    if not getattr(documento, campo):
+        setattr(documento, campo, siguiente_numero(serie, anio))
@@ -0,0 +1,156 @@
+"""
+Perfil de producción de SQLite.
+
+Con los valores por defecto (journal DELETE) un lector que recorre una tabla
+grande en un reporte mantiene su bloqueo compartido y el escritor no puede
+confirmar hasta que termine; mientras el escritor espera, los lectores
+nuevos también quedan bloqueados. Cada conexión nueva recibe los PRAGMA de
+``settings.SQLITE_PRAGMAS`` (señal ``connection_created``):
+
+- ``journal_mode=WAL``: lectores y escritor no se bloquean entre sí; cada
+  lector ve la última versión confirmada cuando empezó.
+- ``synchronous=NORMAL``: en WAL no se pierde integridad si cae el proceso
+  (solo las últimas transacciones si cae el equipo) y confirmar no hace
+  fsync en cada transacción.
+- ``mmap_size`` y ``cache_size``: lecturas por memoria mapeada y una caché
+  de páginas mayor para los reportes.
+
+La espera por un bloqueo (``busy_timeout``) es el ``timeout`` de
+``DATABASES['default']['OPTIONS']``, que Django pasa al conectar.
+
+Las estadísticas del planificador (ANALYZE) se refrescan cada
+``settings.SQLITE_INTERVALO_ANALYZE`` segundos en un hilo de cada proceso y
+con el comando ``optimizar_bd`` (cron), que además trunca el archivo WAL.
+"""
+import atexit
+import logging
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_NOMBRE_PRAGMA = re.compile(r'^[a-z_]+$')
+
+# PRAGMA optimize revisa todas las tablas (no solo las usadas por la conexión) desde SQLite 3.46
+OPTIMIZE_COMPLETO = sqlite3.sqlite_version_info >= (3, 46, 0)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def aplicar_pragmas(sender, connection, **kwargs):
+    """Receptor de ``connection_created``: aplica ``SQLITE_PRAGMAS`` a la conexión nueva"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = _config('SQLITE_PRAGMAS', {})
+    if connection.alias == _config('REPLICA_ALIAS', 'replica'):
+        # La réplica (replica.py) se reemplaza entera al refrescarla: sin WAL propio y de solo lectura
+        pragmas = {n: v for n, v in pragmas.items() if n not in ('journal_mode', 'synchronous')}
+        pragmas['query_only'] = 1
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas.items():
+            if not _NOMBRE_PRAGMA.match(nombre):
+                raise ValueError(f'Nombre de PRAGMA no válido en SQLITE_PRAGMAS: {nombre!r}')
+            try:
+                cursor.execute(f'PRAGMA {nombre} = {valor}')
+            except OperationalError as e:
+                # Pasar a WAL necesita acceso exclusivo: si otra conexión lo impide, se intentará en la próxima
+                logger.warning('No se pudo aplicar PRAGMA %s = %s: %s', nombre, valor, e)
+    if _config('SQLITE_INTERVALO_ANALYZE', 0):
+        obtener_analizador().iniciar()
+
+
+def conectar_senales():
+    connection_created.connect(aplicar_pragmas, dispatch_uid='movilnet_sqlite_pragmas')
+
+
+def estado(using=DEFAULT_DB_ALIAS):
+    """Valores actuales de los PRAGMA del perfil en una conexión"""
+    connection = connections[using]
+    resultado = {}
+    with connection.cursor() as cursor:
+        for nombre in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store'):
+            cursor.execute(f'PRAGMA {nombre}')
+            resultado[nombre] = cursor.fetchone()[0]
+    return resultado
+
+
+# ==================== ESTADÍSTICAS DEL PLANIFICADOR ====================
+
+def analizar(using=DEFAULT_DB_ALIAS, completo=False):
+    """
+    Refresca las estadísticas del planificador. Por defecto hace un ANALYZE
+    aproximado (``analysis_limit``) que no bloquea a los escritores más de
+    unos milisegundos por tabla; ``completo=True`` recorre todas las filas.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if completo:
+            cursor.execute('ANALYZE')
+            return
+        cursor.execute(f'PRAGMA analysis_limit = {int(_config("SQLITE_LIMITE_ANALYZE", 1000))}')
+        if OPTIMIZE_COMPLETO:
+            cursor.execute('PRAGMA optimize = 0x10002')
+        else:
+            cursor.execute('ANALYZE')
+
+
+def checkpoint(using=DEFAULT_DB_ALIAS):
+    """Copia el WAL a la base de datos y lo trunca. Devuelve (ocupado, páginas del WAL, páginas copiadas)"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return cursor.fetchone()
+
+
+class AnalizadorPeriodico:
+    """Hilo que refresca las estadísticas del planificador cada ``intervalo`` segundos"""
+
+    def __init__(self, intervalo=21600.0):
+        self.intervalo = intervalo
+        self._hilo = None
+        self._detener = threading.Event()
+        self._candado = threading.Lock()
+
+    def iniciar(self):
+        with self._candado:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='sqlite-analizador', daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                analizar()
+            except Exception:
+                logger.exception('No se pudieron refrescar las estadísticas de SQLite')
+            finally:
+                close_old_connections()
+
+
+_analizador = None
+_analizador_candado = threading.Lock()
+
+
+def obtener_analizador():
+    global _analizador
+    if _analizador is None:
+        with _analizador_candado:
+            if _analizador is None:
+                _analizador = AnalizadorPeriodico(intervalo=_config('SQLITE_INTERVALO_ANALYZE', 21600))
+                atexit.register(_analizador.detener)
+    return _analizador
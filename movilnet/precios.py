@@ -0,0 +1,175 @@
+"""
+Historial de precios de lista con fecha de vigencia.
+
+``Producto.precio`` es el precio vigente; cada cambio deja una fila en
+``HistorialPrecio`` (precio anterior, precio nuevo, desde cuándo rige):
+
+- los guardados individuales (formularios, admin) por una señal post_save,
+  que compara con el precio leído de la BD (``Producto.from_db``);
+- la importación de catálogo y el cambio masivo de precios, con un
+  ``bulk_create`` de las filas en la misma transacción.
+
+``precios_en_fecha`` resuelve el precio vigente de miles de pares
+(producto, fecha) con una sola consulta: cada par busca en el índice
+(producto, vigente_desde) la última fila anterior a su fecha. Antes de la
+primera fila del historial rige el precio anterior a ese primer cambio y,
+si el producto no tiene historial, su precio actual.
+"""
+import json
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import F, Value, DecimalField
+from django.db.models.functions import Round
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .bitacora import registrar_en_bitacora, empleado_actual_id, ACCION_ACTUALIZAR
+from .importacion import en_lotes
+from .models import Producto, HistorialPrecio
+
+TAMANO_CONSULTA = 900
+
+CENTAVOS = Decimal('0.01')
+
+
+def registrar_cambios(cambios, empleado=None, motivo='', fecha=None):
+    """
+    Guarda en el historial una lista de (producto_id, precio_anterior, precio_nuevo)
+    con un ``bulk_create``. Los pares sin cambio se omiten; precio_anterior
+    None indica un producto nuevo. Devuelve cuántas filas se escribieron.
+    """
+    fecha = fecha or timezone.now()
+    empleado_id = empleado.pk if empleado is not None else empleado_actual_id()
+    filas = [
+        HistorialPrecio(producto_id=pk, precio_anterior=anterior, precio=nuevo,
+                        vigente_desde=fecha, empleado_id=empleado_id, motivo=motivo[:200])
+        for pk, anterior, nuevo in cambios if anterior is None or anterior != nuevo
+    ]
+    HistorialPrecio.objects.bulk_create(filas, batch_size=2000)
+    return len(filas)
+
+
+def _al_guardar_producto(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'precio' not in update_fields):
+        return
+    anterior = getattr(instance, '_precio_original', None)
+    if created or (anterior is not None and anterior != instance.precio):
+        registrar_cambios([(instance.pk, None if created else anterior, instance.precio)])
+    instance._precio_original = instance.precio
+
+
+def conectar_senales():
+    post_save.connect(_al_guardar_producto, sender=Producto, dispatch_uid='historial_precio_producto')
+
+
+# ==================== CAMBIO MASIVO ====================
+
+def cambiar_precios(productos, porcentaje, empleado=None, motivo=''):
+    """
+    Aplica un cambio porcentual (15 = +15 %, -10 = -10 %) al precio de los
+    productos del queryset con una sola sentencia UPDATE, redondeando a
+    centavos en la BD, y guarda el historial. Devuelve cuántos precios cambiaron.
+    """
+    porcentaje = Decimal(str(porcentaje))
+    if porcentaje <= -100:
+        raise ValueError('El porcentaje debe ser mayor que -100.')
+    factor = 1 + porcentaje / 100
+    ahora = timezone.now()
+    with transaction.atomic():
+        anteriores = dict(productos.select_for_update().order_by().values_list('pk', 'precio'))
+        if not anteriores:
+            return 0
+        Producto.objects.filter(pk__in=productos.order_by().values('pk')).update(
+            precio=Round(F('precio') * Value(factor, output_field=DecimalField()), 2),
+        )
+        # Se relee lo que quedó en la BD para que el historial coincida con el redondeo del motor
+        cambios = []
+        for lote in en_lotes(anteriores, TAMANO_CONSULTA):
+            cambios += [
+                (pk, anteriores[pk], Decimal(precio).quantize(CENTAVOS))
+                for pk, precio in Producto.objects.filter(pk__in=lote).values_list('pk', 'precio')
+            ]
+        escritos = registrar_cambios(
+            cambios, empleado=empleado, fecha=ahora,
+            motivo=motivo or f'Cambio masivo de {porcentaje:+}%',
+        )
+        registrar_en_bitacora(
+            empleado, 'Producto', ACCION_ACTUALIZAR, 0,
+            f'Cambio masivo de precios {porcentaje:+}%: {escritos} productos',
+        )
+    return escritos
+
+
+# ==================== PRECIO EN UNA FECHA ====================
+
+def _como_fecha_hora(valor):
+    """
+    Las fechas sin hora se toman al cierre del día (precio vigente al terminar
+    la jornada); las horas sin zona, en la zona horaria del proyecto.
+    """
+    if not isinstance(valor, datetime):
+        valor = datetime.combine(valor, time.max)
+    if timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor
+
+
+def _sql_precios(connection, consultas):
+    """Precio vigente para cada fila (i, producto_id, fecha) de la tabla ``consultas``"""
+    qn = connection.ops.quote_name
+    h, p = HistorialPrecio._meta, Producto._meta
+
+    def col(opts, campo):
+        return qn(opts.get_field(campo).column)
+
+    historial = f"""FROM {qn(h.db_table)} h WHERE h.{col(h, 'producto')} = c.producto_id"""
+    return f"""
+        WITH consultas (i, producto_id, fecha) AS ({consultas})
+        SELECT c.i, COALESCE(
+            (SELECT h.{col(h, 'precio')} {historial} AND h.{col(h, 'vigente_desde')} <= c.fecha
+             ORDER BY h.{col(h, 'vigente_desde')} DESC, h.{col(h, 'id')} DESC LIMIT 1),
+            (SELECT COALESCE(h.{col(h, 'precio_anterior')}, h.{col(h, 'precio')}) {historial}
+             ORDER BY h.{col(h, 'vigente_desde')}, h.{col(h, 'id')} LIMIT 1),
+            (SELECT p.{col(p, 'precio')} FROM {qn(p.db_table)} p WHERE p.{col(p, 'id')} = c.producto_id)
+        )
+        FROM consultas c
+    """
+
+
+def precios_en_fecha(pares):
+    """
+    Precio de lista vigente para cada par (producto_id, fecha o fecha y hora).
+    Devuelve una lista alineada con ``pares`` (None si el producto no existe).
+
+    En SQLite todos los pares viajan como un único parámetro JSON expandido
+    con ``json_each``, así que la consulta es una sola sin importar cuántos
+    sean; en otros motores se envían como VALUES por bloques.
+    """
+    pares = list(pares)
+    connection = connections[router.db_for_read(HistorialPrecio)]
+    filas = [
+        (i, int(pk), connection.ops.adapt_datetimefield_value(_como_fecha_hora(fecha)))
+        for i, (pk, fecha) in enumerate(pares)
+    ]
+    precios = [None] * len(pares)
+    if not filas:
+        return precios
+
+    if connection.vendor == 'sqlite':
+        tabla = "SELECT key, json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(%s)"
+        bloques = [(tabla, [json.dumps([[pk, str(fecha)] for _, pk, fecha in filas])])]
+    else:
+        tamano = max(1, (connection.features.max_query_params or 3 * TAMANO_CONSULTA) // 3)
+        bloques = [
+            ('VALUES ' + ', '.join(['(%s, %s, %s)'] * len(lote)), [v for fila in lote for v in fila])
+            for lote in en_lotes(filas, tamano)
+        ]
+    with connection.cursor() as cursor:
+        for consultas, parametros in bloques:
+            cursor.execute(_sql_precios(connection, consultas), parametros)
+            for i, precio in cursor.fetchall():
+                if precio is not None:
+                    precios[i] = Decimal(str(precio)).quantize(CENTAVOS)
+    return precios
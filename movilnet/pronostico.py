@@ -0,0 +1,241 @@
+"""
+Pronóstico de demanda por producto a partir del historial de salidas.
+
+Se arma una matriz densa producto × día con el consumo (salidas de
+``MovimientoInventario`` más lo despachado en notas de entrega) y sobre ella
+se ajustan, para todos los productos a la vez, tres modelos:
+
+- media móvil de las últimas ``VENTANA_MEDIA`` jornadas;
+- suavizado exponencial simple (el nivel es un producto matriz × vector de pesos);
+- suavizado exponencial sobre la serie desestacionalizada por día de la semana.
+
+Para cada producto se elige el modelo con menor error cuadrático medio en las
+últimas ``DIAS_VALIDACION`` jornadas (ajustando con el historial previo) y se
+guarda en ``PronosticoDemanda``. Se usa el error cuadrático y no el absoluto
+porque con demanda intermitente el absoluto premia pronosticar cero. La matriz se procesa por bloques de productos
+para acotar la memoria de los temporales.
+"""
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .bd import insertar_en_bloque
+from .models import (
+    Producto, TipoInventario, MovimientoInventario,
+    NotaEntrega, DetalleNotaEntrega, PronosticoDemanda,
+)
+
+DIAS_HISTORIAL = 730
+HORIZONTE = 30
+VENTANA_MEDIA = 28
+DIAS_VALIDACION = 28
+SEMANAS_ESTACIONALIDAD = 26
+MINIMO_ESTACIONAL = 1.0   # unidades diarias promedio para estimar estacionalidad
+LIMITE_FACTOR = 4.0       # los índices semanales se acotan a [1/4, 4]
+ALFA = 0.3
+TAMANO_BLOQUE = 5000
+
+METODOS = ('media_movil', 'suavizado', 'estacional')
+
+CAMPOS_PRONOSTICO = (
+    'producto', 'metodo', 'demanda_diaria', 'demanda_horizonte', 'desviacion_diaria',
+    'horizonte_dias', 'dias_historial', 'fecha_calculo',
+)
+
+
+def _segundos_epoca(connection, columna):
+    """Expresión SQL con la fecha como segundos Unix (evita convertir millones de datetimes en Python)"""
+    if connection.vendor == 'sqlite':
+        return f'CAST((julianday({columna}) - 2440587.5) * 86400 AS INTEGER)'
+    if connection.vendor == 'postgresql':
+        return f'CAST(EXTRACT(EPOCH FROM {columna}) AS BIGINT)'
+    if connection.vendor == 'mysql':
+        return f'UNIX_TIMESTAMP({columna})'
+    raise NotImplementedError(f'Motor de base de datos no soportado: {connection.vendor}')
+
+
+def _consultas_consumo(connection):
+    """SQL de (producto_id, segundos, cantidad) de salidas y despachos desde una fecha"""
+    qn = connection.ops.quote_name
+    mov, tipo = MovimientoInventario._meta, TipoInventario._meta
+    nota, detalle = NotaEntrega._meta, DetalleNotaEntrega._meta
+
+    def col(opts, campo):
+        return f'{qn(opts.db_table)}.{qn(opts.get_field(campo).column)}'
+
+    salidas = (
+        f'SELECT {col(mov, "producto")}, {_segundos_epoca(connection, col(mov, "fecha_movimiento"))}, {col(mov, "cantidad")} '
+        f'FROM {qn(mov.db_table)} INNER JOIN {qn(tipo.db_table)} '
+        f'ON {col(tipo, "id")} = {col(mov, "tipo_inventario")} '
+        f"WHERE {col(tipo, 'direccion')} = 'SALIDA' AND {col(mov, 'fecha_movimiento')} >= %s"
+    )
+    despachos = (
+        f'SELECT {col(detalle, "producto")}, {_segundos_epoca(connection, col(nota, "fecha_registro"))}, {col(detalle, "cantidad")} '
+        f'FROM {qn(detalle.db_table)} INNER JOIN {qn(nota.db_table)} '
+        f'ON {col(nota, "id")} = {col(detalle, "nota_entrega")} '
+        f'WHERE {col(nota, "fecha_registro")} >= %s'
+    )
+    return salidas, despachos
+
+
+def matriz_consumo(ids, dias=DIAS_HISTORIAL, hasta=None, lote=200000):
+    """
+    Matriz float32 (len(ids) × dias) con las unidades consumidas por día.
+
+    ``ids`` debe estar ordenado. La última columna es el día ``hasta`` (hoy
+    por defecto, en la zona horaria local). Las filas se leen en bloques con
+    ``fetchmany`` y se acumulan con ``np.add.at``.
+    """
+    hasta = hasta or timezone.localdate()
+    inicio = hasta - timedelta(days=dias - 1)
+    desplazamiento = int(timezone.localtime().utcoffset().total_seconds())
+    dia_inicio = (inicio - date(1970, 1, 1)).days
+
+    matriz = np.zeros((len(ids), dias), dtype=np.float32)
+    using = router.db_for_read(MovimientoInventario)
+    connection = connections[using]
+    desde = timezone.make_aware(datetime.combine(inicio, time.min))
+    parametro = connection.ops.adapt_datetimefield_value(desde)
+
+    for sql in _consultas_consumo(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [parametro])
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                datos = np.array(filas, dtype=np.int64)
+                fila = np.searchsorted(ids, datos[:, 0])
+                dia = (datos[:, 1] + desplazamiento) // 86400 - dia_inicio
+                validas = (fila < len(ids)) & (dia >= 0) & (dia < dias)
+                validas[validas] &= ids[fila[validas]] == datos[validas, 0]
+                np.add.at(matriz, (fila[validas], dia[validas]), datos[validas, 2])
+    return matriz, inicio
+
+
+def nivel_suavizado(X, alfa=ALFA):
+    """Nivel final del suavizado exponencial simple de cada fila, como X @ pesos"""
+    dias = X.shape[1]
+    pesos = alfa * (1 - alfa) ** np.arange(dias - 1, -1, -1, dtype=np.float64)
+    # El nivel inicial es la media de la serie; su peso (1 - alfa)^dias es casi nulo con historiales largos
+    return X @ pesos.astype(np.float32) + (1 - alfa) ** dias * X.mean(axis=1)
+
+
+def factores_semana(X, dia_semana, semanas=SEMANAS_ESTACIONALIDAD):
+    """
+    Índice estacional por día de la semana (n × 7) de las últimas semanas:
+    media del día / media general. ``dia_semana`` es el día (0 = lunes) de cada columna.
+
+    Con demanda intermitente (menos de ``MINIMO_ESTACIONAL`` unidades diarias)
+    los índices son puro ruido, así que esos productos quedan con índice 1.
+    """
+    ventana = min(X.shape[1], semanas * 7)
+    reciente, dias = X[:, -ventana:], dia_semana[-ventana:]
+    media = reciente.mean(axis=1, keepdims=True)
+    factores = np.ones((X.shape[0], 7), dtype=np.float32)
+    for d in range(7):
+        columnas = dias == d
+        if columnas.any():
+            np.divide(reciente[:, columnas].mean(axis=1, keepdims=True), media,
+                      out=factores[:, d:d + 1], where=media > 0)
+    factores[media[:, 0] < MINIMO_ESTACIONAL] = 1
+    return np.clip(factores, 1 / LIMITE_FACTOR, LIMITE_FACTOR)
+
+
+def _ajustar(X, dia_semana, alfa):
+    """Nivel de cada modelo y los factores semanales, ajustados sobre X"""
+    factores = factores_semana(X, dia_semana)
+    desestacionalizada = X / factores[:, dia_semana]
+    return {
+        'media_movil': X[:, -VENTANA_MEDIA:].mean(axis=1),
+        'suavizado': nivel_suavizado(X, alfa),
+        'estacional': nivel_suavizado(desestacionalizada, alfa),
+    }, factores
+
+
+def _proyectar(niveles, factores, dias_futuros):
+    """Matriz n × len(dias_futuros) con el pronóstico diario de cada modelo"""
+    return {
+        'media_movil': np.repeat(niveles['media_movil'][:, None], len(dias_futuros), axis=1),
+        'suavizado': np.repeat(niveles['suavizado'][:, None], len(dias_futuros), axis=1),
+        'estacional': niveles['estacional'][:, None] * factores[:, dias_futuros],
+    }
+
+
+def pronosticar_bloque(X, dia_semana_inicio, horizonte=HORIZONTE, alfa=ALFA, estacional=True):
+    """
+    Pronostica un bloque de filas de la matriz de consumo.
+
+    Devuelve (índice del método elegido, demanda diaria, demanda en el
+    horizonte, desviación diaria), cada uno un arreglo por fila.
+    """
+    n, dias = X.shape
+    if dias < 2 or horizonte < 1:
+        raise ValueError('Se necesitan al menos 2 días de historial y un horizonte de al menos 1 día.')
+    dia_semana = (dia_semana_inicio + np.arange(dias)) % 7
+    metodos = METODOS if estacional else METODOS[:2]
+
+    # Selección del modelo: se ajusta sin las últimas jornadas y se mide el error sobre ellas
+    v = min(DIAS_VALIDACION, dias // 2)
+    niveles, factores = _ajustar(X[:, :-v], dia_semana[:-v], alfa)
+    validacion = _proyectar(niveles, factores, dia_semana[-v:])
+    real = X[:, -v:]
+    errores = np.stack([np.square(validacion[m] - real).mean(axis=1) for m in metodos], axis=1)
+    elegido = errores.argmin(axis=1)
+
+    residuos = np.stack([validacion[m] - real for m in metodos], axis=1)
+    desviacion = residuos[np.arange(n), elegido].std(axis=1)
+
+    # Pronóstico con el historial completo
+    niveles, factores = _ajustar(X, dia_semana, alfa)
+    futuros = (dia_semana_inicio + dias + np.arange(horizonte)) % 7
+    proyeccion = _proyectar(niveles, factores, futuros)
+    total = np.stack([proyeccion[m].sum(axis=1) for m in metodos], axis=1)[np.arange(n), elegido]
+    total = np.maximum(total, 0)
+    return elegido, total / horizonte, total, desviacion
+
+
+def actualizar_pronosticos(dias=DIAS_HISTORIAL, horizonte=HORIZONTE, alfa=ALFA,
+                           estacional=True, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Recalcula y guarda el pronóstico de todos los productos activos.
+    Devuelve un resumen con el número de productos por método.
+    """
+    if dias < 2 * DIAS_VALIDACION:
+        raise ValueError(f'El historial debe tener al menos {2 * DIAS_VALIDACION} días.')
+    if horizonte < 1:
+        raise ValueError('El horizonte debe ser de al menos 1 día.')
+    if not 0 < alfa < 1:
+        raise ValueError('Alfa debe cumplir 0 < alfa < 1.')
+    if tamano_bloque < 1:
+        raise ValueError('El bloque debe tener al menos 1 producto.')
+    ids = np.array(
+        list(Producto.objects.filter(estado=True).order_by('pk').values_list('pk', flat=True)),
+        dtype=np.int64,
+    )
+    matriz, inicio = matriz_consumo(ids, dias)
+    ahora = timezone.now()
+    resumen = dict.fromkeys(METODOS + ('sin_datos',), 0)
+
+    filas = []
+    for a in range(0, len(ids), tamano_bloque):
+        X = matriz[a:a + tamano_bloque]
+        elegido, diaria, total, desviacion = pronosticar_bloque(
+            X, inicio.weekday(), horizonte=horizonte, alfa=alfa, estacional=estacional,
+        )
+        sin_datos = X.sum(axis=1) == 0
+        for pk, m, d, t, s, vacio in zip(ids[a:a + tamano_bloque].tolist(), elegido.tolist(), diaria.tolist(),
+                                         total.tolist(), desviacion.tolist(), sin_datos.tolist()):
+            metodo = 'sin_datos' if vacio else METODOS[m]
+            resumen[metodo] += 1
+            filas.append((pk, metodo, round(d, 4), round(t, 2), round(s, 4), horizonte, dias, ahora))
+
+    with transaction.atomic():
+        insertar_en_bloque(
+            PronosticoDemanda, filas, CAMPOS_PRONOSTICO,
+            conflicto=('producto',), actualizar=CAMPOS_PRONOSTICO[1:],
+        )
+        PronosticoDemanda.objects.exclude(producto__estado=True).delete()
+    return resumen
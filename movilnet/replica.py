@@ -0,0 +1,251 @@
+"""
+Réplica de solo lectura para reportes.
+
+Los reportes, el kardex y el dashboard recorren tablas completas; en la base
+principal compiten con las escrituras de las ventas. Las vistas decoradas
+con ``lee_de_replica`` leen los modelos de ``movilnet`` del alias
+``settings.REPLICA_ALIAS``:
+
+- Si es un SQLite (lo normal), es una copia de ``db.sqlite3`` que se
+  refresca cada ``settings.REPLICA_INTERVALO_SEGUNDOS`` (un hilo por proceso,
+  o el comando ``actualizar_replica`` desde cron). La copia se hace con la
+  API de backup de SQLite en un archivo temporal, que luego reemplaza a la
+  réplica de una vez: los lectores nunca ven un archivo a medias.
+- Si es otro motor (una réplica de PostgreSQL, por ejemplo), se usa tal cual.
+
+Si la copia tiene más de ``settings.REPLICA_ATRASO_MAXIMO_SEGUNDOS`` o no
+existe, la vista lee de la base principal. Si una consulta falla en la
+réplica (p. ej. una migración reciente aún no copiada), la vista se repite
+completa contra la principal. Las escrituras, la sesión y los usuarios van
+siempre a la principal.
+"""
+import atexit
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+_en_replica = contextvars.ContextVar('replica_en_uso', default=False)
+
+MOTOR_SQLITE = 'django.db.backends.sqlite3'
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def alias():
+    return _config('REPLICA_ALIAS', 'replica')
+
+
+def configurada():
+    return alias() in settings.DATABASES
+
+
+def es_copia_sqlite():
+    """La réplica es una copia de archivo que mantiene esta aplicación (no una réplica del servidor)"""
+    return (
+        configurada()
+        and settings.DATABASES[alias()]['ENGINE'] == MOTOR_SQLITE
+        and settings.DATABASES[DEFAULT_DB_ALIAS]['ENGINE'] == MOTOR_SQLITE
+    )
+
+
+def ruta():
+    return Path(settings.DATABASES[alias()]['NAME'])
+
+
+def atraso():
+    """Segundos desde que se tomó la copia (None si la réplica no existe o no es una copia)"""
+    if not es_copia_sqlite():
+        return None
+    try:
+        return max(time.time() - os.stat(ruta()).st_mtime, 0.0)
+    except FileNotFoundError:
+        return None
+
+
+def disponible():
+    """La réplica existe y está dentro del atraso permitido"""
+    if not configurada():
+        return False
+    if not es_copia_sqlite():
+        return True
+    edad = atraso()
+    return edad is not None and edad <= _config('REPLICA_ATRASO_MAXIMO_SEGUNDOS', 900)
+
+
+class RouterReplica:
+    """Lecturas de ``movilnet`` a la réplica dentro de ``lee_de_replica``; todo lo demás a la principal"""
+
+    def db_for_read(self, model, **hints):
+        if _en_replica.get() and model._meta.app_label == 'movilnet':
+            return alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explícito: sin esto Django escribiría en la BD de la que se leyó la instancia
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, alias()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == alias():
+            return False
+        return None
+
+
+# ==================== VISTAS ====================
+
+def _iterar_en_replica(contenido):
+    """Itera una respuesta en streaming leyendo de la réplica en cada fragmento"""
+    iterador = iter(contenido)
+    while True:
+        token = _en_replica.set(True)
+        try:
+            fragmento = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _en_replica.reset(token)
+        yield fragmento
+
+
+def _preparar():
+    """Arranca el refresco de la copia si hace falta y dice si la réplica se puede usar"""
+    if es_copia_sqlite() and _config('REPLICA_INTERVALO_SEGUNDOS', 300):
+        obtener_actualizador().iniciar()
+    return disponible()
+
+
+def lee_de_replica(vista):
+    """Decorador para vistas de solo lectura (reportes, exportaciones, dashboard); admite vistas asíncronas"""
+    if iscoroutinefunction(vista):
+        @functools.wraps(vista)
+        async def envoltura_asincrona(request, *args, **kwargs):
+            if not _preparar():
+                return await vista(request, *args, **kwargs)
+            token = _en_replica.set(True)
+            try:
+                return await vista(request, *args, **kwargs)
+            except DatabaseError as e:
+                logger.warning('Consulta fallida en la réplica, se repite en la base principal: %s', e)
+            finally:
+                _en_replica.reset(token)
+            return await vista(request, *args, **kwargs)
+        return envoltura_asincrona
+
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not _preparar():
+            return vista(request, *args, **kwargs)
+        token = _en_replica.set(True)
+        try:
+            respuesta = vista(request, *args, **kwargs)
+        except DatabaseError as e:
+            logger.warning('Consulta fallida en la réplica, se repite en la base principal: %s', e)
+        else:
+            if getattr(respuesta, 'streaming', False):
+                respuesta.streaming_content = _iterar_en_replica(respuesta.streaming_content)
+            return respuesta
+        finally:
+            _en_replica.reset(token)
+        return vista(request, *args, **kwargs)
+    return envoltura
+
+
+# ==================== ACTUALIZACIÓN DE LA COPIA ====================
+
+def actualizar(using=DEFAULT_DB_ALIAS):
+    """
+    Copia la base principal a la réplica. La copia se hace en un solo paso de
+    la API de backup (una lectura consistente; en WAL no detiene a los
+    escritores) y reemplaza la réplica con ``os.replace``. Devuelve los
+    segundos que tardó.
+    """
+    destino = ruta()
+    inicio = time.time()
+    fd, temporal = tempfile.mkstemp(prefix=f'{destino.name}.', suffix='.tmp', dir=destino.parent)
+    os.close(fd)
+    try:
+        origen = sqlite3.connect(settings.DATABASES[using]['NAME'], timeout=30)
+        copia = sqlite3.connect(temporal)
+        try:
+            origen.backup(copia)
+            # La réplica no usa WAL: se reemplaza entera y nadie escribe en ella
+            copia.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            copia.close()
+            origen.close()
+        # La antigüedad de la réplica es la del momento en que empezó la copia
+        os.utime(temporal, (inicio, inicio))
+        os.replace(temporal, destino)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+    return time.time() - inicio
+
+
+class ActualizadorReplica:
+    """Hilo que refresca la réplica cuando su copia tiene más de ``intervalo`` segundos"""
+
+    def __init__(self, intervalo=300.0):
+        self.intervalo = intervalo
+        self._hilo = None
+        self._detener = threading.Event()
+        self._candado = threading.Lock()
+
+    def iniciar(self):
+        with self._candado:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='replica-actualizador', daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def _bucle(self):
+        while True:
+            edad = atraso()
+            # Con varios procesos, el primero que encuentra la copia vencida la refresca
+            if edad is None or edad >= self.intervalo:
+                try:
+                    segundos = actualizar()
+                    logger.info('Réplica actualizada en %.2f s', segundos)
+                except Exception:
+                    logger.exception('No se pudo actualizar la réplica')
+            if self._detener.wait(self.intervalo):
+                return
+
+
+_actualizador = None
+_actualizador_candado = threading.Lock()
+
+
+def obtener_actualizador():
+    global _actualizador
+    if _actualizador is None:
+        with _actualizador_candado:
+            if _actualizador is None:
+                _actualizador = ActualizadorReplica(intervalo=_config('REPLICA_INTERVALO_SEGUNDOS', 300))
+                atexit.register(_actualizador.detener)
+    return _actualizador
@@ -0,0 +1,181 @@
+"""
+Motor de reposición: cantidad a pedir por producto para volver a ``stock_maximo``.
+
+Todo el catálogo se calcula de una vez con arreglos de NumPy. Cada consulta
+agregada (consumo, mercancía en tránsito) trae una fila por producto y se
+ubica en los arreglos con ``searchsorted`` sobre los ids ordenados.
+
+Para cada producto:
+
+    demanda_diaria = pronóstico guardado en ``PronosticoDemanda`` o, si el
+                     producto no tiene, consumo de los últimos ``dias_consumo`` días / dias_consumo
+    proyectado     = stock_actual + en_transito - demanda_diaria * dias_entrega
+    punto_reorden  = max(stock_minimo, demanda_diaria * dias_entrega)
+    sugerido       = stock_maximo - proyectado   (si proyectado <= punto_reorden)
+
+El consumo son las salidas de ``MovimientoInventario`` más lo despachado en
+notas de entrega (que descuentan stock sin generar movimientos). En tránsito
+son las órdenes de compra (tipo 'orden') aún no recibidas de los últimos
+``dias_transito`` días.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery
+from django.utils import timezone
+
+from .bd import insertar_en_bloque
+from .numeracion import reservar_numeros, SERIE_ORDEN
+from .models import (
+    Producto, MovimientoInventario, DetalleNotaEntrega,
+    OrdenCompra, DetalleOrdenCompra, PronosticoDemanda,
+)
+
+
+def alinear_por_producto(ids, consulta):
+    """Vuelca una consulta de pares (producto_id, total) en un arreglo alineado con ``ids``"""
+    valores = np.zeros(len(ids), dtype=np.float64)
+    pares = np.array(list(consulta), dtype=np.float64).reshape(-1, 2)
+    if len(pares):
+        posiciones = np.searchsorted(ids, pares[:, 0].astype(np.int64))
+        validas = (posiciones < len(ids))
+        validas[validas] &= ids[posiciones[validas]] == pares[validas, 0]
+        np.add.at(valores, posiciones[validas], pares[validas, 1])
+    return valores
+
+
+def consumo_por_producto(ids, desde):
+    """Unidades que salieron de cada producto desde la fecha indicada"""
+    salidas = MovimientoInventario.objects.filter(
+        tipo_inventario__direccion='SALIDA', fecha_movimiento__gte=desde,
+    ).values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total').order_by()
+    despachos = DetalleNotaEntrega.objects.filter(
+        nota_entrega__fecha_registro__gte=desde,
+    ).values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total').order_by()
+    return alinear_por_producto(ids, salidas) + alinear_por_producto(ids, despachos)
+
+
+def transito_por_producto(ids, desde):
+    """Unidades pedidas en órdenes de compra pendientes de recibir"""
+    pedidos = DetalleOrdenCompra.objects.filter(
+        orden_compra__tipo='orden', orden_compra__fecha_orden__gte=desde,
+    ).values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total').order_by()
+    return alinear_por_producto(ids, pedidos)
+
+
+def pronostico_por_producto(ids):
+    """(demanda diaria pronosticada, máscara de productos con pronóstico) alineados con ``ids``"""
+    pronosticos = list(PronosticoDemanda.objects.filter(producto__estado=True).values_list('producto_id', 'demanda_diaria'))
+    demanda = alinear_por_producto(ids, pronosticos)
+    tiene = alinear_por_producto(ids, ((pk, 1) for pk, _ in pronosticos)) > 0
+    return demanda, tiene
+
+
+def calcular_reposicion(dias_consumo=30, dias_entrega=7, dias_transito=30, marca=None, usar_pronostico=True):
+    """
+    Calcula la reposición de todos los productos activos (o de una marca).
+
+    Devuelve un diccionario de arreglos alineados por producto: ``ids``,
+    ``marca``, ``stock``, ``minimo``, ``maximo``, ``consumo``, ``transito``,
+    ``demanda_diaria``, ``proyectado``, ``punto_reorden``, ``sugerido`` y
+    ``cobertura`` (días que alcanza el stock proyectado).
+    """
+    productos = Producto.objects.filter(estado=True)
+    if marca:
+        productos = productos.filter(marca_id=marca)
+    filas = np.array(
+        list(productos.order_by('pk').values_list('pk', 'marca_id', 'stock_actual', 'stock_minimo', 'stock_maximo')),
+        dtype=np.int64,
+    ).reshape(-1, 5)
+    ids = filas[:, 0]
+
+    ahora = timezone.now()
+    consumo = consumo_por_producto(ids, ahora - timedelta(days=dias_consumo))
+    transito = transito_por_producto(ids, (ahora - timedelta(days=dias_transito)).date())
+    stock, minimo, maximo = filas[:, 2], filas[:, 3], filas[:, 4]
+
+    demanda_diaria = consumo / max(dias_consumo, 1)
+    if usar_pronostico:
+        pronostico, tiene_pronostico = pronostico_por_producto(ids)
+        demanda_diaria = np.where(tiene_pronostico, pronostico, demanda_diaria)
+    demanda_entrega = demanda_diaria * dias_entrega
+    proyectado = stock + transito - demanda_entrega
+    punto_reorden = np.maximum(minimo, demanda_entrega)
+    sugerido = np.where(proyectado <= punto_reorden, np.ceil(maximo - proyectado), 0)
+    sugerido = np.maximum(sugerido, 0).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cobertura = np.where(demanda_diaria > 0, proyectado / demanda_diaria, np.inf)
+
+    return {
+        'ids': ids, 'marca': filas[:, 1], 'stock': stock, 'minimo': minimo, 'maximo': maximo,
+        'consumo': consumo, 'transito': transito, 'demanda_diaria': demanda_diaria,
+        'proyectado': proyectado, 'punto_reorden': punto_reorden,
+        'sugerido': sugerido, 'cobertura': cobertura,
+    }
+
+
+def sugerencias(calculo):
+    """Índices de los productos a pedir, del más urgente (menor cobertura) al menos urgente"""
+    indices = np.flatnonzero(calculo['sugerido'] > 0)
+    orden = np.lexsort((calculo['ids'][indices], calculo['cobertura'][indices]))
+    return indices[orden]
+
+
+def ultimo_costo(ids):
+    """{producto_id: último precio unitario de compra} para los productos indicados"""
+    ultimo = DetalleOrdenCompra.objects.filter(
+        producto=OuterRef('pk'), precio_unitario__gt=0,
+    ).order_by('-orden_compra__fecha_orden', '-pk').values('precio_unitario')[:1]
+    costos = {}
+    ids = [int(pk) for pk in ids]
+    for i in range(0, len(ids), 900):
+        costos.update(
+            Producto.objects.filter(pk__in=ids[i:i + 900]).annotate(costo=Subquery(ultimo))
+            .exclude(costo=None).values_list('pk', 'costo')
+        )
+    return costos
+
+
+def generar_ordenes(calculo, proveedor, por_marca=False, observaciones=None):
+    """
+    Crea órdenes de compra (tipo 'orden') con las cantidades sugeridas para el
+    proveedor indicado: una sola orden, o una por marca con ``por_marca``.
+    Los detalles se insertan en bloque. Devuelve la lista de órdenes creadas.
+    """
+    indices = sugerencias(calculo)
+    if not len(indices):
+        return []
+
+    ids = calculo['ids'][indices]
+    cantidades = calculo['sugerido'][indices]
+    costos = ultimo_costo(ids)
+    grupos = calculo['marca'][indices] if por_marca else np.zeros(len(indices), dtype=np.int64)
+
+    ahora = timezone.localtime()
+    unicos = np.unique(grupos)
+    ordenes = []
+    with transaction.atomic():
+        # Los números se reservan en bloque y en la misma transacción: si falla, no quedan saltos
+        numeros = reservar_numeros(SERIE_ORDEN, len(unicos), ahora.year)
+        for numero, grupo in zip(numeros, unicos):
+            en_grupo = grupos == grupo
+            lineas = [
+                (pk, cantidad, costos.get(pk, Decimal('0')))
+                for pk, cantidad in zip(ids[en_grupo].tolist(), cantidades[en_grupo].tolist())
+            ]
+            orden = OrdenCompra.objects.create(
+                proveedor=proveedor, tipo='orden',
+                numero_orden=numero,
+                fecha_orden=ahora.date(),
+                total=sum((costo * cantidad for _, cantidad, costo in lineas), Decimal('0')),
+                observaciones=observaciones or 'Generada por el motor de reposición',
+            )
+            insertar_en_bloque(
+                DetalleOrdenCompra,
+                [(orden.pk, pk, cantidad, costo) for pk, cantidad, costo in lineas],
+                ('orden_compra', 'producto', 'cantidad', 'precio_unitario'),
+            )
+            ordenes.append(orden)
+    return ordenes
@@ -0,0 +1,181 @@
+"""
+Reservas de stock para notas de entrega en preparación.
+
+Mientras un empleado arma una nota, cada línea aparta sus unidades con una
+``ReservaStock`` por (producto, sesión) que vence a los
+``settings.RESERVAS_VIGENCIA_SEGUNDOS``; cambiar la cantidad renueva la
+reserva. El stock disponible para los demás es::
+
+    disponible = stock_actual - reservas vigentes de otras sesiones
+
+``anotar_disponible`` lo calcula para todo un queryset de productos en la
+misma consulta (subconsulta agregada por producto), así que la lista de
+productos del formulario no hace una consulta por fila. Las reservas
+vencidas dejan de contar en cuanto vencen; un hilo en segundo plano las
+borra en bloque cada ``settings.RESERVAS_INTERVALO_BARRIDO`` segundos (y el
+comando ``purgar_reservas`` hace lo mismo desde cron).
+
+Al guardar la nota se liberan las reservas de sus productos: el stock ya
+quedó descontado.
+"""
+import atexit
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .importacion import en_lotes
+from .models import Producto, ReservaStock
+
+logger = logging.getLogger(__name__)
+
+TAMANO_CONSULTA = 900
+
+
+class StockNoDisponible(Exception):
+    """No hay unidades libres para la reserva pedida"""
+
+    def __init__(self, disponible):
+        super().__init__(disponible)
+        self.disponible = disponible
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def vigencia():
+    return timedelta(seconds=_config('RESERVAS_VIGENCIA_SEGUNDOS', 900))
+
+
+def sesion_de(request):
+    """Clave de la sesión de la petición (la crea si aún no existe)"""
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def activas(excluir_sesion=None):
+    reservas = ReservaStock.objects.filter(vence__gt=timezone.now())
+    if excluir_sesion:
+        reservas = reservas.exclude(sesion=excluir_sesion)
+    return reservas
+
+
+def reservado(excluir_sesion=None):
+    """Expresión con las unidades reservadas (vigentes) del producto de la fila externa"""
+    total = activas(excluir_sesion).filter(producto=OuterRef('pk')).order_by().values('producto').annotate(
+        total=Sum('cantidad'),
+    ).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def anotar_disponible(productos, excluir_sesion=None):
+    """Anota ``reservado`` y ``disponible`` en un queryset de productos (una sola consulta)"""
+    return productos.annotate(reservado=reservado(excluir_sesion)).annotate(
+        disponible=F('stock_actual') - F('reservado'),
+    )
+
+
+def disponibles(ids, excluir_sesion=None):
+    """{producto_id: unidades disponibles} descontando las reservas de otras sesiones"""
+    resultado = {}
+    for lote in en_lotes(ids, TAMANO_CONSULTA):
+        resultado.update(
+            anotar_disponible(Producto.objects.filter(pk__in=lote), excluir_sesion).values_list('pk', 'disponible')
+        )
+    return resultado
+
+
+def reservar(request, producto_id, cantidad):
+    """
+    Aparta ``cantidad`` unidades del producto para la sesión de la petición
+    (reemplaza su reserva anterior del producto; 0 la libera). Lanza
+    ``StockNoDisponible`` si no alcanzan. Devuelve la fecha de vencimiento.
+    """
+    sesion = sesion_de(request)
+    vence = timezone.now() + vigencia()
+    obtener_barredor().iniciar()
+    with transaction.atomic():
+        # Se escribe primero: la transacción toma el bloqueo de escritura antes
+        # de leer, así dos reservas simultáneas del mismo producto no se cruzan.
+        ReservaStock.objects.filter(producto_id=producto_id, sesion=sesion).delete()
+        if cantidad <= 0:
+            return None
+        ReservaStock.objects.create(
+            producto_id=producto_id, sesion=sesion, cantidad=cantidad, vence=vence,
+            usuario=request.user if request.user.is_authenticated else None,
+        )
+        disponible = anotar_disponible(Producto.objects.select_for_update().filter(pk=producto_id)).values_list(
+            'disponible', flat=True,
+        ).first()
+        if disponible is None or disponible < 0:
+            raise StockNoDisponible(0 if disponible is None else disponible + cantidad)
+    return vence
+
+
+def liberar(sesion, productos=None):
+    """Borra las reservas de la sesión (solo las de ``productos`` si se indican)"""
+    reservas = ReservaStock.objects.filter(sesion=sesion)
+    if productos is not None:
+        reservas = reservas.filter(producto_id__in=list(productos))
+    reservas.delete()
+
+
+def purgar_vencidas():
+    """Borra en bloque las reservas vencidas. Devuelve cuántas se borraron"""
+    borradas, _ = ReservaStock.objects.filter(vence__lte=timezone.now()).delete()
+    return borradas
+
+
+# ==================== BARRIDO EN SEGUNDO PLANO ====================
+
+class BarredorReservas:
+    """Hilo que borra periódicamente las reservas vencidas"""
+
+    def __init__(self, intervalo=60.0):
+        self.intervalo = intervalo
+        self._hilo = None
+        self._detener = threading.Event()
+        self._candado = threading.Lock()
+
+    def iniciar(self):
+        with self._candado:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='reservas-barredor', daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                purgar_vencidas()
+            except Exception:
+                logger.exception('No se pudieron borrar las reservas vencidas')
+            finally:
+                close_old_connections()
+
+
+_barredor = None
+_barredor_candado = threading.Lock()
+
+
+def obtener_barredor():
+    global _barredor
+    if _barredor is None:
+        with _barredor_candado:
+            if _barredor is None:
+                _barredor = BarredorReservas(intervalo=_config('RESERVAS_INTERVALO_BARRIDO', 60))
+                atexit.register(_barredor.detener)
+    return _barredor
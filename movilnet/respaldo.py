@@ -0,0 +1,188 @@
+"""
+Respaldo en caliente y restauración de la base SQLite.
+
+Copiar ``db.sqlite3`` con la aplicación en marcha puede dar un archivo roto
+(páginas de antes y después de una transacción, o un WAL sin copiar).
+``respaldar`` usa la API de backup de SQLite:
+
+1. Copia ``settings.RESPALDO_PAGINAS_POR_PASO`` páginas por paso y duerme
+   ``settings.RESPALDO_PAUSA_SEGUNDOS`` entre pasos, soltando el bloqueo de
+   lectura para que los escritores avancen. Si alguien escribe durante la
+   copia, SQLite la reinicia; tras ``RESPALDO_MAX_REINICIOS`` reinicios se
+   termina en un solo paso (en WAL no detiene a los escritores).
+2. Comprueba la copia con ``PRAGMA integrity_check`` y la deja en modo
+   DELETE (un solo archivo, sin WAL).
+3. La comprime con gzip en ``settings.RESPALDO_DIR`` como
+   ``respaldo-AAAAMMDD-HHMMSS.sqlite3.gz``; el archivo final aparece solo
+   cuando está completo.
+
+``restaurar`` descomprime un respaldo en un archivo temporal junto al
+destino, lo verifica (``quick_check``) y lo coloca con ``os.replace``. Un
+archivo que no se puede descomprimir también es ``RespaldoInvalido``.
+"""
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = 'respaldo-'
+EXTENSION = '.sqlite3.gz'
+TAMANO_BUFFER = 1024 * 1024
+
+
+class RespaldoInvalido(Exception):
+    """La copia no pasó la verificación de integridad o el archivo no se puede descomprimir"""
+
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def directorio():
+    return Path(_config('RESPALDO_DIR', settings.BASE_DIR / 'respaldos'))
+
+
+def respaldos(carpeta=None):
+    """Respaldos de la carpeta (por defecto ``RESPALDO_DIR``), del más reciente al más antiguo"""
+    carpeta = Path(carpeta) if carpeta else directorio()
+    if not carpeta.is_dir():
+        return []
+    return sorted(carpeta.glob(f'{PREFIJO}*{EXTENSION}'), reverse=True)
+
+
+def verificar(ruta, rapido=False):
+    """Lanza ``RespaldoInvalido`` si la base de datos de ``ruta`` está dañada"""
+    conexion = sqlite3.connect(ruta)
+    try:
+        filas = conexion.execute('PRAGMA quick_check' if rapido else 'PRAGMA integrity_check').fetchall()
+    except sqlite3.DatabaseError as e:
+        raise RespaldoInvalido(str(e)) from e
+    finally:
+        conexion.close()
+    if filas != [('ok',)]:
+        raise RespaldoInvalido('; '.join(fila[0] for fila in filas[:10]))
+
+
+def _copiar(origen, copia, paginas, pausa, max_reinicios):
+    """Copia por pasos; devuelve cuántas veces se reinició la copia por escrituras concurrentes"""
+    estado = {'restantes': None, 'reinicios': 0}
+
+    def progreso(_status, restantes, _total):
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > max_reinicios:
+                raise _DemasiadosReinicios()
+        estado['restantes'] = restantes
+
+    try:
+        origen.backup(copia, pages=paginas, progress=progreso, sleep=pausa)
+    except _DemasiadosReinicios:
+        logger.warning('El respaldo se reinició %d veces; se termina en un solo paso', estado['reinicios'])
+        origen.backup(copia)
+    return estado['reinicios']
+
+
+def respaldar(using=DEFAULT_DB_ALIAS, carpeta=None, nivel=6, verificar_integridad=True):
+    """
+    Respalda la base de datos en caliente. Devuelve un dict con ``archivo``,
+    ``tamano`` (bytes sin comprimir), ``comprimido``, ``reinicios`` y ``segundos``.
+    """
+    inicio = time.monotonic()
+    carpeta = Path(carpeta) if carpeta else directorio()
+    carpeta.mkdir(parents=True, exist_ok=True)
+    destino = carpeta / f'{PREFIJO}{timezone.localtime():%Y%m%d-%H%M%S}{EXTENSION}'
+
+    fd, temporal = tempfile.mkstemp(prefix='.respaldo-', suffix='.sqlite3', dir=carpeta)
+    os.close(fd)
+    comprimido = Path(f'{temporal}.gz')
+    try:
+        origen = sqlite3.connect(settings.DATABASES[using]['NAME'], timeout=30)
+        copia = sqlite3.connect(temporal)
+        try:
+            reinicios = _copiar(
+                origen, copia,
+                paginas=_config('RESPALDO_PAGINAS_POR_PASO', 1024),
+                pausa=_config('RESPALDO_PAUSA_SEGUNDOS', 0.01),
+                max_reinicios=_config('RESPALDO_MAX_REINICIOS', 5),
+            )
+            copia.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            copia.close()
+            origen.close()
+        if verificar_integridad:
+            verificar(temporal)
+
+        with open(temporal, 'rb') as entrada, gzip.open(comprimido, 'wb', compresslevel=nivel) as salida:
+            shutil.copyfileobj(entrada, salida, TAMANO_BUFFER)
+        tamano = os.path.getsize(temporal)
+        os.replace(comprimido, destino)
+    finally:
+        Path(temporal).unlink(missing_ok=True)
+        comprimido.unlink(missing_ok=True)
+    return {
+        'archivo': destino,
+        'tamano': tamano,
+        'comprimido': destino.stat().st_size,
+        'reinicios': reinicios,
+        'segundos': time.monotonic() - inicio,
+    }
+
+
+def podar(conservar, carpeta=None):
+    """Borra los respaldos más antiguos y deja los ``conservar`` más recientes. Devuelve los borrados"""
+    borrados = []
+    for archivo in respaldos(carpeta)[conservar:]:
+        archivo.unlink()
+        borrados.append(archivo)
+    return borrados
+
+
+def restaurar(archivo, destino, reemplazar=False):
+    """
+    Restaura un respaldo (``.sqlite3.gz`` o ``.sqlite3``) en ``destino``.
+    Si ``destino`` existe hay que pasar ``reemplazar=True``: su WAL y su
+    memoria compartida se borran, así que ningún proceso debe tenerla abierta.
+    Devuelve los segundos que tardó.
+    """
+    inicio = time.monotonic()
+    archivo, destino = Path(archivo), Path(destino)
+    if destino.exists() and not reemplazar:
+        raise FileExistsError(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(prefix=f'.{destino.name}.', suffix='.tmp', dir=destino.parent)
+    try:
+        abrir = gzip.open if archivo.suffix == '.gz' else open
+        with abrir(archivo, 'rb') as entrada, os.fdopen(fd, 'wb') as salida:
+            while True:
+                # Un .gz truncado o dañado falla al leerlo, antes de llegar a verificar()
+                try:
+                    bloque = entrada.read(TAMANO_BUFFER)
+                except (OSError, EOFError, zlib.error) as e:
+                    raise RespaldoInvalido(f'no se pudo descomprimir {archivo.name}: {e}') from e
+                if not bloque:
+                    break
+                salida.write(bloque)
+        verificar(temporal, rapido=True)
+        # Un WAL de la base anterior se aplicaría sobre la restaurada y la corrompería
+        for sufijo in ('-wal', '-shm', '-journal'):
+            Path(f'{destino}{sufijo}').unlink(missing_ok=True)
+        os.replace(temporal, destino)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+    return time.monotonic() - inicio
@@ -0,0 +1,194 @@
+"""
+Simulación de Monte Carlo del riesgo de quiebre de stock.
+
+Para cada producto se simulan ``simulaciones`` trayectorias de ``horizonte``
+días. La demanda de cada día simulado se toma al azar (con reposición) de
+los consumos diarios reales de los últimos ``dias_historial`` días, de modo
+que se respeta la distribución empírica de cada producto: días sin venta,
+picos, etc. La oferta es el ``stock_actual`` más lo pedido en órdenes de
+compra pendientes, que se supone llega ``dias_entrega`` días después de la
+fecha de la orden (las atrasadas, el primer día).
+
+Hay quiebre en una trayectoria cuando la demanda acumulada supera a la
+oferta acumulada algún día del horizonte. Por producto se guarda en
+``RiesgoQuiebre`` la fracción de trayectorias con quiebre, la mediana del
+día del quiebre y el faltante medio al final del horizonte.
+
+Las simulaciones son matrices productos × simulaciones que avanzan día a día
+y se procesan por bloques de productos; en catálogos grandes los bloques se
+reparten entre procesos. Los productos que no pueden quebrar aunque vendan su máximo diario
+histórico todos los días no se simulan.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .bd import insertar_en_bloque
+from .models import Producto, DetalleOrdenCompra, RiesgoQuiebre
+from .pronostico import matriz_consumo
+
+HORIZONTE = 30
+SIMULACIONES = 2000
+DIAS_HISTORIAL = 90
+DIAS_ENTREGA = 7
+DIAS_TRANSITO = 30
+ELEMENTOS_BLOQUE = 130_000      # productos × simulaciones por bloque (~0.5 MB por matriz, cabe en caché)
+MINIMO_PARALELO = 500           # productos a simular a partir de los cuales se usa el pool
+
+CAMPOS_RIESGO = (
+    'producto', 'probabilidad', 'dias_quiebre', 'faltante_esperado',
+    'horizonte_dias', 'simulaciones', 'fecha_calculo',
+)
+
+
+def llegadas_por_dia(ids, horizonte=HORIZONTE, dias_entrega=DIAS_ENTREGA, dias_transito=DIAS_TRANSITO):
+    """Matriz (len(ids) × horizonte) con las unidades en tránsito que llegan cada día"""
+    hoy = timezone.localdate()
+    llegadas = np.zeros((len(ids), horizonte), dtype=np.float32)
+    pedidos = DetalleOrdenCompra.objects.filter(
+        orden_compra__tipo='orden', orden_compra__fecha_orden__gte=hoy - timedelta(days=dias_transito),
+    ).values('producto_id', 'orden_compra__fecha_orden').annotate(total=Sum('cantidad')).order_by()
+    filas = [
+        (pk, max((fecha + timedelta(days=dias_entrega) - hoy).days, 0), total)
+        for pk, fecha, total in pedidos.values_list('producto_id', 'orden_compra__fecha_orden', 'total')
+    ]
+    datos = np.array(filas, dtype=np.int64).reshape(-1, 3)
+    fila = np.searchsorted(ids, datos[:, 0])
+    validas = (fila < len(ids)) & (datos[:, 1] < horizonte)
+    validas[validas] &= ids[fila[validas]] == datos[validas, 0]
+    np.add.at(llegadas, (fila[validas], datos[validas, 1]), datos[validas, 2])
+    return llegadas
+
+
+def simular_bloque(historial, disponible, llegadas, simulaciones, semilla):
+    """
+    Simula un bloque de productos. ``historial`` es la matriz n × días de
+    consumo, ``disponible`` el stock de cada producto y ``llegadas`` la
+    matriz n × horizonte de reposiciones. Devuelve (probabilidad de quiebre,
+    mediana del día del quiebre —NaN si nunca quiebra—, faltante esperado).
+
+    Se avanza día a día sobre matrices n × simulaciones: la demanda del día
+    se suma a la acumulada y se anota el primer día en que supera a la oferta.
+    El día histórico se sortea con 16 bits aleatorios escalados a ``dias``
+    (multiplicar y desplazar), bastante más rápido que ``rng.integers``; el
+    sesgo es menor que dias / 65536.
+    """
+    n, dias = historial.shape
+    horizonte = llegadas.shape[1]
+    rng = np.random.default_rng(semilla)
+    plano = historial.ravel()
+    desplazamiento = (np.arange(n, dtype=np.uint32) * dias)[:, None]
+    oferta = disponible[:, None] + np.cumsum(llegadas, axis=1)
+
+    acumulado = np.zeros((n, simulaciones), dtype=np.float32)
+    primer_dia = np.zeros((n, simulaciones), dtype=np.int16)     # 0 = sin quiebre
+    indices = np.empty((n, simulaciones), dtype=np.uint32)
+    palabras = -(-n * simulaciones // 4)
+    for dia in range(horizonte):
+        bits = rng.bit_generator.random_raw(palabras).view(np.uint16)[:n * simulaciones].reshape(n, simulaciones)
+        np.multiply(bits, dias, out=indices, dtype=np.uint32)
+        indices >>= 16
+        indices += desplazamiento
+        acumulado += plano[indices]
+        quiebra = acumulado > oferta[:, dia:dia + 1]
+        quiebra &= primer_dia == 0
+        primer_dia[quiebra] = dia + 1
+
+    # Mediana del primer día entre las trayectorias con quiebre (los ceros quedan al inicio al ordenar)
+    sin_quiebre = (primer_dia == 0).sum(axis=1)
+    ordenado = np.sort(primer_dia, axis=1)
+    posicion = np.minimum(sin_quiebre + (simulaciones - sin_quiebre - 1) // 2, simulaciones - 1)
+    mediana = np.where(sin_quiebre < simulaciones,
+                       ordenado[np.arange(n), posicion].astype(np.float64), np.nan)
+    faltante = np.maximum(acumulado - oferta[:, -1:], 0).mean(axis=1)
+    return 1 - sin_quiebre / simulaciones, mediana, faltante
+
+
+def _simular(historial, disponible, llegadas, simulaciones, semilla, procesos):
+    """Reparte los productos en bloques y los simula, en paralelo si corresponde"""
+    n, horizonte = llegadas.shape
+    tamano = max(1, ELEMENTOS_BLOQUE // simulaciones)
+    inicios = range(0, n, tamano)
+    semillas = np.random.SeedSequence(semilla).spawn(len(inicios))
+    bloques = [
+        (historial[a:a + tamano], disponible[a:a + tamano], llegadas[a:a + tamano], simulaciones, s)
+        for a, s in zip(inicios, semillas)
+    ]
+
+    # Los procesos hijos solo hacen cálculo numérico; con 'fork' heredan el módulo ya importado
+    procesos = procesos or os.cpu_count() or 1
+    paralelo = (procesos > 1 and n >= MINIMO_PARALELO and len(bloques) > 1
+                and 'fork' in multiprocessing.get_all_start_methods())
+    if paralelo:
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('fork')) as pool:
+            resultados = list(pool.map(simular_bloque, *zip(*bloques)))
+    else:
+        resultados = [simular_bloque(*bloque) for bloque in bloques]
+
+    if not resultados:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(partes) for partes in zip(*resultados))
+
+
+def simular_riesgo(horizonte=HORIZONTE, simulaciones=SIMULACIONES, dias_historial=DIAS_HISTORIAL,
+                   dias_entrega=DIAS_ENTREGA, dias_transito=DIAS_TRANSITO, semilla=None, procesos=None):
+    """
+    Simula el riesgo de quiebre de todos los productos activos y lo guarda
+    en ``RiesgoQuiebre``. ``procesos`` limita el pool (None = núcleos
+    disponibles, 1 = sin pool). Devuelve un resumen con los productos
+    evaluados, simulados y con riesgo.
+    """
+    if horizonte < 1:
+        raise ValueError('El horizonte debe ser de al menos 1 día.')
+    if simulaciones < 1:
+        raise ValueError('Se necesita al menos 1 simulación por producto.')
+    if dias_historial < 1:
+        raise ValueError('El historial debe tener al menos 1 día.')
+    if dias_entrega < 0 or dias_transito < 0:
+        raise ValueError('Los días de entrega y de tránsito no pueden ser negativos.')
+    if procesos is not None and procesos < 1:
+        raise ValueError('Se necesita al menos 1 proceso.')
+    filas = np.array(
+        list(Producto.objects.filter(estado=True).order_by('pk').values_list('pk', 'stock_actual')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    ids = filas[:, 0]
+    disponible = np.maximum(filas[:, 1], 0).astype(np.float32)
+
+    historial, _ = matriz_consumo(ids, dias_historial)
+    llegadas = llegadas_por_dia(ids, horizonte, dias_entrega, dias_transito)
+
+    # Solo se simulan los productos que podrían quebrar en el peor caso histórico
+    simular = historial.max(axis=1) * horizonte > disponible
+    probabilidad = np.zeros(len(ids))
+    dias_quiebre = np.full(len(ids), np.nan)
+    faltante = np.zeros(len(ids))
+    if simular.any():
+        p, d, f = _simular(historial[simular], disponible[simular], llegadas[simular],
+                           simulaciones, semilla, procesos)
+        probabilidad[simular], dias_quiebre[simular], faltante[simular] = p, d, f
+
+    ahora = timezone.now()
+    filas_riesgo = [
+        (pk, round(p, 4), None if d != d else round(d, 1), round(f, 2), horizonte, simulaciones, ahora)
+        for pk, p, d, f in zip(ids.tolist(), probabilidad.tolist(), dias_quiebre.tolist(), faltante.tolist())
+    ]
+    with transaction.atomic():
+        insertar_en_bloque(
+            RiesgoQuiebre, filas_riesgo, CAMPOS_RIESGO,
+            conflicto=('producto',), actualizar=CAMPOS_RIESGO[1:],
+        )
+        RiesgoQuiebre.objects.exclude(producto__estado=True).delete()
+
+    return {
+        'evaluados': len(ids),
+        'simulados': int(simular.sum()),
+        'con_riesgo': int((probabilidad > 0).sum()),
+        'riesgo_alto': int((probabilidad >= 0.5).sum()),
+    }
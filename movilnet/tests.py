@@ -1,3 +1,513 @@
-from django.test import TestCase
+import gzip
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django import forms
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import concurrencia, costeo, escritura, idempotencia, reservas, respaldo
+from .concurrencia import VersionFormMixin
+from .coordinador import CoordinadorEscritura
+from .forms import NotaEntregaForm
+from .importacion import importar_catalogo
+from .inventario import aplicar_deltas_stock, StockInsuficiente
+from .kardex import iterar_kardex
+from .models import (
+    Marca, Proveedor, Cliente, Producto, OrdenCompra, DetalleOrdenCompra,
+    NotaEntrega, DetalleNotaEntrega, HistorialPrecio, ReservaStock, RiesgoQuiebre,
+)
+from .numeracion import reservar_numeros, siguiente_numero, SERIE_NOTA, SERIE_ORDEN
+from .precios import precios_en_fecha, registrar_cambios
+from .umbrales import calcular_umbrales
+
+
+def crear_producto(nombre='Equipo', stock=0, marca=None):
+    marca = marca or Marca.objects.get_or_create(nombre_marca='Marca de prueba')[0]
+    return Producto.objects.create(marca=marca, nombre=nombre, precio=Decimal('10'), stock_actual=stock)
+
+
+def mover_stock(producto, delta):
+    Producto.objects.filter(pk=producto.pk).update(stock_actual=F('stock_actual') + delta)
+
+
+# ==================== IMPORTACIÓN ====================
+
+def archivo_csv(*filas):
+    return BytesIO('\n'.join(','.join(fila) for fila in filas).encode('utf-8'))
+
+
+class ImportadorProductosTests(TestCase):
+
+    def setUp(self):
+        self.producto = crear_producto('CAÑÓN USB', marca=Marca.objects.create(nombre_marca='Genérica'))
+
+    def test_nombre_con_acentos_en_otra_caja_actualiza_el_existente(self):
+        resultado = importar_catalogo('productos', archivo_csv(
+            ('marca', 'nombre', 'precio'),
+            ('GENÉRICA', 'Cañón USB', '15'),
+        ), 'productos.csv')
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.errores), (0, 1, []))
+        self.assertEqual(Producto.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.precio, Decimal('15'))
+
+    def test_repetido_en_el_archivo_con_otra_caja(self):
+        resultado = importar_catalogo('productos', archivo_csv(
+            ('marca', 'nombre', 'precio'),
+            ('Genérica', 'Pantalla Ñandú', '20'),
+            ('Genérica', 'PANTALLA ÑANDÚ', '21'),
+        ), 'productos.csv', tamano_lote=1)
+        self.assertEqual(resultado.creados, 1)
+        self.assertEqual(resultado.errores, [(3, 'Registro repetido dentro del archivo.')])
+
+
+# ==================== UMBRALES ====================
+
+class AjusteUmbralesTests(TestCase):
+
+    def setUp(self):
+        self.producto = crear_producto(stock=3)
+
+    def test_parametros_fuera_de_rango(self):
+        for parametros in ({'dias_entrega': -3}, {'dias_revision': 0}, {'dias_historial': 0, 'incluir_sin_demanda': True}):
+            with self.subTest(**parametros), self.assertRaises(ValueError):
+                calcular_umbrales(**parametros)
+
+    def test_el_comando_no_escribe_umbrales_invalidos(self):
+        with self.assertRaises(CommandError):
+            call_command('ajustar_umbrales', '--dias-historial', '0', '--incluir-sin-demanda', stdout=StringIO())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_minimo, Producto._meta.get_field('stock_minimo').default)
+
+
+# ==================== RIESGO DE QUIEBRE ====================
+
+class SimularRiesgoTests(TestCase):
+
+    def test_el_comando_rechaza_parametros_fuera_de_rango(self):
+        crear_producto(stock=3)
+        for argumento, valor in (('--simulaciones', '0'), ('--dias-historial', '0'), ('--horizonte', '-1')):
+            with self.subTest(argumento), self.assertRaises(CommandError):
+                call_command('simular_riesgo', argumento, valor, '--procesos', '1', stdout=StringIO())
+        self.assertFalse(RiesgoQuiebre.objects.exists())
+
+
+# ==================== KARDEX ====================
+
+class KardexTests(TestCase):
+    """Compra, venta de todo el stock y compra a otro precio"""
+
+    def test_costo_promedio_coincide_con_el_costeo(self):
+        producto = crear_producto()
+        proveedor = Proveedor.objects.create(nombre='Proveedor', rif='J123456789', telefono='0212', direccion='-')
+        cliente = Cliente.objects.create(nombre='Cliente', cedula='12345678', telefono='0212')
+        inicio = timezone.now() - timedelta(days=3)
+
+        def comprar(numero, cantidad, costo, fecha):
+            orden = OrdenCompra.objects.create(proveedor=proveedor, tipo='compra', numero_orden=numero, fecha_orden=fecha.date())
+            DetalleOrdenCompra.objects.create(orden_compra=orden, producto=producto, cantidad=cantidad, precio_unitario=costo)
+            OrdenCompra.objects.filter(pk=orden.pk).update(fecha_registro=fecha)
+            mover_stock(producto, cantidad)
+            costeo.registrar_entradas([(producto.pk, cantidad, Decimal(costo), None)])
+
+        comprar('C-1', 10, '4', inicio)
+        nota = NotaEntrega.objects.create(cliente=cliente, numero_entrega='N-1')
+        DetalleNotaEntrega.objects.create(nota_entrega=nota, producto=producto, cantidad=10, precio_unitario=Decimal('6'))
+        NotaEntrega.objects.filter(pk=nota.pk).update(fecha_registro=inicio + timedelta(days=1))
+        mover_stock(producto, -10)
+        costeo.consumir({producto.pk: 10})
+        comprar('C-2', 10, '8', inicio + timedelta(days=2))
+
+        producto.refresh_from_db()
+        eventos = list(iterar_kardex(producto))
+        self.assertEqual([e['saldo'] for e in eventos], [10, 0, 10])
+        self.assertEqual(eventos[-1]['costo_promedio'], producto.costo_promedio)
+        self.assertEqual(eventos[-1]['valor_saldo'], Decimal('80.00'))
+
+
+# ==================== COSTEO ====================
+
+class CosteoTests(TestCase):
+    """Compra, venta y compra a otro precio: el promedio es el del stock en existencia"""
+
+    def setUp(self):
+        self.producto = crear_producto()
+
+    def _comprar(self, cantidad, costo):
+        mover_stock(self.producto, cantidad)
+        costeo.registrar_entradas([(self.producto.pk, cantidad, Decimal(costo), None)])
+
+    def _vender(self, cantidad):
+        mover_stock(self.producto, -cantidad)
+        return costeo.consumir({self.producto.pk: cantidad})[self.producto.pk]
+
+    def test_promedio_tras_vender_todo_y_volver_a_comprar(self):
+        self._comprar(10, '4')
+        self.assertEqual(self._vender(10), Decimal('4'))
+        self._comprar(10, '8')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.costo_promedio, Decimal('8'))
+        self.assertEqual(self.producto.valor_fifo, Decimal('80'))
+
+    @override_settings(COSTEO_METODO=costeo.METODO_FIFO)
+    def test_fifo_consume_primero_las_capas_antiguas(self):
+        self._comprar(10, '4')
+        self._comprar(10, '8')
+        self.assertEqual(self._vender(15), Decimal('5.3333'))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.costo_promedio, Decimal('6'))
+        self.assertEqual(self.producto.valor_fifo, Decimal('40'))
+
+    def test_entrada_sin_costo_no_arrastra_el_promedio_a_cero(self):
+        mover_stock(self.producto, 10)
+        costeo.registrar_entradas([(self.producto.pk, 10, None, None)])
+        self._comprar(10, '5')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.costo_promedio, Decimal('5'))
+        self.assertEqual(self.producto.valor_fifo, Decimal('100'))
+
+
+# ==================== PRECIOS ====================
+
+@override_settings(TIME_ZONE='America/Caracas')
+class PreciosEnFechaTests(TestCase):
+
+    def test_horas_sin_zona_se_toman_en_la_hora_local(self):
+        producto = crear_producto()
+        HistorialPrecio.objects.filter(producto=producto).update(
+            vigente_desde=timezone.make_aware(datetime(2026, 1, 1)),
+        )
+        registrar_cambios([(producto.pk, Decimal('10'), Decimal('20'))],
+                          fecha=timezone.make_aware(datetime(2026, 3, 1, 10, 0)))
+        self.assertEqual(precios_en_fecha([
+            (producto.pk, datetime(2026, 3, 1, 9, 0)),
+            (producto.pk, datetime(2026, 3, 1, 11, 0)),
+            (producto.pk, date(2026, 2, 28)),
+            (producto.pk, date(2026, 3, 1)),
+        ]), [Decimal('10'), Decimal('20'), Decimal('10'), Decimal('20')])
+
+
+# ==================== NUMERACIÓN ====================
+
+class NumeracionTests(TestCase):
+
+    def test_numeros_consecutivos_y_en_bloque(self):
+        self.assertEqual(siguiente_numero(SERIE_NOTA, 2026), 'NE-2026-000001')
+        self.assertEqual(reservar_numeros(SERIE_NOTA, 2, 2026), ['NE-2026-000002', 'NE-2026-000003'])
+        self.assertEqual(siguiente_numero(SERIE_ORDEN, 2026), 'OC-2026-000001')
+        self.assertEqual(siguiente_numero(SERIE_NOTA, 2027), 'NE-2027-000001')
+
+    def test_la_secuencia_nueva_continua_los_numeros_existentes(self):
+        NotaEntrega.objects.create(cliente=Cliente.objects.create(nombre='Cliente', cedula='12345678', telefono='0212'),
+                                   numero_entrega='NE-2026-000041')
+        self.assertEqual(siguiente_numero(SERIE_NOTA, 2026), 'NE-2026-000042')
+
+    def test_un_guardado_revertido_no_deja_saltos(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            siguiente_numero(SERIE_NOTA, 2026)
+            raise RuntimeError('el documento no se pudo guardar')
+        self.assertEqual(siguiente_numero(SERIE_NOTA, 2026), 'NE-2026-000001')
+
+    def test_el_formulario_rechaza_numeros_manuales_de_la_serie(self):
+        cliente = Cliente.objects.create(nombre='Cliente', cedula='12345678', telefono='0212')
+        for numero, valido in (('ne-2026-000009', False), ('FACT-77', True), ('', True)):
+            with self.subTest(numero):
+                form = NotaEntregaForm(data={'cliente': cliente.pk, 'numero_entrega': numero, 'descuento': '0'})
+                self.assertEqual(form.is_valid(), valido)
+
+
+# ==================== ENVÍO ÚNICO ====================
+
+class IdempotenciaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('vendedor', password='x')
+        self.factory = RequestFactory()
+
+    def _peticion(self, clave):
+        request = self.factory.post('/', {idempotencia.CAMPO: clave})
+        request.user = self.usuario
+        return request
+
+    def test_reclamar_dos_veces_la_misma_clave_es_repetido(self):
+        clave = idempotencia.nueva_clave()
+        with transaction.atomic():
+            envio = idempotencia.reclamar(self._peticion(clave), NotaEntrega)
+            idempotencia.completar(envio, Cliente(pk=7, nombre='Cliente'), '/notas-entrega/7/')
+
+        with self.assertRaises(idempotencia.EnvioRepetido) as contexto:
+            with transaction.atomic():
+                idempotencia.reclamar(self._peticion(clave), NotaEntrega)
+        self.assertEqual(contexto.exception.envio.pk, envio.pk)
+        self.assertEqual(idempotencia.buscar(self._peticion(clave)).url_resultado, '/notas-entrega/7/')
+
+    def test_clave_de_otro_usuario_no_se_toma_como_repetida(self):
+        clave = idempotencia.nueva_clave()
+        with transaction.atomic():
+            idempotencia.reclamar(self._peticion(clave), NotaEntrega)
+        otro = self._peticion(clave)
+        otro.user = User.objects.create_user('otro', password='x')
+        self.assertIsNone(idempotencia.buscar(otro))
+
+
+# ==================== RESERVAS ====================
+
+class ReservasTests(TestCase):
+
+    def setUp(self):
+        self.producto = crear_producto(stock=5)
+        self.usuario = User.objects.create_user('vendedor', password='x')
+
+    def _peticion(self):
+        request = RequestFactory().post('/')
+        request.user = self.usuario
+        request.session = SessionStore()
+        return request
+
+    def test_no_se_reserva_mas_de_lo_disponible(self):
+        primera, segunda = self._peticion(), self._peticion()
+        reservas.reservar(primera, self.producto.pk, 4)
+        with self.assertRaises(reservas.StockNoDisponible) as contexto:
+            reservas.reservar(segunda, self.producto.pk, 2)
+        self.assertEqual(contexto.exception.disponible, 1)
+        # La reserva rechazada no queda apartando unidades
+        self.assertEqual(reservas.disponibles([self.producto.pk])[self.producto.pk], 1)
+
+    def test_la_salida_no_toma_lo_reservado_por_otra_sesion(self):
+        ReservaStock.objects.create(producto=self.producto, sesion='otra', cantidad=3, vence=timezone.now() + timedelta(hours=1))
+        with self.assertRaises(StockInsuficiente), transaction.atomic():
+            aplicar_deltas_stock({self.producto.pk: -3}, excluir_sesion='propia')
+        aplicar_deltas_stock({self.producto.pk: -2}, excluir_sesion='propia')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 3)
+
+    def test_nota_con_comprobacion_previa_desactualizada_no_deja_stock_comprometido(self):
+        cliente = Cliente.objects.create(nombre='Cliente', cedula='12345678', telefono='0212')
+        self.client.force_login(self.usuario)
+        ReservaStock.objects.create(producto=self.producto, sesion='otra', cantidad=3, vence=timezone.now() + timedelta(hours=1))
+
+        def enviar(cantidad):
+            return self.client.post(reverse('nota_entrega_create'), {
+                'cliente': cliente.pk, 'numero_entrega': '', 'descuento': '0', 'observaciones': '',
+                idempotencia.CAMPO: idempotencia.nueva_clave(),
+                'detalles-TOTAL_FORMS': '1', 'detalles-INITIAL_FORMS': '0',
+                'detalles-0-producto': self.producto.pk, 'detalles-0-cantidad': cantidad,
+                'detalles-0-precio_unitario': '10', 'detalles-0-descuento': '0',
+            })
+
+        # La comprobación previa ve el stock de antes de la reserva, como un segundo empleado que se cruza
+        with mock.patch.object(reservas, 'disponibles', return_value={self.producto.pk: 5}):
+            respuesta = enviar(4)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(NotaEntrega.objects.exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 5)
+
+        self.assertRedirects(enviar(2), reverse('nota_entrega_list'), fetch_redirect_response=False)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 3)
+
+    def test_la_propia_reserva_se_reemplaza_y_no_se_suma(self):
+        peticion = self._peticion()
+        reservas.reservar(peticion, self.producto.pk, 4)
+        reservas.reservar(peticion, self.producto.pk, 5)
+        sesion = reservas.sesion_de(peticion)
+        self.assertEqual(reservas.disponibles([self.producto.pk], excluir_sesion=sesion)[self.producto.pk], 5)
+        self.assertEqual(reservas.disponibles([self.producto.pk])[self.producto.pk], 0)
+
+
+# ==================== CONCURRENCIA OPTIMISTA ====================
+
+class _NombreProductoForm(VersionFormMixin, forms.ModelForm):
+    class Meta:
+        model = Producto
+        fields = ['nombre']
+
+
+class ReclamarVersionTests(TestCase):
+
+    def setUp(self):
+        self.producto = crear_producto('Original')
+
+    def _form(self, nombre):
+        return _NombreProductoForm(
+            data={'nombre': nombre, 'initial-nombre': 'Original', concurrencia.CAMPO_VERSION: self.producto.version},
+            instance=self.producto,
+        )
+
+    def test_sin_cambios_ajenos_sube_la_version(self):
+        form = self._form('Editado')
+        self.assertTrue(form.is_valid())
+        with transaction.atomic():
+            self.assertEqual(concurrencia.reclamar_version(form), ['nombre'])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.version, 2)
+
+    def test_otra_edicion_guardada_antes_es_conflicto(self):
+        form = self._form('Editado')
+        self.assertTrue(form.is_valid())
+        Producto.objects.filter(pk=self.producto.pk).update(version=F('version') + 1)
+        with self.assertRaises(concurrencia.ConflictoEdicion):
+            with transaction.atomic():
+                concurrencia.reclamar_version(form)
+
+    def test_campo_cambiado_por_otra_via_es_conflicto(self):
+        form = self._form('Editado')
+        self.assertTrue(form.is_valid())
+        Producto.objects.filter(pk=self.producto.pk).update(nombre='Cambiado por importación')
+        with self.assertRaises(concurrencia.ConflictoEdicion):
+            with transaction.atomic():
+                concurrencia.reclamar_version(form)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.version, 1)
+
+
+# ==================== REINTENTOS ====================
+
+class FallaConBloqueo:
+    """Función que falla ``veces`` veces con el error dado y después devuelve 'ok'"""
+
+    def __init__(self, veces, mensaje='database is locked'):
+        self.veces, self.mensaje = veces, mensaje
+        self.modos = []
+
+    def __call__(self):
+        self.modos.append(connection.transaction_mode)
+        if len(self.modos) <= self.veces:
+            raise OperationalError(self.mensaje)
+        return 'ok'
+
+
+# Sin transacción envolvente: dentro de una, ejecutar_con_reintentos no reintenta
+@override_settings(ESCRITURA_PLAZO_SEGUNDOS=15.0, ESCRITURA_ESPERA_INICIAL=0.05, ESCRITURA_ESPERA_MAXIMA=0.15)
+@mock.patch('movilnet.escritura.random.uniform', side_effect=lambda minimo, maximo: maximo)
+@mock.patch('movilnet.escritura.time.sleep')
+class ReintentosTests(TransactionTestCase):
+
+    def setUp(self):
+        escritura.reiniciar_metricas()
+
+    def test_reintenta_con_espera_exponencial_acotada(self, sleep, uniform):
+        funcion = FallaConBloqueo(4)
+        self.assertEqual(escritura.ejecutar_con_reintentos(funcion, operacion='prueba'), 'ok')
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.05, 0.1, 0.15, 0.15])
+        self.assertEqual(funcion.modos, ['IMMEDIATE'] * 5)
+        self.assertEqual(escritura.metricas()['prueba']['reintentos'], 4)
+
+    def test_otros_errores_no_se_reintentan(self, sleep, uniform):
+        funcion = FallaConBloqueo(1, mensaje='no such table: x')
+        with self.assertRaises(OperationalError):
+            escritura.ejecutar_con_reintentos(funcion)
+        self.assertEqual(len(funcion.modos), 1)
+        sleep.assert_not_called()
+
+    @override_settings(ESCRITURA_PLAZO_SEGUNDOS=0)
+    def test_plazo_agotado(self, sleep, uniform):
+        with self.assertRaises(escritura.BaseDatosOcupada):
+            escritura.ejecutar_con_reintentos(FallaConBloqueo(10), operacion='prueba')
+        self.assertEqual(escritura.metricas()['prueba']['agotadas'], 1)
+
+
+# ==================== ESCRITOR ÚNICO ====================
+
+# Bitácora en línea: su hilo escribiría a la vez en la base en memoria compartida
+@override_settings(BITACORA_ASINCRONA=False)
+class CoordinadorEscrituraTests(TransactionTestCase):
+    """El hilo escritor confirma el grupo aunque un comando falle"""
+
+    def test_comando_fallido_no_deshace_los_demas_del_grupo(self):
+        a = crear_producto('A', stock=5)
+        b = crear_producto('B', stock=5)
+        c = crear_producto('C', stock=5)
+        # Espera larga: los tres comandos caen en el mismo grupo
+        coordinador = CoordinadorEscritura(tamano_grupo=8, espera_grupo=0.5)
+        try:
+            futuros = [
+                coordinador.enviar(aplicar_deltas_stock, {a.pk: 3}),
+                coordinador.enviar(aplicar_deltas_stock, {b.pk: -10}),
+                coordinador.enviar(aplicar_deltas_stock, {c.pk: -2}),
+            ]
+            futuros[0].result(timeout=10)
+            with self.assertRaises(StockInsuficiente):
+                futuros[1].result(timeout=10)
+            futuros[2].result(timeout=10)
+        finally:
+            coordinador.detener()
+
+        self.assertEqual(coordinador.grupos, 1)
+        self.assertEqual(coordinador.comandos, 3)
+        stock = dict(Producto.objects.values_list('nombre', 'stock_actual'))
+        self.assertEqual(stock, {'A': 8, 'B': 5, 'C': 3})
+
+
+# ==================== RESPALDO ====================
+
+class RestaurarRespaldoTests(SimpleTestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = Path(carpeta.name)
+        self.destino = self.carpeta / 'restaurada.sqlite3'
+
+    def _respaldo(self, valor):
+        base = self.carpeta / f'origen-{valor}.sqlite3'
+        base.unlink(missing_ok=True)
+        conexion = sqlite3.connect(base)
+        conexion.execute('CREATE TABLE t (valor INTEGER)')
+        conexion.execute('INSERT INTO t VALUES (?)', [valor])
+        conexion.commit()
+        conexion.close()
+        archivo = self.carpeta / f'{respaldo.PREFIJO}{valor}{respaldo.EXTENSION}'
+        archivo.write_bytes(gzip.compress(base.read_bytes()))
+        return archivo
+
+    def _valor_restaurado(self):
+        conexion = sqlite3.connect(self.destino)
+        try:
+            return conexion.execute('SELECT valor FROM t').fetchone()[0]
+        finally:
+            conexion.close()
+
+    def test_restaura_y_reemplaza_descartando_el_wal_anterior(self):
+        respaldo.restaurar(self._respaldo(1), self.destino)
+        self.assertEqual(self._valor_restaurado(), 1)
+        with self.assertRaises(FileExistsError):
+            respaldo.restaurar(self._respaldo(2), self.destino)
+
+        wal = Path(f'{self.destino}-wal')
+        wal.write_bytes(b'restos de la base anterior')
+        respaldo.restaurar(self._respaldo(2), self.destino, reemplazar=True)
+        self.assertEqual(self._valor_restaurado(), 2)
+        self.assertFalse(wal.exists())
+
+    def test_archivo_danado_o_truncado_es_invalido(self):
+        completo = self._respaldo(1).read_bytes()
+        for nombre, contenido in (('basura', b'esto no es gzip'), ('truncado', completo[:len(completo) // 2]),
+                                  ('no_sqlite', gzip.compress(b'x' * 4096))):
+            with self.subTest(nombre):
+                archivo = self.carpeta / f'{nombre}{respaldo.EXTENSION}'
+                archivo.write_bytes(contenido)
+                with self.assertRaises(respaldo.RespaldoInvalido):
+                    respaldo.restaurar(archivo, self.destino)
+                self.assertFalse(self.destino.exists())
+                self.assertEqual(list(self.carpeta.glob('.*.tmp')), [])
+
+    def test_el_comando_informa_el_respaldo_danado(self):
+        archivo = self.carpeta / f'basura{respaldo.EXTENSION}'
+        archivo.write_bytes(b'esto no es gzip')
+        with self.assertRaisesMessage(CommandError, 'El respaldo está dañado'):
+            call_command('restaurar_bd', str(archivo), '--destino', str(self.destino), stdout=StringIO())
@@ -0,0 +1,147 @@
+"""
+Ajuste automático de ``stock_minimo`` y ``stock_maximo`` a partir de la demanda.
+
+Para cada producto, con demanda diaria media ``d`` y desviación ``s``:
+
+    stock de seguridad = z · s · √(días de entrega)
+    stock_minimo       = ⌈d · días de entrega + stock de seguridad⌉   (punto de reorden)
+    stock_maximo       = ⌈stock_minimo + d · días de revisión⌉
+
+donde ``z`` es el cuantil normal del nivel de servicio objetivo. La demanda
+sale de ``PronosticoDemanda`` cuando el producto tiene pronóstico y, si no,
+de la matriz de consumo de los últimos ``dias_historial`` días. El máximo
+nunca queda por debajo del stock actual (``Producto.clean`` lo exige).
+
+Todo se calcula con arreglos sobre el conjunto de productos; los cambios se
+aplican con una sola sentencia UPDATE y el historial se guarda en
+``AjusteUmbral`` en la misma transacción.
+"""
+from decimal import Decimal
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .bd import actualizar_en_bloque, insertar_en_bloque
+from .bitacora import registrar_en_bitacora, ACCION_ACTUALIZAR
+from .models import Producto, PronosticoDemanda, AjusteUmbral
+from .pronostico import matriz_consumo
+from .reposicion import alinear_por_producto
+
+NIVEL_SERVICIO = 0.95
+DIAS_ENTREGA = 7
+DIAS_REVISION = 30
+DIAS_HISTORIAL = 90
+
+CAMPOS_AJUSTE = (
+    'producto', 'stock_minimo_anterior', 'stock_maximo_anterior',
+    'stock_minimo_nuevo', 'stock_maximo_nuevo', 'nivel_servicio', 'empleado', 'fecha',
+)
+
+
+def calcular_umbrales(productos=None, nivel_servicio=NIVEL_SERVICIO, dias_entrega=DIAS_ENTREGA,
+                      dias_revision=DIAS_REVISION, dias_historial=DIAS_HISTORIAL, incluir_sin_demanda=False):
+    """
+    Calcula los umbrales propuestos para ``productos`` (queryset; por defecto
+    todos los activos). Devuelve un diccionario de arreglos alineados:
+    ``ids``, ``stock``, ``minimo_actual``, ``maximo_actual``, ``demanda``,
+    ``desviacion``, ``minimo``, ``maximo`` y ``cambia`` (máscara de productos
+    cuyo umbral cambia). Los productos sin demanda conservan sus umbrales
+    salvo con ``incluir_sin_demanda``.
+    """
+    if not 0.5 <= nivel_servicio < 1:
+        raise ValueError('El nivel de servicio debe estar entre 0.5 y 1.')
+    if dias_entrega < 0:
+        raise ValueError('Los días de entrega no pueden ser negativos.')
+    if dias_revision < 1:
+        raise ValueError('Los días de revisión deben ser al menos 1.')
+    if dias_historial < 1:
+        raise ValueError('El historial debe tener al menos 1 día.')
+    if productos is None:
+        productos = Producto.objects.filter(estado=True)
+    filas = np.array(
+        list(productos.order_by('pk').values_list('pk', 'stock_actual', 'stock_minimo', 'stock_maximo')),
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    ids = filas[:, 0]
+
+    # Demanda histórica (media y desviación diaria) como respaldo de los productos sin pronóstico
+    matriz, _ = matriz_consumo(ids, dias_historial)
+    demanda = matriz.mean(axis=1, dtype=np.float64)
+    desviacion = matriz.std(axis=1, dtype=np.float64)
+    del matriz
+
+    pronosticos = list(
+        PronosticoDemanda.objects.filter(producto_id__in=productos.values('pk'))
+        .values_list('producto_id', 'demanda_diaria', 'desviacion_diaria')
+    )
+    if pronosticos:
+        tiene = alinear_por_producto(ids, ((pk, 1) for pk, _, _ in pronosticos)) > 0
+        demanda = np.where(tiene, alinear_por_producto(ids, ((pk, d) for pk, d, _ in pronosticos)), demanda)
+        desviacion = np.where(tiene, alinear_por_producto(ids, ((pk, s) for pk, _, s in pronosticos)), desviacion)
+
+    z = NormalDist().inv_cdf(nivel_servicio)
+    seguridad = z * desviacion * np.sqrt(dias_entrega)
+    minimo = np.ceil(demanda * dias_entrega + seguridad).astype(np.int64)
+    maximo = np.ceil(minimo + demanda * dias_revision).astype(np.int64)
+    maximo = np.maximum(np.maximum(maximo, minimo + 1), filas[:, 1])
+
+    con_demanda = (demanda > 0) | incluir_sin_demanda
+    minimo = np.where(con_demanda, minimo, filas[:, 2])
+    maximo = np.where(con_demanda, maximo, filas[:, 3])
+    cambia = (minimo != filas[:, 2]) | (maximo != filas[:, 3])
+
+    return {
+        'ids': ids, 'stock': filas[:, 1], 'minimo_actual': filas[:, 2], 'maximo_actual': filas[:, 3],
+        'demanda': demanda, 'desviacion': desviacion, 'minimo': minimo, 'maximo': maximo,
+        'cambia': cambia, 'nivel_servicio': nivel_servicio,
+    }
+
+
+def vista_previa(calculo, limite=100):
+    """Los ``limite`` cambios más grandes (por variación del mínimo) como lista de diccionarios"""
+    indices = np.flatnonzero(calculo['cambia'])
+    variacion = np.abs(calculo['minimo'][indices] - calculo['minimo_actual'][indices])
+    indices = indices[np.argsort(-variacion, kind='stable')][:limite]
+    productos = Producto.objects.select_related('marca').in_bulk(calculo['ids'][indices].tolist())
+    return [{
+        'producto': productos[int(calculo['ids'][i])],
+        'demanda': calculo['demanda'][i],
+        'desviacion': calculo['desviacion'][i],
+        'minimo_actual': int(calculo['minimo_actual'][i]),
+        'maximo_actual': int(calculo['maximo_actual'][i]),
+        'minimo': int(calculo['minimo'][i]),
+        'maximo': int(calculo['maximo'][i]),
+    } for i in indices]
+
+
+def aplicar_umbrales(calculo, empleado=None):
+    """
+    Aplica los umbrales que cambian con un único UPDATE en bloque y guarda
+    los valores anteriores en ``AjusteUmbral``. Devuelve cuántos productos cambiaron.
+    """
+    indices = np.flatnonzero(calculo['cambia'])
+    if not len(indices):
+        return 0
+
+    ids = calculo['ids'][indices].tolist()
+    minimos, maximos = calculo['minimo'][indices].tolist(), calculo['maximo'][indices].tolist()
+    anteriores_min = calculo['minimo_actual'][indices].tolist()
+    anteriores_max = calculo['maximo_actual'][indices].tolist()
+
+    productos = [Producto(pk=pk, stock_minimo=mn, stock_maximo=mx) for pk, mn, mx in zip(ids, minimos, maximos)]
+    nivel = Decimal(str(calculo['nivel_servicio'])).quantize(Decimal('0.0001'))
+    empleado_id = empleado.pk if empleado is not None else None
+    ahora = timezone.now()
+    with transaction.atomic():
+        actualizar_en_bloque(Producto, productos, ['stock_minimo', 'stock_maximo'])
+        insertar_en_bloque(AjusteUmbral, [
+            (pk, amn, amx, mn, mx, nivel, empleado_id, ahora)
+            for pk, amn, amx, mn, mx in zip(ids, anteriores_min, anteriores_max, minimos, maximos)
+        ], CAMPOS_AJUSTE)
+        registrar_en_bitacora(
+            empleado, 'Producto', ACCION_ACTUALIZAR, 0,
+            f'Ajuste automático de umbrales: {len(ids)} productos (nivel de servicio {nivel})',
+        )
+    return len(ids)
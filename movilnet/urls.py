@@ -17,6 +17,9 @@ urlpatterns = [
     path('empleados/eliminar/<int:pk>/', views.EmpleadoDeleteView.as_view(), name='empleado_delete'),
     path('empleados/alternar-estado/<int:pk>/', views.empleado_toggle_activo_view, name='empleado_toggle_activo'),
 
+    # Bitácora
+    path('bitacora/', views.bitacora_view, name='bitacora'),
+
     # Dashboard
     path('', views.dashboard, name='dashboard'),
 
@@ -44,6 +47,8 @@ urlpatterns = [
     path('productos/crear/', views.ProductoCreateView.as_view(), name='producto_create'),
     path('productos/editar/<int:pk>/', views.ProductoUpdateView.as_view(), name='producto_update'),
     path('productos/eliminar/<int:pk>/', views.ProductoDeleteView.as_view(), name='producto_delete'),
+    path('productos/<int:pk>/kardex/', views.producto_kardex_view, name='producto_kardex'),
+    path('productos/cambiar-precios/', views.producto_cambiar_precios_view, name='producto_cambiar_precios'),
 
     # URLs Tipo Inventario
     path('inventario/tipos/', views.TipoInventarioListView.as_view(), name='tipo_inventario_list'),
@@ -55,10 +60,20 @@ urlpatterns = [
     path('inventario/stock/', views.stock_actual_view, name='stock_actual'),
     path('inventario/movimientos/', views.MovimientoInventarioListView.as_view(), name='movimiento_list'),
     path('inventario/movimientos/crear/', views.MovimientoInventarioCreateView.as_view(), name='movimiento_create'),
+    path('inventario/movimientos/importar/', views.movimiento_importar_view, name='movimiento_importar'),
+
+    # Conteos físicos
+    path('inventario/conteos/', views.ConteoInventarioListView.as_view(), name='conteo_list'),
+    path('inventario/conteos/crear/', views.ConteoInventarioCreateView.as_view(), name='conteo_create'),
+    path('inventario/conteos/<int:pk>/', views.conteo_detail_view, name='conteo_detail'),
+    path('inventario/conteos/<int:pk>/importar/', views.conteo_importar_view, name='conteo_importar'),
+    path('inventario/conteos/<int:pk>/aprobar/', views.conteo_aprobar_view, name='conteo_aprobar'),
+    path('inventario/conteos/<int:pk>/cancelar/', views.conteo_cancelar_view, name='conteo_cancelar'),
 
     # URLs Orden de Compra / Compra
     path('ordenes-compra/', views.OrdenCompraListView.as_view(), name='orden_compra_list'),
     path('ordenes-compra/crear/', views.OrdenCompraCreateView.as_view(), name='orden_compra_create'),
+    path('ordenes-compra/reposicion/', views.reposicion_view, name='reposicion'),
     path('ordenes-compra/<int:pk>/', views.OrdenCompraDetailView.as_view(), name='orden_compra_detail'),
     path('ordenes-compra/editar/<int:pk>/', views.OrdenCompraUpdateView.as_view(), name='orden_compra_update'),
     path('ordenes-compra/eliminar/<int:pk>/', views.OrdenCompraDeleteView.as_view(), name='orden_compra_delete'),
@@ -69,9 +84,21 @@ urlpatterns = [
     path('notas-entrega/<int:pk>/', views.NotaEntregaDetailView.as_view(), name='nota_entrega_detail'),
     path('notas-entrega/editar/<int:pk>/', views.NotaEntregaUpdateView.as_view(), name='nota_entrega_update'),
     path('notas-entrega/eliminar/<int:pk>/', views.NotaEntregaDeleteView.as_view(), name='nota_entrega_delete'),
+    path('notas-entrega/reservar/', views.reserva_stock_ajax, name='reserva_stock_ajax'),
+
+    # Importación masiva
+    path('importar/', views.importar_catalogo_view, name='importar_catalogo'),
+    path('importar/errores.csv', views.importar_errores_view, name='importar_errores'),
+
+    # Tasas de cambio
+    path('tasas-cambio/', views.tasas_cambio_view, name='tasas_cambio'),
+
+    # Métricas de escritura
+    path('metricas/escritura/', views.metricas_escritura_view, name='metricas_escritura'),
 
     # URLs Reportes
     path('reportes/inventario/', views.reporte_inventario_view, name='reporte_inventario'),
+    path('reportes/stock-inmovil/', views.reporte_stock_inmovil_view, name='reporte_stock_inmovil'),
     path('reportes/movimientos/', views.reporte_movimientos_view, name='reporte_movimientos'),
     path('reportes/ventas/', views.reporte_ventas_view, name='reporte_ventas'),
 ]
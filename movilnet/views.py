@@ -3,16 +3,26 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView, D
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.db.models import Count, Q, F
 from django.db import transaction
 from django.http import JsonResponse
-
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+
+from . import concurrencia, coordinador, costeo, idempotencia, reservas
+from .asincrono import en_paralelo, renderizar
+from .concurrencia import VersionUpdateMixin
+from .escritura import ReintentosMixin, BaseDatosOcupada, ejecutar_con_reintentos, vista_con_reintentos
+from .idempotencia import EnvioUnicoMixin
+from .numeracion import asignar_numero, SERIE_ORDEN, SERIE_NOTA
+from .replica import lee_de_replica
 from .models import (
-    Marca, Proveedor, Cliente, Producto, PerfilEmpleado,
-    TipoInventario, MovimientoInventario,
-    OrdenCompra, DetalleOrdenCompra, NotaEntrega, DetalleNotaEntrega
+    Marca, Proveedor, Cliente, Producto, PerfilEmpleado, Bitacora,
+    TipoInventario, MovimientoInventario, ConteoInventario,
+    OrdenCompra, DetalleOrdenCompra, NotaEntrega, DetalleNotaEntrega, RiesgoQuiebre,
+    HistorialPrecio, TasaCambio,
 )
 from .forms import (
     MarcaForm, ProveedorForm, ClienteForm, ProductoForm,
@@ -21,7 +31,9 @@ from .forms import (
     TipoInventarioForm, MovimientoInventarioForm,
     OrdenCompraForm, DetalleOrdenCompraFormSet,
     NotaEntregaForm, DetalleNotaEntregaFormSet,
-    EditarEmpleadoForm,
+    EditarEmpleadoForm, ImportarCatalogoForm, ImportarMovimientosForm,
+    ConteoInventarioForm, ImportarConteoForm, ReposicionForm, GenerarOrdenesForm,
+    CambioPreciosForm, TasaCambioForm,
 )
 
 
@@ -237,21 +249,124 @@ def empleado_toggle_activo_view(request, pk):
     return redirect('lista_empleados')
 
 
-# ==================== DASHBOARD ====================
+# ==================== BITÁCORA ====================
+
+def _parsear_fecha(valor):
+    from datetime import date
+    try:
+        return date.fromisoformat(valor) if valor else None
+    except ValueError:
+        return None
+
 
 @login_required
-def dashboard(request):
-    """Vista principal del dashboard con estadísticas"""
+def bitacora_view(request):
+    """Explorador de bitácora (solo admin) con paginación por cursor, sin COUNT(*)"""
+    from datetime import datetime, time
+    from django.utils import timezone
+    from .bitacora import (
+        MODELOS_AUDITADOS, ACCION_CREAR, ACCION_ACTUALIZAR, ACCION_ELIMINAR, ACCION_IMPORTAR,
+        meses_archivados, buscar_en_archivo,
+    )
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('dashboard')
+
+    por_pagina = 50
+    fecha_desde = _parsear_fecha(request.GET.get('desde', ''))
+    fecha_hasta = _parsear_fecha(request.GET.get('hasta', ''))
+    filtro_empleado = request.GET.get('empleado', '')
+    filtro_tabla = request.GET.get('tabla', '')
+    filtro_accion = request.GET.get('accion', '')
+    origen = request.GET.get('origen', '')  # '' = base de datos, 'AAAA-MM' = archivo de ese mes
+    empleado_id = int(filtro_empleado) if filtro_empleado.isdigit() else None
+
+    # Cursor: "<fecha_hora ISO>_<id>" del último registro de la página anterior
+    cursor = None
+    valor_cursor = request.GET.get('cursor', '')
+    if '_' in valor_cursor:
+        fecha_iso, _, id_cursor = valor_cursor.rpartition('_')
+        try:
+            cursor = (datetime.fromisoformat(fecha_iso), int(id_cursor))
+        except ValueError:
+            cursor = None
+
+    meses = meses_archivados()
+    if origen and origen in meses:
+        registros = buscar_en_archivo(
+            origen, empleado_id=empleado_id, tabla=filtro_tabla or None, accion=filtro_accion or None,
+            desde=fecha_desde, hasta=fecha_hasta, despues=cursor, limite=por_pagina,
+        )
+    else:
+        origen = ''
+        consulta = Bitacora.objects.order_by('-fecha_hora', '-id').values(
+            'id', 'empleado_id', 'empleado__user__username', 'tabla_afectada',
+            'accion_realizada', 'cod_registro_afectado', 'fecha_hora', 'descripcion',
+        )
+        # Rangos sobre la columna (no __date) para que se use el índice
+        if fecha_desde:
+            consulta = consulta.filter(fecha_hora__gte=timezone.make_aware(datetime.combine(fecha_desde, time.min)))
+        if fecha_hasta:
+            consulta = consulta.filter(fecha_hora__lte=timezone.make_aware(datetime.combine(fecha_hasta, time.max)))
+        if empleado_id:
+            consulta = consulta.filter(empleado_id=empleado_id)
+        if filtro_tabla:
+            consulta = consulta.filter(tabla_afectada=filtro_tabla)
+        if filtro_accion:
+            consulta = consulta.filter(accion_realizada=filtro_accion)
+        if cursor:
+            consulta = consulta.filter(
+                Q(fecha_hora__lt=cursor[0]) | Q(fecha_hora=cursor[0], id__lt=cursor[1])
+            )
+        registros = list(consulta[:por_pagina + 1])
+
+    hay_siguiente = len(registros) > por_pagina
+    registros = registros[:por_pagina]
+    siguiente_cursor = ''
+    if hay_siguiente:
+        ultimo = registros[-1]
+        siguiente_cursor = f"{ultimo['fecha_hora'].isoformat()}_{ultimo['id']}"
+
     context = {
-        'total_productos': Producto.objects.filter(estado=True).count(),
-        'total_clientes': Cliente.objects.count(),
-        'total_proveedores': Proveedor.objects.filter(estado=True).count(),
-        'total_marcas': Marca.objects.filter(estado=True).count(),
-        'productos_bajo_stock': Producto.objects.filter(
-            stock_actual__lte=F('stock_minimo')
-        ).count(),
+        'registros': registros,
+        'siguiente_cursor': siguiente_cursor,
+        'es_primera_pagina': not cursor,
+        'empleados': PerfilEmpleado.objects.select_related('user').order_by('user__username'),
+        'tablas': sorted(MODELOS_AUDITADOS),
+        'acciones': (ACCION_CREAR, ACCION_ACTUALIZAR, ACCION_ELIMINAR, ACCION_IMPORTAR),
+        'meses_archivados': meses,
+        'origen': origen,
+        'fecha_desde': request.GET.get('desde', ''),
+        'fecha_hasta': request.GET.get('hasta', ''),
+        'filtro_empleado': filtro_empleado,
+        'filtro_tabla': filtro_tabla,
+        'filtro_accion': filtro_accion,
     }
-    return render(request, 'dashboard_home.html', context)
+    return render(request, 'bitacora/bitacora_list.html', context)
+
+
+# ==================== DASHBOARD ====================
+
+@login_required
+@lee_de_replica
+async def dashboard(request):
+    """Vista principal del dashboard con estadísticas (los conteos se hacen en paralelo)"""
+    context = await en_paralelo(
+        total_productos=Producto.objects.filter(estado=True).count,
+        total_clientes=Cliente.objects.count,
+        total_proveedores=Proveedor.objects.filter(estado=True).count,
+        total_marcas=Marca.objects.filter(estado=True).count,
+        productos_bajo_stock=Producto.objects.filter(
+            stock_actual__lte=F('stock_minimo')
+        ).count,
+    )
+    return await renderizar(request, 'dashboard_home.html', context)
 
 
 # ==================== CRUD MARCA ====================
@@ -303,13 +418,13 @@ class MarcaDeleteView(LoginRequiredMixin, AdminRequeridoMixin, DeleteView):
 
 
 @login_required
-def marca_crear_ajax(request):
+async def marca_crear_ajax(request):
     """Crea una marca vía AJAX desde el modal del formulario de producto."""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
     form = MarcaForm(request.POST)
-    if form.is_valid():
-        marca = form.save()
+    if await sync_to_async(form.is_valid)():
+        marca = await sync_to_async(form.save)()
         return JsonResponse({'success': True, 'id': marca.pk, 'nombre': marca.nombre_marca})
     return JsonResponse({'success': False, 'errors': form.errors})
 
@@ -434,7 +549,104 @@ class ProductoListView(LoginRequiredMixin, ListView):
                 Q(nombre__icontains=search) |
                 Q(marca__nombre_marca__icontains=search)
             )
-        return queryset
+        # Clasificación ABC por ventas (comando clasificar_abc)
+        clase = self.request.GET.get('abc')
+        if clase in ('A', 'B', 'C'):
+            queryset = queryset.filter(clase_abc_ventas=clase)
+        return reservas.anotar_disponible(queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['clases_abc'] = ('A', 'B', 'C')
+        return context
+
+
+@login_required
+@lee_de_replica
+def producto_kardex_view(request, pk):
+    """Kardex del producto: eventos de stock con saldo y costo promedio, paginado por cursor o en CSV"""
+    from .kardex import pagina_kardex, iterar_kardex, COLUMNAS_CSV
+
+    producto = get_object_or_404(Producto.objects.select_related('marca'), pk=pk)
+
+    if request.GET.get('formato') == 'csv':
+        import csv
+        from django.http import StreamingHttpResponse
+
+        class _Eco:
+            def write(self, valor):
+                return valor
+
+        escritor = csv.writer(_Eco())
+
+        def filas():
+            yield escritor.writerow(COLUMNAS_CSV)
+            for evento in iterar_kardex(producto):
+                yield escritor.writerow([
+                    timezone.localtime(evento['fecha']).strftime('%Y-%m-%d %H:%M:%S'),
+                    *(evento[c] if evento[c] is not None else '' for c in COLUMNAS_CSV[1:]),
+                ])
+
+        response = StreamingHttpResponse(filas(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="kardex_{producto.pk}.csv"'
+        return response
+
+    try:
+        eventos, siguiente = pagina_kardex(producto, despues=request.GET.get('despues') or None)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('producto_kardex', pk=pk)
+
+    return render(request, 'productos/producto_kardex.html', {
+        'producto': producto,
+        'eventos': eventos,
+        'siguiente': siguiente,
+        'es_inicio': not request.GET.get('despues'),
+    })
+
+
+@login_required
+def producto_cambiar_precios_view(request):
+    """Cambio porcentual de precios por marca (solo admin): vista previa y aplicación en bloque"""
+    from decimal import Decimal, ROUND_HALF_UP
+    from .precios import cambiar_precios
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('producto_list')
+
+    form = CambioPreciosForm(request.POST or None)
+    vista_previa, total = [], None
+    if request.method == 'POST' and form.is_valid():
+        productos = Producto.objects.filter(estado=True)
+        if form.cleaned_data['marca']:
+            productos = productos.filter(marca=form.cleaned_data['marca'])
+        porcentaje = form.cleaned_data['porcentaje']
+        if 'aplicar' in request.POST:
+            cambiados = cambiar_precios(
+                productos, porcentaje, empleado=_perfil_empleado(request.user),
+                motivo=form.cleaned_data['motivo'],
+            )
+            messages.success(request, f'¡Precio actualizado en {cambiados} productos!')
+            return redirect('producto_cambiar_precios')
+        factor = 1 + porcentaje / 100
+        total = productos.count()
+        vista_previa = [
+            (p, (p.precio * factor).quantize(Decimal('0.01'), ROUND_HALF_UP))
+            for p in productos.select_related('marca').order_by('-precio')[:20]
+        ]
+
+    return render(request, 'productos/producto_cambiar_precios.html', {
+        'form': form,
+        'total': total,
+        'vista_previa': vista_previa,
+        'recientes': HistorialPrecio.objects.select_related('producto', 'empleado__user').order_by('-vigente_desde', '-id')[:20],
+    })
 
 
 class ProductoCreateView(LoginRequiredMixin, CreateView):
@@ -448,15 +660,17 @@ class ProductoCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class ProductoUpdateView(LoginRequiredMixin, UpdateView):
+class ProductoUpdateView(LoginRequiredMixin, ReintentosMixin, VersionUpdateMixin, UpdateView):
     model = Producto
     form_class = ProductoForm
     template_name = 'productos/producto_form.html'
     success_url = reverse_lazy('producto_list')
 
     def form_valid(self, form):
+        # Solo los campos editados, condicionado a la versión leída (no pisa el stock de una venta)
+        self.object = concurrencia.guardar_cambios(form)
         messages.success(self.request, '¡Producto actualizado exitosamente!')
-        return super().form_valid(form)
+        return redirect(self.success_url)
 
 
 class ProductoDeleteView(LoginRequiredMixin, AdminRequeridoMixin, DeleteView):
@@ -525,33 +739,42 @@ class MovimientoInventarioListView(LoginRequiredMixin, ListView):
         return queryset
 
 
-class MovimientoInventarioCreateView(LoginRequiredMixin, CreateView):
+def _perfil_empleado(user):
+    """Perfil del usuario, creado si no existe, para registrar quién hizo el movimiento"""
+    perfil, created = PerfilEmpleado.objects.get_or_create(
+        user=user,
+        defaults={
+            'rol': 'admin' if user.is_superuser else 'empleado',
+            'animal_favorito': '-',
+            'color_favorito': '-',
+        }
+    )
+    return perfil
+
+
+class MovimientoInventarioCreateView(LoginRequiredMixin, ReintentosMixin, CreateView):
     model = MovimientoInventario
     form_class = MovimientoInventarioForm
     template_name = 'inventario/movimiento_form.html'
     success_url = reverse_lazy('movimiento_list')
 
     def form_valid(self, form):
+        from .inventario import aplicar_deltas_stock, StockInsuficiente
         movimiento = form.save(commit=False)
-        # Asegurar que el usuario tenga perfil para registrar quién hizo el movimiento
-        perfil, created = PerfilEmpleado.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'rol': 'admin' if self.request.user.is_superuser else 'empleado',
-                'animal_favorito': '-',
-                'color_favorito': '-',
-            }
-        )
-        movimiento.empleado = perfil
+        movimiento.empleado = _perfil_empleado(self.request.user)
 
         producto = movimiento.producto
         tipo = movimiento.tipo_inventario
 
         if tipo.es_entrada:
-            producto.stock_actual += movimiento.cantidad
+            delta = movimiento.cantidad
+            producto.ultima_entrada = timezone.now()
+            campo_fecha = 'ultima_entrada'
         else:  # SALIDA
             if producto.stock_actual >= movimiento.cantidad:
-                producto.stock_actual -= movimiento.cantidad
+                delta = -movimiento.cantidad
+                producto.ultima_salida = timezone.now()
+                campo_fecha = 'ultima_salida'
             else:
                 messages.error(
                     self.request,
@@ -560,22 +783,275 @@ class MovimientoInventarioCreateView(LoginRequiredMixin, CreateView):
                 )
                 return self.form_invalid(form)
 
-        with transaction.atomic():
-            producto.save()
-            movimiento.save()
+        def guardar():
+            with transaction.atomic():
+                # Suma relativa: no pisa los movimientos guardados después de leer el producto
+                aplicar_deltas_stock({producto.pk: delta})
+                producto.save(update_fields=[campo_fecha])
+                movimiento.save()
+                if tipo.es_entrada:
+                    costeo.registrar_entradas([(producto.pk, movimiento.cantidad, None, None)])
+                else:
+                    costeo.consumir({producto.pk: movimiento.cantidad})
 
+        try:
+            coordinador.ejecutar(guardar)
+        except StockInsuficiente:
+            producto.refresh_from_db(fields=['stock_actual'])
+            messages.error(
+                self.request,
+                f'Stock insuficiente para "{producto.nombre}". '
+                f'Disponible: {producto.stock_actual} unidades.'
+            )
+            return self.form_invalid(form)
         messages.success(self.request, '¡Movimiento registrado exitosamente!')
         return redirect(self.success_url)
 
 
+@login_required
+@vista_con_reintentos
+def movimiento_importar_view(request):
+    """Registro masivo de movimientos desde CSV/XLSX (solo admin)"""
+    from .importacion import leer_filas, ErrorFila
+    from .inventario import importar_movimientos
+    from .bitacora import registrar_en_bitacora, ACCION_IMPORTAR
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('movimiento_list')
+
+    resultado = None
+    form = ImportarMovimientosForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        archivo = form.cleaned_data['archivo']
+        todo_o_nada = form.cleaned_data['modo'] == 'todo'
+        try:
+            resultado = importar_movimientos(
+                leer_filas(archivo, archivo.name),
+                empleado=_perfil_empleado(request.user),
+                todo_o_nada=todo_o_nada,
+            )
+        except (ErrorFila, UnicodeDecodeError) as e:
+            messages.error(request, f'No se pudo leer el archivo: {e}')
+        else:
+            request.session['importacion_errores'] = resultado.errores[:20000]
+            if resultado.creados:
+                registrar_en_bitacora(
+                    request.user, 'MovimientoInventario', ACCION_IMPORTAR, 0,
+                    f'{resultado.creados} movimientos importados ({archivo.name})',
+                )
+            if resultado.errores and todo_o_nada:
+                messages.error(request, f'Lote rechazado: {len(resultado.errores)} filas con error. No se registró ningún movimiento.')
+            elif resultado.errores:
+                messages.warning(request, f'{resultado.creados} movimientos registrados; {len(resultado.errores)} filas omitidas.')
+            else:
+                messages.success(request, f'¡{resultado.creados} movimientos registrados exitosamente!')
+
+    return render(request, 'inventario/movimiento_importar.html', {
+        'form': form,
+        'resultado': resultado,
+        'errores': resultado.errores[:200] if resultado else [],
+    })
+
+
+# ==================== CONTEOS DE INVENTARIO ====================
+
+class ConteoInventarioListView(LoginRequiredMixin, ListView):
+    model = ConteoInventario
+    template_name = 'inventario/conteo_list.html'
+    context_object_name = 'conteos'
+    paginate_by = 15
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('marca', 'empleado__user').annotate(
+            productos_contados=Count('detalles')
+        ).order_by('-fecha_apertura')
+        estado = self.request.GET.get('estado')
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        return queryset
+
+
+class ConteoInventarioCreateView(LoginRequiredMixin, CreateView):
+    model = ConteoInventario
+    form_class = ConteoInventarioForm
+    template_name = 'inventario/conteo_form.html'
+
+    def form_valid(self, form):
+        form.instance.empleado = _perfil_empleado(self.request.user)
+        messages.success(self.request, 'Conteo abierto. Registra las cantidades contadas.')
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse_lazy('conteo_detail', kwargs={'pk': self.object.pk})
+
+
+@login_required
+def conteo_detail_view(request, pk):
+    """Captura de cantidades y varianza del conteo contra el stock del sistema"""
+    from django.core.paginator import Paginator
+    from .inventario import productos_del_conteo, resumen_conteo, registrar_conteos, ConteoCerrado
+
+    conteo = get_object_or_404(
+        ConteoInventario.objects.select_related('marca', 'empleado__user', 'aprobado_por__user'), pk=pk
+    )
+
+    if request.method == 'POST':
+        # Cantidades de la página capturada: campos contado_<id producto>; los vacíos no se tocan
+        cantidades = {}
+        for clave, valor in request.POST.items():
+            if clave.startswith('contado_') and valor.strip():
+                try:
+                    producto_id, cantidad = int(clave[len('contado_'):]), int(valor)
+                except ValueError:
+                    continue
+                if cantidad >= 0:
+                    cantidades[producto_id] = cantidad
+        validos = set(conteo.productos_en_alcance().filter(pk__in=cantidades).values_list('pk', flat=True))
+        try:
+            with transaction.atomic():
+                guardados = registrar_conteos(conteo, {k: v for k, v in cantidades.items() if k in validos})
+        except ConteoCerrado as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'{guardados} cantidades guardadas.')
+        return redirect(request.get_full_path())
+
+    productos = productos_del_conteo(conteo).select_related('marca').order_by('nombre')
+    vista = request.GET.get('vista', '')
+    if vista == 'contados':
+        productos = productos.filter(cantidad_contada__isnull=False)
+    elif vista == 'pendientes':
+        productos = productos.filter(cantidad_contada__isnull=True)
+    elif vista == 'diferencias':
+        productos = productos.filter(cantidad_contada__isnull=False).exclude(diferencia=0)
+    search = request.GET.get('search', '')
+    if search:
+        productos = productos.filter(Q(nombre__icontains=search) | Q(marca__nombre_marca__icontains=search))
+
+    page_obj = Paginator(productos, 50).get_page(request.GET.get('page'))
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    return render(request, 'inventario/conteo_detail.html', {
+        'conteo': conteo,
+        'resumen': resumen_conteo(conteo),
+        'page_obj': page_obj,
+        'productos': page_obj.object_list,
+        'vista': vista,
+        'search': search,
+        'es_admin': es_admin,
+        'form_importar': ImportarConteoForm(),
+        'hay_errores_importacion': request.session.get('conteo_con_errores') == conteo.pk,
+    })
+
+
+@login_required
+def conteo_importar_view(request, pk):
+    """Carga de cantidades contadas desde CSV/XLSX (producto, cantidad)"""
+    from .importacion import leer_filas, ErrorFila
+    from .inventario import importar_conteo, ConteoCerrado
+
+    conteo = get_object_or_404(ConteoInventario, pk=pk)
+    if request.method != 'POST':
+        return redirect('conteo_detail', pk=pk)
+
+    form = ImportarConteoForm(request.POST, request.FILES)
+    if not form.is_valid():
+        messages.error(request, form.errors['archivo'][0])
+        return redirect('conteo_detail', pk=pk)
+
+    archivo = form.cleaned_data['archivo']
+    try:
+        resultado = importar_conteo(conteo, leer_filas(archivo, archivo.name))
+    except (ErrorFila, UnicodeDecodeError) as e:
+        messages.error(request, f'No se pudo leer el archivo: {e}')
+    except ConteoCerrado as e:
+        messages.error(request, str(e))
+    else:
+        request.session['importacion_errores'] = resultado.errores[:20000]
+        request.session['conteo_con_errores'] = conteo.pk if resultado.errores else None
+        if resultado.errores:
+            messages.warning(request, f'{resultado.creados} productos cargados; {len(resultado.errores)} filas con error.')
+        else:
+            messages.success(request, f'{resultado.creados} productos cargados.')
+    return redirect('conteo_detail', pk=pk)
+
+
+@login_required
+@vista_con_reintentos
+def conteo_aprobar_view(request, pk):
+    """Aprueba el conteo y registra los ajustes de stock (solo admin)"""
+    from .inventario import aprobar_conteo, ConteoCerrado
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('conteo_detail', pk=pk)
+
+    conteo = get_object_or_404(ConteoInventario, pk=pk)
+    if request.method == 'POST':
+        try:
+            ajustes = aprobar_conteo(conteo, empleado=_perfil_empleado(request.user))
+        except ConteoCerrado as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'Conteo aprobado. Se registraron {ajustes} movimientos de ajuste.')
+    return redirect('conteo_detail', pk=pk)
+
+
+@login_required
+def conteo_cancelar_view(request, pk):
+    """Cancela un conteo abierto sin tocar el stock (solo admin)"""
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('conteo_detail', pk=pk)
+
+    conteo = get_object_or_404(ConteoInventario, pk=pk)
+    if request.method == 'POST' and conteo.abierto:
+        from django.utils import timezone
+        conteo.estado = 'cancelado'
+        conteo.fecha_cierre = timezone.now()
+        conteo.save(update_fields=['estado', 'fecha_cierre'])
+        messages.success(request, f'Conteo #{conteo.pk} cancelado.')
+    return redirect('conteo_detail', pk=pk)
+
+
 # ==================== STOCK ACTUAL ====================
 
 @login_required
 def stock_actual_view(request):
     """Vista de estado actual del inventario de todos los productos"""
-    from django.db.models import F
+    from django.db.models import Case, When, ExpressionWrapper, FloatField
 
     productos = Producto.objects.select_related('marca').filter(estado=True).order_by('nombre')
+    # Demanda pronosticada (comando pronosticar_demanda) y días que cubre el stock actual
+    productos = productos.annotate(
+        demanda_diaria=F('pronostico__demanda_diaria'),
+        cobertura=Case(
+            When(pronostico__demanda_diaria__gt=0,
+                 then=ExpressionWrapper(F('stock_actual') / F('pronostico__demanda_diaria'), output_field=FloatField())),
+            default=None, output_field=FloatField(),
+        ),
+        probabilidad_quiebre=F('riesgo__probabilidad'),
+    )
 
     # Filtro por estado de stock
     filtro_estado = request.GET.get('estado', '')
@@ -593,10 +1069,18 @@ def stock_actual_view(request):
     if filtro_marca:
         productos = productos.filter(marca__id=filtro_marca)
 
+    # Ranking de riesgo de quiebre (comando simular_riesgo)
+    riesgos = RiesgoQuiebre.objects.select_related('producto__marca').filter(
+        producto__estado=True, probabilidad__gt=0,
+    ).order_by('-probabilidad', 'dias_quiebre', '-faltante_esperado')
+    if filtro_marca:
+        riesgos = riesgos.filter(producto__marca__id=filtro_marca)
+
     marcas = Marca.objects.filter(estado=True).order_by('nombre_marca')
 
     context = {
         'productos': productos,
+        'riesgos': riesgos[:15],
         'marcas': marcas,
         'filtro_estado': filtro_estado,
         'filtro_marca': filtro_marca,
@@ -627,7 +1111,7 @@ class OrdenCompraDetailView(LoginRequiredMixin, AdminRequeridoMixin, DetailView)
     context_object_name = 'orden'
 
 
-class OrdenCompraCreateView(LoginRequiredMixin, AdminRequeridoMixin, CreateView):
+class OrdenCompraCreateView(LoginRequiredMixin, AdminRequeridoMixin, ReintentosMixin, EnvioUnicoMixin, CreateView):
     model = OrdenCompra
     form_class = OrdenCompraForm
     template_name = 'ordenes/orden_compra_form.html'
@@ -648,24 +1132,36 @@ class OrdenCompraCreateView(LoginRequiredMixin, AdminRequeridoMixin, CreateView)
         if not detalles.is_valid():
             messages.error(self.request, 'Corrige los errores en los productos.')
             return self.form_invalid(form)
-        with transaction.atomic():
-            self.object = form.save()
-            detalles.instance = self.object
-            detalles.save()
-            # Calcular total
-            self.object.total = sum(d.subtotal for d in self.object.detalles.all())
-            self.object.save(update_fields=['total'])
-            # Solo "Compra" actualiza el stock (mercancía ya recibida)
-            if self.object.tipo == 'compra':
-                for detalle in self.object.detalles.all():
-                    detalle.producto.stock_actual += detalle.cantidad
-                    detalle.producto.save(update_fields=['stock_actual'])
+        def guardar():
+            with transaction.atomic():
+                envio = idempotencia.reclamar(self.request, OrdenCompra)
+                # El número se pide en la misma transacción: si el guardado se deshace, no se gasta
+                asignar_numero(form.instance, 'numero_orden', SERIE_ORDEN, form.instance.fecha_orden.year)
+                self.object = form.save()
+                detalles.instance = self.object
+                detalles.save()
+                # Calcular total
+                self.object.total = sum(d.subtotal for d in self.object.detalles.all())
+                self.object.save(update_fields=['total'])
+                # Solo "Compra" actualiza el stock (mercancía ya recibida)
+                if self.object.tipo == 'compra':
+                    ahora = timezone.now()
+                    lineas = []
+                    for detalle in self.object.detalles.all():
+                        detalle.producto.stock_actual += detalle.cantidad
+                        detalle.producto.ultima_entrada = ahora
+                        detalle.producto.save(update_fields=['stock_actual', 'ultima_entrada'])
+                        lineas.append((detalle.producto_id, detalle.cantidad, detalle.precio_unitario, detalle.pk))
+                    costeo.registrar_entradas(lineas, ahora)
+                idempotencia.completar(envio, self.object, reverse('orden_compra_detail', args=[self.object.pk]))
+
+        coordinador.ejecutar(guardar)
         tipo_label = 'Compra' if self.object.tipo == 'compra' else 'Orden de compra'
         messages.success(self.request, f'¡{tipo_label} registrada exitosamente!')
         return redirect(self.success_url)
 
 
-class OrdenCompraUpdateView(LoginRequiredMixin, AdminRequeridoMixin, UpdateView):
+class OrdenCompraUpdateView(LoginRequiredMixin, AdminRequeridoMixin, ReintentosMixin, VersionUpdateMixin, UpdateView):
     model = OrdenCompra
     form_class = OrdenCompraForm
     template_name = 'ordenes/orden_compra_form.html'
@@ -692,49 +1188,154 @@ class OrdenCompraUpdateView(LoginRequiredMixin, AdminRequeridoMixin, UpdateView)
         cantidades_previas = {}
         if tipo_previo == 'compra':
             for d in self.object.detalles.all():
-                cantidades_previas[d.pk] = {'cantidad': d.cantidad, 'producto': d.producto}
-
-        with transaction.atomic():
-            if tipo_previo == 'compra':
-                for pk, info in cantidades_previas.items():
-                    info['producto'].stock_actual -= info['cantidad']
-                    info['producto'].save(update_fields=['stock_actual'])
-
-            self.object = form.save()
-            detalles.instance = self.object
-            detalles.save()
-
-            self.object.total = sum(d.subtotal for d in self.object.detalles.all())
-            self.object.save(update_fields=['total'])
-
-            if self.object.tipo == 'compra':
-                for detalle in self.object.detalles.all():
-                    detalle.producto.refresh_from_db()
-                    detalle.producto.stock_actual += detalle.cantidad
-                    detalle.producto.save(update_fields=['stock_actual'])
+                cantidades_previas[d.pk] = {'cantidad': d.cantidad, 'producto': d.producto, 'precio': d.precio_unitario}
+
+        def guardar():
+            with transaction.atomic():
+                campos = concurrencia.reclamar_version(form)
+                asignar_numero(form.instance, 'numero_orden', SERIE_ORDEN, form.instance.fecha_orden.year)
+                if tipo_previo == 'compra':
+                    for pk, info in cantidades_previas.items():
+                        info['producto'].refresh_from_db(fields=['stock_actual'])
+                        info['producto'].stock_actual -= info['cantidad']
+                        info['producto'].save(update_fields=['stock_actual'])
+                    costeo.revertir_compra([
+                        (pk, info['producto'].pk, info['cantidad'], info['precio'])
+                        for pk, info in cantidades_previas.items()
+                    ])
+
+                if campos:
+                    form.instance.save(update_fields=campos)
+                self.object = form.instance
+                detalles.instance = self.object
+                detalles.save()
+
+                self.object.total = sum(d.subtotal for d in self.object.detalles.all())
+                self.object.save(update_fields=['total'])
+
+                if self.object.tipo == 'compra':
+                    ahora = timezone.now()
+                    lineas = []
+                    for detalle in self.object.detalles.all():
+                        detalle.producto.refresh_from_db()
+                        detalle.producto.stock_actual += detalle.cantidad
+                        detalle.producto.ultima_entrada = ahora
+                        detalle.producto.save(update_fields=['stock_actual', 'ultima_entrada'])
+                        lineas.append((detalle.producto_id, detalle.cantidad, detalle.precio_unitario, detalle.pk))
+                    costeo.registrar_entradas(lineas, ahora)
+
+        coordinador.ejecutar(guardar)
 
         messages.success(self.request, '¡Registro actualizado exitosamente!')
         return redirect(self.success_url)
 
 
-class OrdenCompraDeleteView(LoginRequiredMixin, AdminRequeridoMixin, DeleteView):
+class OrdenCompraDeleteView(LoginRequiredMixin, AdminRequeridoMixin, ReintentosMixin, DeleteView):
     model = OrdenCompra
     template_name = 'ordenes/orden_compra_confirm_delete.html'
     success_url = reverse_lazy('orden_compra_list')
 
-    def delete(self, request, *args, **kwargs):
-        orden = self.get_object()
-        with transaction.atomic():
-            # Si era Compra, devolver el stock al eliminar
-            if orden.tipo == 'compra':
-                for detalle in orden.detalles.all():
-                    detalle.producto.stock_actual -= detalle.cantidad
-                    detalle.producto.save(update_fields=['stock_actual'])
-            orden.delete()
-        messages.success(request, '¡Registro eliminado exitosamente!')
+    def form_valid(self, form):
+        from .inventario import aplicar_deltas_stock, recalcular_ultimo_movimiento, StockInsuficiente
+        orden = self.object
+
+        def guardar():
+            with transaction.atomic():
+                # Si era Compra, devolver el stock al eliminar
+                if orden.tipo == 'compra':
+                    detalles = list(orden.detalles.all())
+                    deltas = {}
+                    for detalle in detalles:
+                        deltas[detalle.producto_id] = deltas.get(detalle.producto_id, 0) - detalle.cantidad
+                    aplicar_deltas_stock(deltas)
+                    costeo.revertir_compra([
+                        (d.pk, d.producto_id, d.cantidad, d.precio_unitario) for d in detalles
+                    ])
+                    orden.delete()
+                    # La compra anulada sale del historial: la última entrada vuelve a la anterior
+                    recalcular_ultimo_movimiento(deltas)
+                else:
+                    orden.delete()
+
+        try:
+            coordinador.ejecutar(guardar)
+        except StockInsuficiente as e:
+            messages.error(self.request, f'No se puede eliminar: el stock quedaría negativo en {e}.')
+            return redirect(self.success_url)
+        messages.success(self.request, '¡Registro eliminado exitosamente!')
         return redirect(self.success_url)
 
 
+# ==================== REPOSICIÓN ====================
+
+@login_required
+def reposicion_view(request):
+    """Sugerencias de compra para llevar cada producto a su stock máximo (solo admin)"""
+    from django.core.paginator import Paginator
+    from .reposicion import calcular_reposicion, sugerencias, generar_ordenes
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('dashboard')
+
+    # Los parámetros viajan siempre por GET para que el POST genere exactamente lo que se ve
+    parametros = ReposicionForm(request.GET or None)
+    if parametros.is_bound and parametros.is_valid():
+        datos = parametros.cleaned_data
+    else:
+        datos = {campo: parametros.fields[campo].initial for campo in parametros.fields}
+        parametros = ReposicionForm(initial=datos)
+    marca = datos['marca']
+
+    calculo = calcular_reposicion(
+        dias_consumo=datos['dias_consumo'], dias_entrega=datos['dias_entrega'],
+        marca=marca.pk if marca else None,
+    )
+
+    form_generar = GenerarOrdenesForm(request.POST or None)
+    if request.method == 'POST' and form_generar.is_valid():
+        ordenes = generar_ordenes(
+            calculo, form_generar.cleaned_data['proveedor'],
+            por_marca=form_generar.cleaned_data['por_marca'],
+        )
+        if ordenes:
+            messages.success(request, f'Se generaron {len(ordenes)} órdenes de compra con las cantidades sugeridas.')
+            return redirect('orden_compra_list')
+        messages.info(request, 'No hay productos que necesiten reposición con estos parámetros.')
+        return redirect(request.get_full_path())
+
+    indices = sugerencias(calculo)
+    page_obj = Paginator(indices, 50).get_page(request.GET.get('page'))
+    pagina = list(page_obj.object_list)
+    productos = Producto.objects.select_related('marca').in_bulk([int(calculo['ids'][i]) for i in pagina])
+    filas = []
+    for i in pagina:
+        filas.append({
+            'producto': productos[int(calculo['ids'][i])],
+            'stock': calculo['stock'][i],
+            'transito': int(calculo['transito'][i]),
+            'demanda_diaria': calculo['demanda_diaria'][i],
+            'punto_reorden': calculo['punto_reorden'][i],
+            'sugerido': calculo['sugerido'][i],
+            'cobertura': None if calculo['cobertura'][i] == float('inf') else max(calculo['cobertura'][i], 0),
+        })
+
+    return render(request, 'ordenes/reposicion.html', {
+        'parametros': parametros,
+        'form_generar': form_generar,
+        'filas': filas,
+        'page_obj': page_obj,
+        'total_productos': len(calculo['ids']),
+        'total_sugeridos': len(indices),
+        'unidades_sugeridas': int(calculo['sugerido'].sum()),
+    })
+
+
 # ==================== CRUD NOTA DE ENTREGA ====================
 
 class NotaEntregaListView(LoginRequiredMixin, ListView):
@@ -759,8 +1360,15 @@ class NotaEntregaDetailView(LoginRequiredMixin, DetailView):
     template_name = 'notas_entrega/nota_entrega_detail.html'
     context_object_name = 'nota'
 
+    def get_context_data(self, **kwargs):
+        from .moneda import tasa_en, a_bolivares
+        context = super().get_context_data(**kwargs)
+        context['tasa_bs'] = tasa_en(self.object.fecha_registro)
+        context['total_bs'] = a_bolivares(self.object.total, self.object.fecha_registro)
+        return context
+
 
-class NotaEntregaCreateView(LoginRequiredMixin, CreateView):
+class NotaEntregaCreateView(LoginRequiredMixin, ReintentosMixin, EnvioUnicoMixin, CreateView):
     model = NotaEntrega
     form_class = NotaEntregaForm
     template_name = 'notas_entrega/nota_entrega_form.html'
@@ -772,29 +1380,41 @@ class NotaEntregaCreateView(LoginRequiredMixin, CreateView):
             context['detalles'] = DetalleNotaEntregaFormSet(self.request.POST)
         else:
             context['detalles'] = DetalleNotaEntregaFormSet()
-        context['productos'] = Producto.objects.filter(estado=True).select_related('marca').order_by('nombre')
+        # Disponible = stock menos lo que tienen reservado otras notas en preparación
+        context['productos'] = reservas.anotar_disponible(
+            Producto.objects.filter(estado=True).select_related('marca').order_by('nombre'),
+            excluir_sesion=reservas.sesion_de(self.request),
+        )
+        context['reservar_stock'] = True
         return context
 
     def form_valid(self, form):
+        from .inventario import aplicar_deltas_stock, marcar_ultimo_movimiento, StockInsuficiente
         context = self.get_context_data()
         detalles = context['detalles']
         if not detalles.is_valid():
             messages.error(self.request, 'Corrige los errores en los detalles de la nota.')
             return self.form_invalid(form)
 
-        # Validar stock disponible ANTES de guardar
+        # Validar stock disponible ANTES de guardar (sin contar lo reservado por otras sesiones)
+        sesion = reservas.sesion_de(self.request)
+        disponibles = reservas.disponibles(
+            {f.cleaned_data['producto'].pk for f in detalles if f.cleaned_data and not f.cleaned_data.get('DELETE', False)},
+            excluir_sesion=sesion,
+        )
         for detalle_form in detalles:
             if detalle_form.cleaned_data and not detalle_form.cleaned_data.get('DELETE', False):
                 producto = detalle_form.cleaned_data['producto']
                 cantidad = detalle_form.cleaned_data['cantidad']
                 descuento = detalle_form.cleaned_data.get('descuento', 0)
                 precio = detalle_form.cleaned_data.get('precio_unitario', 0)
+                disponible = disponibles.get(producto.pk, producto.stock_actual)
 
-                if cantidad > producto.stock_actual:
+                if cantidad > disponible:
                     messages.error(
                         self.request,
                         f'Stock insuficiente para "{producto.nombre}". '
-                        f'Solicitado: {cantidad}, Disponible: {producto.stock_actual}.'
+                        f'Solicitado: {cantidad}, Disponible: {disponible}.'
                     )
                     return self.form_invalid(form)
 
@@ -808,33 +1428,49 @@ class NotaEntregaCreateView(LoginRequiredMixin, CreateView):
                     )
                     return self.form_invalid(form)
 
-        with transaction.atomic():
-            self.object = form.save(commit=False)
-            self.object.save()
-            detalles.instance = self.object
-            detalles.save()
-
-            # Calcular subtotales por línea, descontar stock y calcular totales
-            subtotal_general = 0
-            for d in self.object.detalles.all():
-                # Calcular y guardar subtotal de la línea
-                d.subtotal = d.cantidad * d.precio_unitario - d.descuento
-                d.save(update_fields=['subtotal'])
-                subtotal_general += d.subtotal
+        def guardar():
+            with transaction.atomic():
+                envio = idempotencia.reclamar(self.request, NotaEntrega)
+                # El número se pide en la misma transacción: si el guardado se deshace, no se gasta
+                asignar_numero(form.instance, 'numero_entrega', SERIE_NOTA)
+                self.object = form.save(commit=False)
+                self.object.save()
+                detalles.instance = self.object
+                detalles.save()
+
+                # Calcular subtotales por línea, descontar stock y calcular totales
+                subtotal_general = 0
+                deltas = {}
+                for d in self.object.detalles.all():
+                    # Calcular y guardar subtotal de la línea
+                    d.subtotal = d.cantidad * d.precio_unitario - d.descuento
+                    d.save(update_fields=['subtotal'])
+                    subtotal_general += d.subtotal
+                    deltas[d.producto_id] = deltas.get(d.producto_id, 0) - d.cantidad
+
+                # DESCONTAR STOCK: se vuelve a comprobar aquí, con lo reservado por otras sesiones
+                aplicar_deltas_stock(deltas, excluir_sesion=sesion)
+                marcar_ultimo_movimiento(salidas=deltas)
+                costeo.costear_nota(self.object)
+                self.object.subtotal = subtotal_general
+                self.object.total = subtotal_general - self.object.descuento
+                self.object.save(update_fields=['subtotal', 'total'])
+                # El stock ya quedó descontado: las reservas de la sesión para estos productos sobran
+                reservas.liberar(sesion, disponibles)
+                idempotencia.completar(envio, self.object, reverse('nota_entrega_detail', args=[self.object.pk]))
 
-                # DESCONTAR STOCK
-                d.producto.stock_actual -= d.cantidad
-                d.producto.save(update_fields=['stock_actual'])
-
-            self.object.subtotal = subtotal_general
-            self.object.total = subtotal_general - self.object.descuento
-            self.object.save(update_fields=['subtotal', 'total'])
+        try:
+            coordinador.ejecutar(guardar)
+        except StockInsuficiente as e:
+            self.object = None
+            messages.error(self.request, f'Stock insuficiente para {e}: otro usuario tomó esas unidades. Revisa las cantidades.')
+            return self.form_invalid(form)
 
         messages.success(self.request, '¡Nota de entrega creada exitosamente!')
         return redirect(self.success_url)
 
 
-class NotaEntregaUpdateView(LoginRequiredMixin, UpdateView):
+class NotaEntregaUpdateView(LoginRequiredMixin, ReintentosMixin, VersionUpdateMixin, UpdateView):
     model = NotaEntrega
     form_class = NotaEntregaForm
     template_name = 'notas_entrega/nota_entrega_form.html'
@@ -850,6 +1486,7 @@ class NotaEntregaUpdateView(LoginRequiredMixin, UpdateView):
         return context
 
     def form_valid(self, form):
+        from .inventario import aplicar_deltas_stock, marcar_ultimo_movimiento, StockInsuficiente
         context = self.get_context_data()
         detalles = context['detalles']
         if not detalles.is_valid():
@@ -861,7 +1498,12 @@ class NotaEntregaUpdateView(LoginRequiredMixin, UpdateView):
         for d in self.object.detalles.all():
             cantidades_previas[d.pk] = {'cantidad': d.cantidad, 'producto_id': d.producto_id}
 
-        # Validar stock para las nuevas cantidades
+        # Validar stock para las nuevas cantidades (sin contar lo reservado por otras sesiones)
+        sesion = reservas.sesion_de(self.request)
+        disponibles = reservas.disponibles(
+            {f.cleaned_data['producto'].pk for f in detalles if f.cleaned_data and not f.cleaned_data.get('DELETE', False)},
+            excluir_sesion=sesion,
+        )
         for detalle_form in detalles:
             if detalle_form.cleaned_data and not detalle_form.cleaned_data.get('DELETE', False):
                 producto = detalle_form.cleaned_data['producto']
@@ -872,7 +1514,7 @@ class NotaEntregaUpdateView(LoginRequiredMixin, UpdateView):
                 # Calcular stock disponible considerando devolución de la cantidad previa
                 detalle_pk = detalle_form.instance.pk
                 cantidad_previa = cantidades_previas.get(detalle_pk, {}).get('cantidad', 0)
-                stock_disponible = producto.stock_actual + cantidad_previa
+                stock_disponible = disponibles.get(producto.pk, producto.stock_actual) + cantidad_previa
 
                 if cantidad_nueva > stock_disponible:
                     messages.error(
@@ -891,57 +1533,223 @@ class NotaEntregaUpdateView(LoginRequiredMixin, UpdateView):
                     )
                     return self.form_invalid(form)
 
-        with transaction.atomic():
-            # Devolver stock de las líneas previas
-            for d in self.object.detalles.all():
-                d.producto.stock_actual += d.cantidad
-                d.producto.save(update_fields=['stock_actual'])
-
-            self.object = form.save()
-            detalles.instance = self.object
-            detalles.save()
-
-            # Recalcular subtotales y descontar stock nuevo
-            subtotal_general = 0
-            for d in self.object.detalles.all():
-                d.subtotal = d.cantidad * d.precio_unitario - d.descuento
-                d.save(update_fields=['subtotal'])
-                subtotal_general += d.subtotal
-
-                # Descontar stock actualizado
-                d.producto.refresh_from_db()
-                d.producto.stock_actual -= d.cantidad
-                d.producto.save(update_fields=['stock_actual'])
+        def guardar():
+            with transaction.atomic():
+                campos = concurrencia.reclamar_version(form)
+                asignar_numero(form.instance, 'numero_entrega', SERIE_NOTA)
+                # Devolver stock de las líneas previas
+                devueltas = {}
+                for d in self.object.detalles.all():
+                    devueltas[d.producto_id] = devueltas.get(d.producto_id, 0) + d.cantidad
+                aplicar_deltas_stock(devueltas)
+                costeo.devolver_nota(self.object)
+
+                if campos:
+                    form.instance.save(update_fields=campos)
+                self.object = form.instance
+                detalles.instance = self.object
+                detalles.save()
+
+                # Recalcular subtotales y descontar stock nuevo
+                subtotal_general = 0
+                deltas = {}
+                for d in self.object.detalles.all():
+                    d.subtotal = d.cantidad * d.precio_unitario - d.descuento
+                    d.save(update_fields=['subtotal'])
+                    subtotal_general += d.subtotal
+                    deltas[d.producto_id] = deltas.get(d.producto_id, 0) - d.cantidad
+
+                # Se vuelve a comprobar aquí, con lo reservado por otras sesiones
+                aplicar_deltas_stock(deltas, excluir_sesion=sesion)
+                marcar_ultimo_movimiento(salidas=deltas)
+                costeo.costear_nota(self.object)
+                self.object.subtotal = subtotal_general
+                self.object.total = subtotal_general - self.object.descuento
+                self.object.save(update_fields=['subtotal', 'total'])
 
-            self.object.subtotal = subtotal_general
-            self.object.total = subtotal_general - self.object.descuento
-            self.object.save(update_fields=['subtotal', 'total'])
+        try:
+            coordinador.ejecutar(guardar)
+        except StockInsuficiente as e:
+            messages.error(self.request, f'Stock insuficiente para {e}: otro usuario tomó esas unidades. Revisa las cantidades.')
+            return redirect(self.request.path)
 
         messages.success(self.request, '¡Nota de entrega actualizada!')
         return redirect(self.success_url)
 
 
-class NotaEntregaDeleteView(LoginRequiredMixin, AdminRequeridoMixin, DeleteView):
+class NotaEntregaDeleteView(LoginRequiredMixin, AdminRequeridoMixin, ReintentosMixin, DeleteView):
     model = NotaEntrega
     template_name = 'notas_entrega/nota_entrega_confirm_delete.html'
     success_url = reverse_lazy('nota_entrega_list')
 
-    def delete(self, request, *args, **kwargs):
-        nota = self.get_object()
-        # Devolver stock de todos los productos de esta nota antes de eliminar
-        with transaction.atomic():
-            for detalle in nota.detalles.all():
-                detalle.producto.stock_actual += detalle.cantidad
-                detalle.producto.save(update_fields=['stock_actual'])
-            nota.delete()
-        messages.success(request, '¡Nota de entrega eliminada y stock devuelto!')
+    def form_valid(self, form):
+        from .inventario import aplicar_deltas_stock, recalcular_ultimo_movimiento
+        nota = self.object
+
+        def guardar():
+            # Devolver stock de todos los productos de esta nota antes de eliminar
+            with transaction.atomic():
+                deltas = {}
+                for detalle in nota.detalles.all():
+                    deltas[detalle.producto_id] = deltas.get(detalle.producto_id, 0) + detalle.cantidad
+                aplicar_deltas_stock(deltas)
+                costeo.devolver_nota(nota)
+                nota.delete()
+                # La nota anulada sale del historial: la última salida vuelve a la anterior
+                recalcular_ultimo_movimiento(deltas)
+
+        coordinador.ejecutar(guardar)
+        messages.success(self.request, '¡Nota de entrega eliminada y stock devuelto!')
         return redirect(self.success_url)
 
 
+@login_required
+async def reserva_stock_ajax(request):
+    """Reserva (o libera con cantidad 0) unidades de un producto para la nota que se está preparando."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+    try:
+        producto_id = int(request.POST.get('producto', ''))
+        cantidad = max(int(request.POST.get('cantidad', 0) or 0), 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Datos inválidos'}, status=400)
+    try:
+        vence = await sync_to_async(ejecutar_con_reintentos)(reservas.reservar, request, producto_id, cantidad)
+    except BaseDatosOcupada:
+        return JsonResponse({'success': False, 'error': 'El sistema está ocupado; intenta de nuevo.'}, status=503)
+    except reservas.StockNoDisponible as e:
+        return JsonResponse({'success': False, 'error': f'Solo hay {e.disponible} unidades disponibles.',
+                             'disponible': e.disponible})
+    sesion = await sync_to_async(reservas.sesion_de)(request)
+    disponible = (await sync_to_async(reservas.disponibles)([producto_id], excluir_sesion=sesion)).get(producto_id, 0)
+    return JsonResponse({
+        'success': True, 'reservado': cantidad, 'disponible': disponible,
+        'vence': timezone.localtime(vence).strftime('%H:%M') if vence else None,
+    })
+
+
+# ==================== TASAS DE CAMBIO ====================
+
+@login_required
+def tasas_cambio_view(request):
+    """Tasas de cambio diarias (Bs/$): listado y registro; registrar un día existente lo reemplaza (solo admin)"""
+    from django.core.paginator import Paginator
+    from django.utils.dateparse import parse_date
+    from .moneda import tasa_en
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    form = None
+    if es_admin:
+        existente = None
+        if request.method == 'POST':
+            fecha = parse_date(request.POST.get('fecha') or '')
+            existente = TasaCambio.objects.filter(fecha=fecha).first() if fecha else None
+        form = TasaCambioForm(request.POST or None, instance=existente, initial={'fecha': timezone.localdate()})
+        if request.method == 'POST' and form.is_valid():
+            tasa = form.save(commit=False)
+            tasa.empleado = _perfil_empleado(request.user)
+            tasa.save()
+            messages.success(request, f'¡Tasa del {tasa.fecha:%d/%m/%Y} registrada: Bs {tasa.tasa}!')
+            return redirect('tasas_cambio')
+    elif request.method == 'POST':
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('tasas_cambio')
+
+    page_obj = Paginator(TasaCambio.objects.select_related('empleado__user'), 30).get_page(request.GET.get('page'))
+    return render(request, 'tasas/tasas_cambio.html', {
+        'form': form,
+        'page_obj': page_obj,
+        'tasa_hoy': tasa_en(),
+    })
+
+
+# ==================== MÉTRICAS ====================
+
+@login_required
+async def metricas_escritura_view(request):
+    """Reintentos por BD bloqueada acumulados en este proceso (solo admin, JSON)"""
+    from .escritura import metricas
+
+    user = await request.auser()
+    try:
+        es_admin = (await PerfilEmpleado.objects.aget(user=user)).rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = user.is_superuser
+
+    if not es_admin:
+        return JsonResponse({'success': False, 'error': 'No tienes permisos de administrador.'}, status=403)
+    return JsonResponse({'success': True, 'metricas': metricas()})
+
+
+# ==================== IMPORTACIÓN ====================
+
+@login_required
+def importar_catalogo_view(request):
+    """Carga masiva de productos, clientes o proveedores desde CSV/XLSX (solo admin)"""
+    from .importacion import IMPORTADORES, importar_catalogo
+    from .bitacora import registrar_en_bitacora, ACCION_IMPORTAR
+
+    try:
+        es_admin = request.user.perfil.rol == 'admin'
+    except PerfilEmpleado.DoesNotExist:
+        es_admin = request.user.is_superuser
+
+    if not es_admin:
+        messages.error(request, 'No tienes permisos de administrador.')
+        return redirect('dashboard')
+
+    resultado = None
+    form = ImportarCatalogoForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        catalogo = form.cleaned_data['catalogo']
+        archivo = form.cleaned_data['archivo']
+        resultado = importar_catalogo(
+            catalogo, archivo, archivo.name,
+            actualizar=form.cleaned_data['actualizar'],
+            crear_marcas=form.cleaned_data['crear_marcas'],
+        )
+        registrar_en_bitacora(
+            request.user, IMPORTADORES[catalogo].modelo._meta.object_name, ACCION_IMPORTAR, 0,
+            f'{resultado.creados} creados, {resultado.actualizados} actualizados, '
+            f'{len(resultado.errores)} errores ({archivo.name})',
+        )
+        # El reporte completo se descarga aparte; se limita para no inflar la sesión
+        request.session['importacion_errores'] = resultado.errores[:20000]
+        if resultado.errores:
+            messages.warning(request, f'Importación con {len(resultado.errores)} filas rechazadas.')
+        else:
+            messages.success(request, '¡Importación completada sin errores!')
+
+    return render(request, 'importacion/importar_catalogo.html', {
+        'form': form,
+        'resultado': resultado,
+        'errores': resultado.errores[:200] if resultado else [],
+    })
+
+
+@login_required
+def importar_errores_view(request):
+    """Descarga en CSV el reporte de errores de la última importación"""
+    import csv
+    from django.http import HttpResponse
+
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="errores_importacion.csv"'
+    escritor = csv.writer(response)
+    escritor.writerow(['fila', 'error'])
+    escritor.writerows(request.session.get('importacion_errores', []))
+    return response
+
+
 # ==================== REPORTES ====================
 
 @login_required
-def reporte_inventario_view(request):
+@lee_de_replica
+async def reporte_inventario_view(request):
     """Reporte imprimible de inventario actual"""
     from django.db.models import F, Sum, ExpressionWrapper, DecimalField
 
@@ -961,34 +1769,138 @@ def reporte_inventario_view(request):
     elif filtro_estado == 'normal':
         productos = productos.filter(stock_actual__gte=F('stock_minimo'), stock_actual__lt=F('stock_maximo'))
 
-    # Calcular valor total del inventario
-    valor_total = productos.aggregate(
-        total=Sum(
-            ExpressionWrapper(
-                F('stock_actual') * F('precio'),
-                output_field=DecimalField()
-            )
-        )
-    )['total'] or 0
+    # Filtro por clase ABC (comando clasificar_abc)
+    filtro_abc_ventas = request.GET.get('abc_ventas', '')
+    if filtro_abc_ventas in ('A', 'B', 'C'):
+        productos = productos.filter(clase_abc_ventas=filtro_abc_ventas)
+    filtro_abc_inventario = request.GET.get('abc_inventario', '')
+    if filtro_abc_inventario in ('A', 'B', 'C'):
+        productos = productos.filter(clase_abc_inventario=filtro_abc_inventario)
 
-    total_unidades = productos.aggregate(total=Sum('stock_actual'))['total'] or 0
+    productos = productos.annotate(
+        valor_stock=ExpressionWrapper(F('stock_actual') * F('precio'), output_field=DecimalField())
+    )
 
-    marcas = Marca.objects.filter(estado=True).order_by('nombre_marca')
+    # Orden: por marca (por defecto), por clase ABC o por valor en stock
+    orden = request.GET.get('orden', '')
+    if orden == 'abc_ventas':
+        productos = productos.order_by('clase_abc_ventas', '-valor_stock', 'nombre')
+    elif orden == 'abc_inventario':
+        productos = productos.order_by('clase_abc_inventario', '-valor_stock', 'nombre')
+    elif orden == 'valor':
+        productos = productos.order_by('-valor_stock', 'nombre')
+
+    # Valor total a precio de venta y a costo (método de settings.COSTEO_METODO), en una consulta
+    productos = productos.annotate(valor_costo=costeo.valor_costo())
+    consultas = await en_paralelo(
+        productos=lambda: list(productos),
+        totales=lambda: productos.aggregate(valor=Sum('valor_stock'), costo=Sum('valor_costo'), unidades=Sum('stock_actual')),
+        marcas=lambda: list(Marca.objects.filter(estado=True).order_by('nombre_marca')),
+    )
+    totales = consultas['totales']
+    valor_total = totales['valor'] or 0
+    costo_total = totales['costo'] or 0
+    total_unidades = totales['unidades'] or 0
 
     context = {
-        'productos': productos,
-        'marcas': marcas,
+        'productos': consultas['productos'],
+        'marcas': consultas['marcas'],
         'filtro_marca': filtro_marca,
         'filtro_estado': filtro_estado,
-        'total_productos': productos.count(),
+        'filtro_abc_ventas': filtro_abc_ventas,
+        'filtro_abc_inventario': filtro_abc_inventario,
+        'orden': orden,
+        'clases_abc': ('A', 'B', 'C'),
+        'total_productos': len(consultas['productos']),
         'total_unidades': total_unidades,
         'valor_total': valor_total,
+        'costo_total': costo_total,
+        'metodo_costeo': 'FIFO' if costeo.metodo() == costeo.METODO_FIFO else 'Promedio ponderado',
+    }
+    return await renderizar(request, 'reportes/reporte_inventario.html', context)
+
+
+@login_required
+@lee_de_replica
+async def reporte_stock_inmovil_view(request):
+    """Productos con stock y sin salidas (o sin movimientos) en los últimos N días, con antigüedad"""
+    from datetime import timedelta
+    from django.core.paginator import Paginator
+    from django.db.models import Sum, ExpressionWrapper, DecimalField
+
+    try:
+        dias = max(int(request.GET.get('dias', 90)), 1)
+    except ValueError:
+        dias = 90
+    criterio = request.GET.get('criterio', 'salida')
+    filtro_marca = request.GET.get('marca', '')
+
+    ahora = timezone.now()
+    corte = ahora - timedelta(days=dias)
+    valor = ExpressionWrapper(F('stock_actual') * F('precio'), output_field=DecimalField())
+    con_stock = Producto.objects.filter(estado=True, stock_actual__gt=0)
+    if filtro_marca:
+        con_stock = con_stock.filter(marca__id=filtro_marca)
+
+    # Los productos que nunca se movieron cuentan desde su fecha de registro
+    sin_salida = Q(ultima_salida__lt=corte) | Q(ultima_salida__isnull=True, fecha_registro__lt=corte)
+    if criterio == 'cualquiera':
+        sin_entrada = Q(ultima_entrada__lt=corte) | Q(ultima_entrada__isnull=True, fecha_registro__lt=corte)
+        inmoviles = con_stock.filter(sin_salida & sin_entrada)
+    else:
+        criterio = 'salida'
+        inmoviles = con_stock.filter(sin_salida)
+    inmoviles = inmoviles.select_related('marca').annotate(valor_stock=valor).order_by(
+        F('ultima_salida').asc(nulls_first=True), 'nombre'
+    )
+
+    # Antigüedad de la última salida: rangos sobre el índice de ultima_salida, en una sola consulta
+    rangos = [('0-30 días', 0, 30), ('31-90 días', 30, 90), ('91-180 días', 90, 180), ('181-365 días', 180, 365), ('Más de 1 año', 365, None)]
+    agregados = {}
+    for i, (_, desde, hasta) in enumerate(rangos):
+        condicion = Q(ultima_salida__lte=ahora - timedelta(days=desde))
+        if hasta is not None:
+            condicion &= Q(ultima_salida__gt=ahora - timedelta(days=hasta))
+        agregados[f'n{i}'] = Count('pk', filter=condicion)
+        agregados[f'v{i}'] = Sum(valor, filter=condicion)
+    agregados['n_nunca'] = Count('pk', filter=Q(ultima_salida__isnull=True))
+    agregados['v_nunca'] = Sum(valor, filter=Q(ultima_salida__isnull=True))
+
+    def pagina():
+        page_obj = Paginator(inmoviles, 50).get_page(request.GET.get('page'))
+        page_obj.object_list = list(page_obj.object_list)
+        return page_obj
+
+    consultas = await en_paralelo(
+        page_obj=pagina,
+        totales=lambda: inmoviles.aggregate(valor=Sum('valor_stock'), unidades=Sum('stock_actual')),
+        antiguedad=lambda: con_stock.aggregate(**agregados),
+        marcas=lambda: list(Marca.objects.filter(estado=True).order_by('nombre_marca')),
+    )
+    page_obj, totales, antiguedad = consultas['page_obj'], consultas['totales'], consultas['antiguedad']
+    tramos = [
+        {'etiqueta': etiqueta, 'productos': antiguedad[f'n{i}'], 'valor': antiguedad[f'v{i}'] or 0}
+        for i, (etiqueta, _, _) in enumerate(rangos)
+    ] + [{'etiqueta': 'Sin salidas', 'productos': antiguedad['n_nunca'], 'valor': antiguedad['v_nunca'] or 0}]
+
+    context = {
+        'page_obj': page_obj,
+        'productos': page_obj.object_list,
+        'tramos': tramos,
+        'dias': dias,
+        'criterio': criterio,
+        'filtro_marca': filtro_marca,
+        'marcas': consultas['marcas'],
+        'total_productos': page_obj.paginator.count,
+        'total_unidades': totales['unidades'] or 0,
+        'valor_total': totales['valor'] or 0,
     }
-    return render(request, 'reportes/reporte_inventario.html', context)
+    return await renderizar(request, 'reportes/reporte_stock_inmovil.html', context)
 
 
 @login_required
-def reporte_movimientos_view(request):
+@lee_de_replica
+async def reporte_movimientos_view(request):
     """Reporte de movimientos de inventario por rango de fecha"""
     from django.db.models import Sum
     from datetime import date, timedelta
@@ -1019,30 +1931,37 @@ def reporte_movimientos_view(request):
     # Calcular totales
     entradas = movimientos.filter(tipo_inventario__direccion='ENTRADA')
     salidas = movimientos.filter(tipo_inventario__direccion='SALIDA')
-    total_entradas = entradas.aggregate(t=Sum('cantidad'))['t'] or 0
-    total_salidas = salidas.aggregate(t=Sum('cantidad'))['t'] or 0
-
-    productos = Producto.objects.filter(estado=True).order_by('nombre')
+    consultas = await en_paralelo(
+        movimientos=lambda: list(movimientos[:200]),  # Limitar para rendimiento
+        total_movimientos=movimientos.count,
+        total_entradas=lambda: entradas.aggregate(t=Sum('cantidad'))['t'] or 0,
+        total_salidas=lambda: salidas.aggregate(t=Sum('cantidad'))['t'] or 0,
+        productos=lambda: list(Producto.objects.filter(estado=True).order_by('nombre')),
+    )
+    total_entradas = consultas['total_entradas']
+    total_salidas = consultas['total_salidas']
 
     context = {
-        'movimientos': movimientos[:200],  # Limitar para rendimiento
-        'productos': productos,
+        'movimientos': consultas['movimientos'],
+        'productos': consultas['productos'],
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
         'filtro_direccion': filtro_direccion,
         'filtro_producto': filtro_producto,
-        'total_movimientos': movimientos.count(),
+        'total_movimientos': consultas['total_movimientos'],
         'total_entradas': total_entradas,
         'total_salidas': total_salidas,
         'balance_neto': total_entradas - total_salidas,
     }
-    return render(request, 'reportes/reporte_movimientos.html', context)
+    return await renderizar(request, 'reportes/reporte_movimientos.html', context)
 
 
 @login_required
-def reporte_ventas_view(request):
+@lee_de_replica
+async def reporte_ventas_view(request):
     """Reporte de ventas (notas de entrega) por periodo"""
-    from django.db.models import Sum, Count
+    from django.db.models import Sum, Count, ExpressionWrapper, DecimalField
+    from .moneda import anotar_bs
     from datetime import date
 
     notas = NotaEntrega.objects.select_related('cliente').prefetch_related('detalles__producto').order_by('-fecha_registro')
@@ -1061,24 +1980,40 @@ def reporte_ventas_view(request):
     if filtro_cliente:
         notas = notas.filter(cliente__id=filtro_cliente)
 
-    # Totales
-    totales = notas.aggregate(
-        subtotal_total=Sum('subtotal'),
-        descuento_total=Sum('descuento'),
-        total_total=Sum('total'),
+    # Totales (los montos en Bs se convierten en la BD con la tasa del día de cada nota)
+    notas = anotar_bs(notas, ['total'])
+    consultas = await en_paralelo(
+        notas=lambda: list(notas[:200]),
+        total_notas=notas.count,
+        totales=lambda: notas.aggregate(
+            subtotal_total=Sum('subtotal'),
+            descuento_total=Sum('descuento'),
+            total_total=Sum('total'),
+            total_bs=Sum('total_bs'),
+            sin_tasa=Count('pk', filter=Q(tasa_bs__isnull=True)),
+        ),
+        # Costo de lo vendido: costo unitario guardado en cada línea al despachar
+        costo_ventas=lambda: DetalleNotaEntrega.objects.filter(nota_entrega__in=notas.order_by().values('pk')).aggregate(
+            total=Sum(ExpressionWrapper(F('cantidad') * F('costo_unitario'), output_field=DecimalField()))
+        )['total'] or 0,
+        clientes=lambda: list(Cliente.objects.order_by('nombre')),
     )
-
-    clientes = Cliente.objects.order_by('nombre')
+    totales, costo_ventas = consultas['totales'], consultas['costo_ventas']
+    margen = (totales['total_total'] or 0) - costo_ventas
 
     context = {
-        'notas': notas[:200],
-        'clientes': clientes,
+        'notas': consultas['notas'],
+        'clientes': consultas['clientes'],
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
         'filtro_cliente': filtro_cliente,
-        'total_notas': notas.count(),
+        'total_notas': consultas['total_notas'],
         'subtotal_total': totales['subtotal_total'] or 0,
         'descuento_total': totales['descuento_total'] or 0,
         'total_total': totales['total_total'] or 0,
+        'total_bs': totales['total_bs'] or 0,
+        'notas_sin_tasa': totales['sin_tasa'],
+        'costo_ventas': costo_ventas,
+        'margen': margen,
     }
-    return render(request, 'reportes/reporte_ventas.html', context)
+    return await renderizar(request, 'reportes/reporte_ventas.html', context)